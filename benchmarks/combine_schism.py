@@ -0,0 +1,69 @@
+"""
+Benchmark of the SCHISM output combine (schism.results) on a synthetic decomposed run.
+
+Compares the per timestep mode (combine_mode='step') with the single pass mode
+(combine_mode='block'), reports the number of file opens and the wall time and
+checks that the combined files are identical.
+
+usage : python benchmarks/combine_schism.py [nranks] [nx] [ny] [ntimes]
+"""
+import os
+import sys
+import time
+import tempfile
+import shutil
+import glob
+import importlib
+import xarray as xr
+
+from pyPoseidon.tests.meshes import write_local_to_global, write_schout, write_vgrid
+
+schism = importlib.import_module('pyPoseidon.schism').schism
+
+
+def opens_counter():
+    # count the calls to xr.open_dataset
+    count = [0]
+    open_dataset = xr.open_dataset
+
+    def counted(*args, **kwargs):
+        count[0] += 1
+        return open_dataset(*args, **kwargs)
+
+    xr.open_dataset = counted
+    return count
+
+
+def run(path, mode):
+    for f in glob.glob(path + 'outputs/schout_?.nc'):
+        os.remove(f)
+    m = schism.__new__(schism)
+    m.misc = {}
+    m.global2local(rpath=path) # index references are not part of the timing
+    count = opens_counter()
+    t0 = time.time()
+    m.results(rpath=path, combine_mode=mode, cache_dir=path)
+    elapsed = time.time() - t0
+    xr.open_dataset = open_dataset
+    return elapsed, count[0], xr.open_dataset(path + 'outputs/schout_1.nc').load()
+
+
+if __name__ == '__main__':
+
+    nranks, nx, ny, ntimes = [int(x) for x in sys.argv[1:5]] if len(sys.argv) > 4 else [16, 60, 50, 24]
+
+    open_dataset = xr.open_dataset
+    path = tempfile.mkdtemp() + '/'
+    ref = write_local_to_global(path, nranks=nranks, nx=nx, ny=ny)
+    write_schout(path, ref, stack=1, ntimes=ntimes)
+    write_vgrid(path)
+
+    print('{} ranks, {} nodes, {} timesteps'.format(nranks, nx * ny, ntimes))
+    results = {}
+    for mode in ['step', 'block']:
+        elapsed, opens, results[mode] = run(path, mode)
+        print('{:6s} : {:8.2f} s, {:6d} file opens'.format(mode, elapsed, opens))
+
+    print('identical output : {}'.format(results['step'].identical(results['block'])))
+
+    shutil.rmtree(path)
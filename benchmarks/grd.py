@@ -0,0 +1,125 @@
+"""
+Benchmark of the Delft3D grid I/O (grid.r2d.read_file / r2d.to_file) on synthetic curvilinear grids.
+
+Compares the reader and writer with the previous pandas / row by row ones (legacy_read,
+legacy_write below), reports wall time and throughput and checks that the files are byte
+identical. The grids read back are compared with the written arrays: the pandas python
+engine parser is not exact to the last bit, the new reader is. The legacy functions are skipped above legacy_max cells.
+
+usage : python benchmarks/grd.py [sizes] [legacy_max]
+        e.g. python benchmarks/grd.py 10000,100000,1000000,10000000 1000000
+"""
+import os
+import sys
+import time
+import tempfile
+import shutil
+import filecmp
+import numpy as np
+import pandas as pd
+import warnings
+import logging
+import xarray as xr
+
+import pyPoseidon.grid as pgrid
+from pyPoseidon.tests.meshes import curvilinear
+
+
+# previous reader, kept for reference
+def legacy_read(filename):
+
+    header=pd.read_csv(filename,nrows=3,header=None,comment='*')
+    cs = header.loc[0,0].split('=')[1].strip()
+    ni,nj = header.loc[1,0].split(' ')
+    ni,nj = int(ni),int(nj)
+    alfori, xori, yori = header.loc[2,0].split(' ')
+
+    d = pd.read_csv(filename,header=2,comment='*',delim_whitespace=True,engine='python',na_values='ETA=')
+    d = d.reset_index()
+    data = d.values[~np.isnan(d.values)]
+    data=np.array(data)
+    data = data.reshape(2,nj,ni+1) # including the row index
+    #clean up the row index
+    data = data[:,:,1:]
+
+    lons=data[0,:,:]
+    lats=data[1,:,:]
+
+    g = xr.Dataset({'lons': (['y', 'x'], lons),
+                    'lats': (['y', 'x'], lats)},
+                     coords={'x': ('x', lons[0,:]),
+                             'y': ('y', lats[:,0])})
+
+    g.attrs = {'Coordinate System': cs, 'alfori': alfori, 'xori': xori, 'yori': yori}
+
+    return g
+
+
+# previous writer, kept for reference
+def legacy_write(self, filename):
+
+    with open(filename,'w') as f:
+        f.write('Coordinate System= {}\n'.format(self.Dataset.attrs['Coordinate System']))
+        f.write('{} {}\n'.format(self.Dataset.lons.shape[1],self.Dataset.lons.shape[0]))
+        f.write('{} {} {}\n'.format(self.Dataset.attrs['xori'],self.Dataset.attrs['yori'],self.Dataset.attrs['alfori']))
+        for i in range(self.Dataset.lons.shape[0]):
+            f.write('ETA=  {} '.format(i+1))
+            f.write(' '.join(map(str, self.Dataset.lons[i,:].values)))
+            f.write('\n')
+        for i in range(self.Dataset.lats.shape[0]):
+            f.write('ETA=  {} '.format(i+1))
+            f.write(' '.join(map(str, self.Dataset.lats[i,:].values)))
+            f.write('\n')
+
+
+def run(path, cells, legacy_max):
+    n = int(np.sqrt(cells))
+    lons, lats = curvilinear(n, n)
+
+    g = pgrid.grid(type='r2d', lon_min=0., lon_max=1., lat_min=0., lat_max=1., resolution=0.5)
+    g.Dataset = xr.Dataset({'lons': (['y', 'x'], lons), 'lats': (['y', 'x'], lats)},
+                           coords={'x': ('x', lons[0,:]), 'y': ('y', lats[:,0])}, attrs=g.Dataset.attrs)
+
+    new = os.path.join(path, 'new.grd')
+    t0 = time.time()
+    g.to_file(new)
+    twrite = time.time() - t0
+    size = os.path.getsize(new) / 2**20
+
+    t0 = time.time()
+    r = pgrid.r2d.read_file(new)
+    tread = time.time() - t0
+
+    line = '{:>10d} cells {:8.1f} MB | to_file {:7.2f} s read_file {:7.2f} s exact {}'.format(n * n, size, twrite, tread,
+                np.array_equal(r.lons.values, lons) and np.array_equal(r.lats.values, lats))
+
+    if n * n <= legacy_max:
+        old = os.path.join(path, 'old.grd')
+        t0 = time.time()
+        legacy_write(g, old)
+        twold = time.time() - t0
+        t0 = time.time()
+        rold = legacy_read(old)
+        trold = time.time() - t0
+        err = max(np.abs(rold.lons.values - lons).max(), np.abs(rold.lats.values - lats).max())
+        line += ' | legacy {:7.2f} s {:7.2f} s (max error {:.1e}) | x{:.1f} x{:.1f} identical files {}'.format(twold, trold, err,
+                     twold / twrite, trold / tread, filecmp.cmp(new, old, shallow=False))
+
+    for f in os.listdir(path):
+        os.remove(os.path.join(path, f))
+    print(line)
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1].split(',')] if len(sys.argv) > 1 else [10000, 100000, 1000000, 10000000]
+    legacy_max = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+
+    warnings.simplefilter('ignore', FutureWarning) # legacy reader
+    logging.getLogger('pyPoseidon').setLevel(logging.WARNING)
+
+    path = tempfile.mkdtemp()
+    try:
+        for cells in sizes:
+            run(path, cells, legacy_max)
+    finally:
+        shutil.rmtree(path)
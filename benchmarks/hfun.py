@@ -0,0 +1,86 @@
+"""
+Benchmark of the mesh size function (utils.hfun.hfun) on synthetic DEMs of increasing size.
+
+The raster method (gradient limited on the lattice) is compared with the triangulation of the
+DEM points, which is skipped above tri_max cells. The JIGSAW hfun file is written with the
+raster method. The tiled generator (utils.hfun.tiled) is run on the DEM written to netCDF, with
+ncores processes, and checked against the raster method. The raster method is also timed with
+the coastline distance (synthetic islands) and slope sizing criteria.
+
+usage : python benchmarks/hfun.py [cells] [tri_max] [ncores]
+        e.g. python benchmarks/hfun.py 100000,1000000,10000000 1000000 4
+"""
+import os
+import sys
+import time
+import tempfile
+import shutil
+import types
+import numpy as np
+import xarray as xr
+import geopandas as gp
+import shapely.geometry
+
+import pyPoseidon.utils.hfun as phfun
+
+
+def synthetic_dem(n):
+    lon = np.linspace(-30., -10., n)
+    lat = np.linspace(70., 60., n) # descending as in most sources
+    rng = np.random.default_rng(0)
+    z = -4000. * np.sin(np.radians(lat[:, None] * 7.)) ** 2 * np.cos(np.radians(lon[None, :] * 5.)) ** 2
+    z += rng.normal(0., 50., z.shape) + 200.
+    ds = xr.Dataset({'elevation' : (['latitude', 'longitude'], z)}, coords={'longitude' : lon, 'latitude' : lat})
+    return types.SimpleNamespace(Dataset=ds)
+
+
+def islands(n=200):
+    # small polygons with 20 vertices scattered over the dem
+    rng = np.random.default_rng(1)
+    t = np.linspace(0., 2 * np.pi, 21)[:-1]
+    return gp.GeoDataFrame({'geometry' : [shapely.geometry.Polygon(np.column_stack([x + r * np.cos(t), y + r * np.sin(t)]))
+                            for x, y, r in zip(rng.uniform(-30., -10., n), rng.uniform(60., 70., n), rng.uniform(.05, .3, n))]})
+
+
+def run(path, cells, tri_max, ncores):
+    n = int(np.sqrt(cells))
+    dem = synthetic_dem(n)
+
+    t0 = time.time()
+    dr = phfun.hfun(dem, method='raster', to_msh=True, path=path, tag='bench')
+    tnew = time.time() - t0
+    size = os.path.getsize(path + '/bench-hfun.msh') / 2**20
+
+    line = '{:>10d} cells | raster {:7.2f} s ({:6.1f} MB hfun.msh)'.format(n * n, tnew, size)
+
+    if n * n <= tri_max:
+        t0 = time.time()
+        dt = phfun.hfun(dem)
+        told = time.time() - t0
+        line += ' | triangulation {:7.2f} s | x{:.1f} max diff {:.3f}'.format(told, told / tnew, np.abs(dt.z.values - dr.z.values).max())
+
+    t0 = time.time()
+    phfun.hfun(dem, method='raster', coastlines=islands(), slope_ratio=10.)
+    line += ' | criteria {:7.2f} s'.format(time.time() - t0)
+
+    source = path + '/dem.nc'
+    dem.Dataset.to_netcdf(source)
+    t0 = time.time()
+    dh = phfun.tiled(source, path + '/hfun.zarr', tile=1024, ncores=ncores)
+    ttile = time.time() - t0
+    line += ' | tiled {:7.2f} s same {}'.format(ttile, np.allclose(dh.z.values, dr.z.values, rtol=0, atol=1e-12))
+
+    print(line)
+
+
+if __name__ == '__main__':
+    cells = [int(x) for x in sys.argv[1].split(',')] if len(sys.argv) > 1 else [100000, 1000000, 10000000]
+    tri_max = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+    ncores = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    path = tempfile.mkdtemp()
+    try:
+        for n in cells:
+            run(path, n, tri_max, ncores)
+    finally:
+        shutil.rmtree(path)
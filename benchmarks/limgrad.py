@@ -0,0 +1,49 @@
+"""
+Benchmark of the gradient limiting of the mesh size function (limgrad.limgrad) on regular
+triangulations of increasing size with random size functions.
+
+The vectorized version is compared with the previous node by node loop (meshes.legacy_limgrad2),
+which is skipped above legacy_max nodes. The diagnostics (nodes limited and edges visited)
+are printed for every size.
+
+usage : python benchmarks/limgrad.py [nodes] [dfdx] [legacy_max]
+        e.g. python benchmarks/limgrad.py 10000,100000,1000000 0.1 100000
+"""
+import sys
+import time
+import numpy as np
+
+import pyPoseidon.limgrad as plimgrad
+from pyPoseidon.tests.meshes import mesh, legacy_limgrad2
+
+
+def run(nodes, dfdx, legacy_max):
+    n = int(np.sqrt(nodes))
+    x, y, depth, faces = mesh(n, n)
+    edges = np.unique(np.sort(np.vstack([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]), axis=1), axis=0)
+    elen = np.hypot(x[edges[:, 1]] - x[edges[:, 0]], y[edges[:, 1]] - y[edges[:, 0]])
+    ffun = np.random.default_rng(0).uniform(.5, 2., x.size) * elen.mean()
+
+    t0 = time.time()
+    rfun, flag, stats = plimgrad.limgrad(edges, elen, ffun, dfdx, imax=1000)
+    tnew = time.time() - t0
+
+    line = '{:>9d} nodes {:>9d} edges | limgrad {:7.3f} s converged {}'.format(x.size, edges.shape[0], tnew, flag)
+
+    if x.size <= legacy_max:
+        t0 = time.time()
+        old, oflag = legacy_limgrad2(edges, elen, ffun.reshape(-1, 1), dfdx, 1000)
+        told = time.time() - t0
+        line += ' | legacy {:7.2f} s | x{:.1f} max diff {:.2e}'.format(told, told / tnew, np.abs(old.ravel() - rfun).max())
+
+    print(line)
+    print('    nodes limited {} edges visited {}'.format(stats['active'], stats['edges']))
+
+
+if __name__ == '__main__':
+    nodes = [int(x) for x in sys.argv[1].split(',')] if len(sys.argv) > 1 else [10000, 100000, 1000000]
+    dfdx = float(sys.argv[2]) if len(sys.argv) > 2 else .1
+    legacy_max = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+
+    for n in nodes:
+        run(n, dfdx, legacy_max)
@@ -0,0 +1,148 @@
+"""
+Benchmark of the JIGSAW msh I/O (jigsaw.geo and jigsaw.read_msh) on synthetic GSHHS-like inputs.
+
+geo is timed on boundaries made of many small islands (lines) and compared with the previous
+per line DataFrame version (legacy_geo below), read_msh on meshes of increasing size with the
+previous string DataFrame reader (legacy_read_msh). The files written are checked to be byte
+identical. The legacy functions are skipped above legacy_max lines / points.
+
+usage : python benchmarks/msh.py [lines] [points] [legacy_max]
+        e.g. python benchmarks/msh.py 1000,10000,100000 10000,100000,1000000,5000000 2000
+"""
+import os
+import sys
+import time
+import tempfile
+import shutil
+import warnings
+import numpy as np
+import pandas as pd
+
+import pyPoseidon.jigsaw as pjig
+import pyPoseidon.utils.msh as msh
+from pyPoseidon.tests.meshes import mesh, coastlines
+
+
+# previous writer, kept for reference
+def legacy_geo(df, path='.', tag='jigsaw'):
+    
+    fgeo = path + tag+'-geo.msh'
+    # write header
+    with open(fgeo,'w') as f:
+        f.write('#{}; created by pyPoseidon\n'.format(tag +'-geo.msh'))
+        f.write('MSHID=2;EUCLIDEAN-MESH\n')
+        f.write('NDIMS=2\n')
+        f.write('POINT={}\n'.format(df.shape[0]))
+    
+    #write lines
+    with open(fgeo, 'a') as f:
+        for line in df.index.levels[0]:
+            df.loc[line].to_csv(f, index=False, header=0, columns=['lon','lat','z'],sep=';')
+
+
+    edges = pd.DataFrame([]) # initiate
+
+    # create edges
+    for line in df.index.levels[0]:
+        i0 = edges.shape[0]
+        ie = df.loc[line].shape[0] + edges.shape[0]
+        dline = df.loc[line].copy()
+        dline.index = range(i0,ie)
+        dline.loc[:,'ie'] = dline.index.values + 1
+        dline.loc[dline.index[-1],'ie']=i0
+        dout = dline.reset_index().loc[:,['index','ie','tag']]
+
+        dout['tag1'] = dline.loc[dline.ie.values,'tag'].values.astype(int)
+        dout['que'] = np.where(((dout['tag'] != dout['tag1']) & (dout['tag'] > 0)) , dout['tag1'], dout['tag'])    
+        dout = dout.reset_index().loc[:,['index','ie','que']]
+        edges = edges.append(dout)        
+        
+    # write header
+    with open(fgeo,'a') as f:
+        f.write('EDGE2={}\n'.format(edges.shape[0]))
+    
+    with open(fgeo, 'a') as f:
+        edges.to_csv(f, index=False, header=0, sep=';')
+        
+
+
+# previous reader, kept for reference
+def legacy_read_msh(fmsh):
+    
+    grid = pd.read_csv(fmsh, header=0, names=['data'], index_col=None, low_memory=False)
+    npoints = int(grid.loc[2].str.split('=')[0][1])
+
+    nodes = pd.DataFrame(grid.loc[3: 3 + npoints - 1,'data'].str.split(';').values.tolist(),columns=['lon','lat','z'])
+
+    ie = grid[grid.data.str.contains('EDGE')].index.values[0]
+    nedges = int(grid.loc[ie].str.split('=')[0][1])
+    edges = pd.DataFrame(grid.loc[ie + 1 :ie  + nedges ,'data'].str.split(';').values.tolist(),columns=['e1','e2','e3'])
+
+    i3 = grid[grid.data.str.contains('TRIA')].index.values[0]
+    ntria = int(grid.loc[i3].str.split('=')[0][1])
+    tria = pd.DataFrame(grid.loc[i3 + 1 : i3 + ntria + 1 ,'data'].str.split(';').values.tolist(),columns=['a','b','c','d'])
+
+    return [nodes,edges,tria]
+
+
+def run_geo(path, nlines, legacy_max):
+    df = coastlines(nlines, 10)
+
+    t0 = time.time()
+    pjig.geo(df, path=path, tag='new')
+    tnew = time.time() - t0
+
+    line = '{:>8d} lines {:>9d} points | geo {:7.2f} s'.format(nlines, df.shape[0], tnew)
+
+    if nlines <= legacy_max:
+        t0 = time.time()
+        legacy_geo(df, path=path, tag='old')
+        told = time.time() - t0
+        with open(path + 'new-geo.msh') as f : a = f.readlines()[1:]
+        with open(path + 'old-geo.msh') as f : b = f.readlines()[1:]
+        line += ' | legacy {:7.2f} s | x{:.1f} identical {}'.format(told, told / tnew, a == b)
+
+    print(line)
+
+
+def run_read(path, points, legacy_max):
+    n = int(np.sqrt(points))
+    x, y, depth, faces = mesh(n, n)
+    filename = path + 'mesh.msh'
+    ne = faces.shape[0]
+    msh.write(filename, {'POINT' : [x, y, np.zeros(x.size, dtype=int)],
+                         'EDGE2' : [faces[:, 0], faces[:, 1], -np.ones(ne, dtype=int)],
+                         'TRIA3' : [faces[:, 0], faces[:, 1], faces[:, 2], np.zeros(ne, dtype=int)]})
+    size = os.path.getsize(filename) / 2**20
+
+    t0 = time.time()
+    nodes, edges, tria = pjig.read_msh(filename)
+    tnew = time.time() - t0
+
+    line = '{:>10d} points {:8.1f} MB | read_msh {:7.2f} s'.format(n * n, size, tnew)
+
+    if n * n <= legacy_max:
+        t0 = time.time()
+        old = [d.apply(pd.to_numeric) for d in legacy_read_msh(filename)]
+        told = time.time() - t0
+        same = all(np.allclose(a.values, b.values, rtol=0, atol=1e-12) for a, b in zip(old, [nodes, edges, tria]))
+        line += ' | legacy {:7.2f} s | x{:.1f} equal {}'.format(told, told / tnew, same)
+
+    print(line)
+
+
+if __name__ == '__main__':
+    lines = [int(x) for x in sys.argv[1].split(',')] if len(sys.argv) > 1 else [1000, 10000, 100000]
+    points = [int(x) for x in sys.argv[2].split(',')] if len(sys.argv) > 2 else [10000, 100000, 1000000, 5000000]
+    legacy_max = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+
+    warnings.simplefilter('ignore', FutureWarning) # DataFrame.append in legacy_geo
+
+    path = tempfile.mkdtemp() + '/'
+    try:
+        for n in lines:
+            run_geo(path, n, legacy_max)
+        for n in points:
+            run_read(path, n, max(legacy_max, 1000000))
+    finally:
+        shutil.rmtree(path)
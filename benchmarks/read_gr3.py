@@ -0,0 +1,186 @@
+"""
+Benchmark of the hgrid.gr3 reader (grid.tri2d.read_file) on synthetic meshes.
+
+Compares the reader with the previous DataFrame based one (legacy_read below),
+reports wall time and throughput and checks that both give identical Datasets.
+The legacy reader is skipped above legacy_max nodes.
+
+usage : python benchmarks/read_gr3.py [sizes] [legacy_max]
+        e.g. python benchmarks/read_gr3.py 10000,100000,1000000,5000000 1000000
+"""
+import os
+import sys
+import time
+import tempfile
+import shutil
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import pyPoseidon.grid as pgrid
+from pyPoseidon.tests.meshes import write_gr3
+
+
+# previous reader, kept for reference
+def legacy_read(hgrid,**kwargs):
+
+    #read file
+    df = pd.read_csv(hgrid, header=0, names=['data'], index_col=None, low_memory=False)
+
+    #extract number of elements, number of nodes
+    ni,nj = df.iloc[0].str.split()[0]
+    ni=int(ni)
+    nj=int(nj) 
+
+    #read lon,lat,depth for all nodes
+    q = pd.DataFrame(df.loc[1:nj,'data'].str.split().values.tolist())
+    q = q.drop(q.columns[0], axis=1)
+    q = q.apply(pd.to_numeric)
+  #  q.reset_index(inplace=True, drop=True)
+    q.columns = ['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y','depth']
+    q.index.name = 'nSCHISM_hgrid_node'
+
+    #create xarray of grid
+    grid = q.loc[:,['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y']].to_xarray()
+    grid = grid.drop('nSCHISM_hgrid_node')
+
+    #create xarray of depth
+    depth = q.loc[:,'depth'].to_xarray()
+    depth = depth.drop('nSCHISM_hgrid_node')
+
+    #read connectivity
+    e = pd.DataFrame(df.loc[nj+1:nj+ni,'data'].str.split().values.tolist())
+    e = e.drop(e.columns[0], axis=1)
+    e = e.apply(pd.to_numeric)
+ #   e.reset_index(inplace=True, drop=True)
+    e.columns = ['nv','a','b','c']
+    e.loc[:,['a','b','c']] = e.loc[:,['a','b','c']] - 1 # convert to python (index starts from 0)
+
+#        if e.nv.max() < 4:
+#            e['d']=0
+
+    #create xarray of tessellation
+    els = xr.DataArray(
+          e.loc[:,['a','b','c']].values,
+          dims=['nSCHISM_hgrid_face', 'nMaxSCHISM_hgrid_face_nodes'], name='SCHISM_hgrid_face_nodes'
+          )
+
+    #Open boundaries
+    n0 = df[df.data.str.contains('open boundaries')].index
+    n0 = n0.values[0]
+    nob = df.loc[n0,'data'].split('=')[0].strip()
+    nob = int(nob)
+    nobn = df.loc[n0 + 1,'data'].split('=')[0].strip()
+    nobn = int(nobn)
+
+    onodes=[]
+    ottr = []
+    idx=n0 + 2
+    for nl in range(nob):
+        nn = df.loc[idx,'data'].split('=')[0].strip()
+        nn = int(nn)
+        label = df.loc[idx,'data'].split('=')[1]
+        label = label[label.index('open'):]
+        ottr.append([nn, label])
+        nodes = df.loc[idx+1:idx+nn,'data']
+        onodes.append(nodes.astype(int).values)
+        idx = idx + nn + 1
+
+    oinfo = pd.DataFrame(ottr)
+    try:
+        oinfo.columns = ['nps','label']
+        oinfo.label = oinfo.label.str.rstrip()
+        oinfo.label = oinfo.label.str.replace(' ', '_')
+        oinfo.set_index('label', inplace=True, drop=True)
+        oinfo = oinfo.apply(pd.to_numeric)
+    except:
+        pass
+
+    ops = pd.DataFrame(onodes).T
+    try:
+        ops.columns = oinfo.index
+    except:
+        pass
+
+    ops = ops - 1 # start_index = 0
+
+    #Land boundaries
+    n1 = df[df.data.str.contains('land boundaries')].index
+    n1 = n1.values[0]
+
+    nlb = df.loc[n1,'data'].split('=')[0].strip()
+    nlb = int(nlb)
+
+    nlbn = df.loc[n1 + 1,'data'].split('=')[0].strip()
+    nlbn = int(nlbn)
+
+
+    lnodes=[]
+    attr = []
+    idx=n1 + 2
+    for nl in range(nlb):
+        nn, etype = df.loc[idx,'data'].split('=')[0].strip().split(' ')
+        nn = int(nn)
+        etype = int(etype)
+        label = df.loc[idx,'data'].split('=')[1]
+        label = label[label.index('land'):]
+        attr.append([nn, etype, label])
+        nodes = df.loc[idx+1:idx+nn,'data']
+        lnodes.append(nodes.astype(int).values)
+        idx = idx + nn + 1
+
+    linfo = pd.DataFrame(attr)
+    try:
+        linfo.columns = ['nps','type','label']
+        linfo.label = linfo.label.str.rstrip()
+        linfo.label = linfo.label.str.replace(' ', '_')
+        linfo.set_index('label', inplace=True, drop=True)
+        linfo = linfo.apply(pd.to_numeric)
+    except:
+        pass
+
+    lps = pd.DataFrame(lnodes).T
+    lps.columns = linfo.index
+
+    lps = lps - 1 # start_index = 0     
+
+    # merge to one xarray DataSet
+    g = xr.merge([grid,depth,els,ops.to_xarray(),lps.to_xarray(),oinfo.to_xarray(),linfo.to_xarray()])
+
+    g.attrs = {}
+
+    return g
+
+
+def run(path, nodes, legacy_max):
+    n = int(np.sqrt(nodes))
+    filename = os.path.join(path, 'hgrid_{}.gr3'.format(nodes))
+    write_gr3(filename, n, n)
+    size = os.path.getsize(filename) / 2**20
+
+    t0 = time.time()
+    new = pgrid.tri2d.read_file(filename)
+    tnew = time.time() - t0
+
+    line = '{:>10d} nodes {:8.1f} MB | read_file {:7.2f} s {:7.1f} MB/s'.format(n * n, size, tnew, size / tnew)
+
+    if n * n <= legacy_max:
+        t0 = time.time()
+        old = legacy_read(filename)
+        told = time.time() - t0
+        line += ' | legacy {:7.2f} s {:7.1f} MB/s | x{:.1f} identical {}'.format(told, size / told, told / tnew, new.identical(old))
+
+    os.remove(filename)
+    print(line)
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1].split(',')] if len(sys.argv) > 1 else [10000, 100000, 1000000, 5000000]
+    legacy_max = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+
+    path = tempfile.mkdtemp()
+    try:
+        for nodes in sizes:
+            run(path, nodes, legacy_max)
+    finally:
+        shutil.rmtree(path)
@@ -0,0 +1,139 @@
+"""
+Benchmark of the gr3 writer (grid.tri2d.to_file) on synthetic meshes.
+
+Compares the writer with the previous DataFrame based one (legacy_write below),
+reports wall time and throughput and checks that both files are byte identical.
+The legacy writer is skipped above legacy_max nodes.
+
+usage : python benchmarks/write_gr3.py [sizes] [legacy_max]
+        e.g. python benchmarks/write_gr3.py 10000,100000,1000000,5000000 1000000
+"""
+import os
+import sys
+import time
+import tempfile
+import shutil
+import filecmp
+import numpy as np
+import pandas as pd
+
+import pyPoseidon.grid as pgrid
+from pyPoseidon.tests.meshes import write_gr3
+
+
+# previous writer, kept for reference
+def legacy_write(self, filename, **kwargs):
+
+    nn = self.Dataset.SCHISM_hgrid_node_x.size
+    n3e = self.Dataset.nSCHISM_hgrid_face.size        
+            
+    with open(filename,'w') as f:
+        f.write('\t uniform.gr3\n')
+        f.write('\t {} {}\n'.format(n3e,nn))
+    
+    q = self.Dataset[['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y','depth']].to_dataframe()
+    
+    q.index = np.arange(1, len(q) + 1)
+    
+    q.to_csv(filename,index=True, sep='\t', header=None,mode='a', float_format='%.10f', columns=['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y','depth'])   
+    
+    e = pd.DataFrame(self.Dataset.SCHISM_hgrid_face_nodes.dropna(dim='nMaxSCHISM_hgrid_face_nodes').values,columns=['a','b','c'])
+    
+    e['nv'] = e.apply(lambda row: row.dropna().size, axis=1)
+    
+    e.index = np.arange(1, len(e) + 1)
+    
+    e = e.dropna(axis=1).astype(int)
+    
+    e.loc[:,['a','b','c']] = e.loc[:,['a','b','c']] + 1 # convert to fortran (index starts from 1)
+    
+    e.to_csv(filename,index=True, sep='\t', header=None, mode='a', columns=['nv','a','b','c'])           
+    
+    # open boundaries
+    keys = [k for k in self.Dataset.keys() if 'open' in k]
+
+    if keys :
+    
+        obound = self.Dataset[keys].to_dataframe() # get the dataframe
+
+        nob = obound.shape[1] # number of boundaries
+
+        ops = (~obound.isna()).sum() # number of nodes for each boundary
+    
+    else:
+        
+        nob = 0
+        ops = np.array(0)
+    
+    with open(filename, 'a') as f:
+        f.write('{} = Number of open boundaries\n'.format(nob))
+        f.write('{} = Total number of open boundary nodes\n'.format(ops.sum()))
+        for i in range(nob):
+            dat = obound['open_boundary_{}'.format(i + 1)].dropna().astype(int) + 1 # convert to fortran (index starts from 1)
+            f.write('{} = Number of nodes for open boundary {}\n'.format(dat.size,i+1))
+            dat.to_csv(f,index=None,header=False)
+                            
+
+    # land boundaries                      
+
+    keys = [k for k in self.Dataset.keys() if 'land' in k]
+
+    if keys :
+
+        lbound = self.Dataset[keys].to_dataframe() # get the dataframe
+
+        nlb = lbound.shape[1] # number of boundaries
+
+        lps = (~lbound.isna()).sum() # number of nodes for each boundary
+    
+    else:
+        
+        nlb = 0
+        lps = np.array(0)
+    
+    with open(filename, 'a') as f:
+        f.write('{} = Number of land boundaries\n'.format(nlb))
+        f.write('{} = Total number of land boundary nodes\n'.format(lps.sum()))
+        for i in range(nlb):
+            name = 'land_boundary_{}'.format(i + 1)
+            dat = lbound[name].dropna().astype(int) + 1 # convert to fortran (index starts from 1)
+            f.write('{} {} = Number of nodes for land boundary {}\n'.format(dat.size,self.Dataset.type.sel(label=name).values.astype(int),i + 1))
+            dat.to_csv(f,index=None, header=False)
+
+
+def run(path, nodes, legacy_max):
+    n = int(np.sqrt(nodes))
+    filename = os.path.join(path, 'hgrid_{}.gr3'.format(nodes))
+    write_gr3(filename, n, n)
+    g = pgrid.grid(type='tri2d', grid_file=filename)
+
+    new = os.path.join(path, 'new.gr3')
+    t0 = time.time()
+    g.to_file(new)
+    tnew = time.time() - t0
+    size = os.path.getsize(new) / 2**20
+
+    line = '{:>10d} nodes {:8.1f} MB | to_file {:7.2f} s {:7.1f} MB/s'.format(n * n, size, tnew, size / tnew)
+
+    if n * n <= legacy_max:
+        old = os.path.join(path, 'old.gr3')
+        t0 = time.time()
+        legacy_write(g, old)
+        told = time.time() - t0
+        line += ' | legacy {:7.2f} s {:7.1f} MB/s | x{:.1f} identical {}'.format(told, size / told, told / tnew, filecmp.cmp(new, old, shallow=False))
+
+    for f in os.listdir(path):
+        os.remove(os.path.join(path, f))
+    print(line)
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1].split(',')] if len(sys.argv) > 1 else [10000, 100000, 1000000, 5000000]
+    legacy_max = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+
+    path = tempfile.mkdtemp()
+    try:
+        for nodes in sizes:
+            run(path, nodes, legacy_max)
+    finally:
+        shutil.rmtree(path)
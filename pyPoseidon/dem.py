@@ -14,6 +14,9 @@ import xarray as xr
 import sys
 import importlib
 from pyPoseidon.utils.fix import fix
+import pyPoseidon.utils.rectilinear as rectilinear
+import pyPoseidon.utils.demtiles as demtiles
+import pyPoseidon.utils.cache as pcache
 import logging
 
 
@@ -38,14 +41,16 @@ def dem_(source=None, lon_min=-180, lon_max=180, lat_min=-90, lat_max=90, **kwar
     logger.info('extracting dem from {}\n'.format(source))
     #---------------------------------------------------------------------      
   
-    data = xr.open_dataset(source) 
+    # read through the on-disk tile cache, see utils.demtiles
+    cache = kwargs.get('cache', pcache.CACHE)
     
-    #rename vars,coords
-    var = [keys for keys in data.data_vars]
-    coords = [keys for keys in data.coords]
-    lat = [x for x in coords if 'lat' in  x]  
-    lon = [x for x in coords if 'lon' in  x]
-    data = data.rename({var[0] : 'elevation', lat[0] : 'latitude', lon[0] : 'longitude'})
+    if cache:
+        tiles = demtiles.tiles(source, kwargs.get('cache_dir', None), max_size=kwargs.get('dem_cache_size', demtiles.DEM_CACHE_SIZE))
+        data = tiles.axes()
+        subset = tiles.isel
+    else:
+        data = demtiles.rename(xr.open_dataset(source)) #rename vars,coords
+        subset = data.elevation.isel
     
     #recenter the window 
     
@@ -92,27 +97,18 @@ def dem_(source=None, lon_min=-180, lon_max=180, lat_min=-90, lat_max=90, **kwar
 
     if i0 > i1 :
 
-        p1 = (
-          data.elevation
-          .isel(longitude=slice(lon_0,data.longitude.size),latitude=slice(lat_0,lat_1))
-          )
+        p1 = subset(longitude=slice(lon_0,data.longitude.size),latitude=slice(lat_0,lat_1))
 
         p1.longitude.values = p1.longitude.values -360.
 
 
-        p2 = (
-          data.elevation
-          .isel(longitude=slice(0,lon_1),latitude=slice(lat_0,lat_1))
-          )
+        p2 = subset(longitude=slice(0,lon_1),latitude=slice(lat_0,lat_1))
 
         dem = xr.concat([p1,p2],dim='longitude')
   
     else:            
 
-        dem = (
-            data.elevation
-            .isel(longitude=slice(lon_0,lon_1),latitude=slice(lat_0,lat_1))
-            )
+        dem = subset(longitude=slice(lon_0,lon_1),latitude=slice(lat_0,lat_1))
     
     
     if np.abs(np.mean(dem.longitude) - np.mean([lon_min, lon_max])) > 170. :
@@ -129,21 +125,30 @@ def dem_(source=None, lon_min=-180, lon_max=180, lat_min=-90, lat_max=90, **kwar
 
         grid_x = kwargs.get('grid_x', None)
         grid_y = kwargs.get('grid_y', None)
-        # resample on the given grid
-        xx,yy = np.meshgrid(dem.longitude ,dem.latitude)   #original grid         
+        
+        gaxes = rectilinear.axes(grid_x, grid_y)
+        
+        if gaxes is not None and rectilinear.monotonic(dem.longitude.values) and rectilinear.monotonic(dem.latitude.values):
+            
+            # separable nearest on the 1-D axes, no 2-D coordinates needed
+            itopo = rectilinear.nearest(dem.values, dem.longitude.values, dem.latitude.values, *gaxes, radius=50000)
+        
+        else:
+            # resample on the given grid
+            xx,yy = np.meshgrid(dem.longitude ,dem.latitude)   #original grid         
 
-        orig = pyresample.geometry.SwathDefinition(lons=xx,lats=yy) # original points
-        targ = pyresample.geometry.SwathDefinition(lons=grid_x,lats=grid_y) # target grid
+            orig = pyresample.geometry.SwathDefinition(lons=xx,lats=yy) # original points
+            targ = pyresample.geometry.SwathDefinition(lons=grid_x,lats=grid_y) # target grid
 
-        # with nearest using only the water values        
+            # with nearest using only the water values        
 
-        #    itopo = pyresample.kd_tree.resample_nearest(orig,dem.values,targ,radius_of_influence=50000,fill_value=np.nan,nprocs=ncores)
+            #    itopo = pyresample.kd_tree.resample_nearest(orig,dem.values,targ,radius_of_influence=50000,fill_value=np.nan,nprocs=ncores)
 
-        grid_con = pyresample.image.ImageContainerNearest(dem.values, orig, radius_of_influence=50000,fill_value=np.nan)#,nprocs=ncores)
+            grid_con = pyresample.image.ImageContainerNearest(dem.values, orig, radius_of_influence=50000,fill_value=np.nan)#,nprocs=ncores)
 
-        area_con = grid_con.resample(targ)
+            area_con = grid_con.resample(targ)
 
-        itopo = area_con.image_data
+            itopo = area_con.image_data
 
         if len(grid_x.shape) > 1:         
             idem = xr.Dataset({'ival': (['k', 'l'],  itopo), 
@@ -13,11 +13,24 @@ import datetime
 import xarray as xr
 import pandas as pd
 import sys
+import os
+import time
+import itertools
+from scipy.spatial import cKDTree
+import pyPoseidon.utils.parse as parse
+import pyPoseidon.utils.gr3 as gr3
+import pyPoseidon.utils.grd as grd
+import pyPoseidon.utils.rectilinear as rectilinear
+import pyPoseidon.utils.cache as pcache
+import pyPoseidon.utils.topology # registers the ds.mesh accessor
 from .jigsaw import *
 import logging
 
 logger = logging.getLogger('pyPoseidon')
 
+# default size (MB) of the cache of tri2d grids, see tri2d.read_cached
+GRID_CACHE_SIZE = 1024
+
 
 def grid(type=None, **kwargs):
     if type == 'r2d':
@@ -53,7 +66,7 @@ class r2d():
             # set the grid 
             x=np.linspace(lon_min,lon_max,ni)
             y=np.linspace(lat_min,lat_max,nj)
-            gx,gy=np.meshgrid(x,y)
+            gx,gy=rectilinear.coordinates(x,y) # views of x, y, see axes
 
             attrs = kwargs.get('attrs', {'Coordinate System': 'Spherical', 'alfori': 0.0, 'xori': 0.0, 'yori': 0.0})
         
@@ -67,27 +80,19 @@ class r2d():
             self.Dataset = g
         
 
+    @property
+    def axes(self):
+        """1-D (x, y) of a rectilinear grid, None for a curvilinear one
+        """
+        return rectilinear.axes(self.Dataset.lons.values, self.Dataset.lats.values)
+
+
     @staticmethod
     def read_file(filename, **kwargs):
         
         logger.info('read grid file {}'.format(filename))
         
-        header=pd.read_csv(filename,nrows=3,header=None,comment='*')
-        cs = header.loc[0,0].split('=')[1].strip()
-        ni,nj = header.loc[1,0].split(' ')
-        ni,nj = int(ni),int(nj)
-        alfori, xori, yori = header.loc[2,0].split(' ')
-        
-        d = pd.read_csv(filename,header=2,comment='*',delim_whitespace=True,engine='python',na_values='ETA=')
-        d = d.reset_index()
-        data = d.values[~np.isnan(d.values)]
-        data=np.array(data)
-        data = data.reshape(2,nj,ni+1) # including the row index
-        #clean up the row index
-        data = data[:,:,1:]
-        
-        lons=data[0,:,:]
-        lats=data[1,:,:]      
+        (cs, alfori, xori, yori), lons, lats = grd.read(filename)
                         
         g = xr.Dataset({'lons': (['y', 'x'], lons),   
                         'lats': (['y', 'x'], lats)},
@@ -104,18 +109,8 @@ class r2d():
         
         logger.info('writing grid to file {}'.format(filename))
         
-        with open(filename,'w') as f:
-            f.write('Coordinate System= {}\n'.format(self.Dataset.attrs['Coordinate System']))
-            f.write('{} {}\n'.format(self.Dataset.lons.shape[1],self.Dataset.lons.shape[0]))
-            f.write('{} {} {}\n'.format(self.Dataset.attrs['xori'],self.Dataset.attrs['yori'],self.Dataset.attrs['alfori']))
-            for i in range(self.Dataset.lons.shape[0]):
-                f.write('ETA=  {} '.format(i+1))
-                f.write(' '.join(map(str, self.Dataset.lons[i,:].values)))
-                f.write('\n')
-            for i in range(self.Dataset.lats.shape[0]):
-                f.write('ETA=  {} '.format(i+1))
-                f.write(' '.join(map(str, self.Dataset.lats[i,:].values)))
-                f.write('\n')
+        grd.write(filename, self.Dataset.lons.values, self.Dataset.lats.values, self.Dataset.attrs['Coordinate System'],
+                  self.Dataset.attrs['xori'], self.Dataset.attrs['yori'], self.Dataset.attrs['alfori'])
 
         
     
@@ -125,10 +120,11 @@ class tri2d():
     def __init__(self, **kwargs):
                     
         grid_file  = kwargs.get('grid_file', None)
+        cache = kwargs.get('cache', pcache.CACHE) # binary copy of the grid file, see read_cached
                     
         if grid_file: 
               
-            self.Dataset = self.read_file(grid_file)
+            self.Dataset = self.read_cached(grid_file, **kwargs) if cache else self.read_file(grid_file)
         
         else:
     
@@ -137,72 +133,118 @@ class tri2d():
             self.Dataset = g
     
     
+    def node_tree(self, depth=None):
+        """KD-tree of the mesh nodes (or of the nodes deeper than depth) and their indices.
+        
+        Built once and kept on the grid until its Dataset changes.
+        """
+        cache = self.__dict__.setdefault('_trees', {})
+        
+        if cache.get('Dataset', None) is not self.Dataset:
+            cache.clear()
+            cache['Dataset'] = self.Dataset
+        
+        if depth not in cache:
+            x = self.Dataset.SCHISM_hgrid_node_x.values
+            y = self.Dataset.SCHISM_hgrid_node_y.values
+            
+            idx = np.arange(x.size)
+            if depth is not None:
+                idx = idx[self.Dataset.depth.values > depth] # wet nodes
+            
+            cache[depth] = (cKDTree(np.column_stack([x[idx], y[idx]])), idx)
+        
+        return cache[depth]
+    
+    
+    def snap(self, x, y, depth=None):
+        """Indices of the mesh nodes closest to the points (x, y), optionally among the nodes deeper than depth
+        """
+        tree, idx = self.node_tree(depth)
+        
+        if idx.size == 0:
+            raise ValueError('no mesh nodes deeper than {}'.format(depth))
+        
+        _, i = tree.query(np.column_stack([np.ravel(x), np.ravel(y)]))
+        
+        return idx[i]
+    
+    
+    @staticmethod
+    def read_cached(hgrid, **kwargs):
+        """read_file with a binary (netCDF) copy of the mesh in the cache folder (cache_dir, see utils.cache).
+        
+        The copy is keyed on the sha1 of the gr3 content, so all the run folders with the same gr3
+        share it and a changed gr3 is read again. The sha1 is kept per path, size and modification
+        time, an unchanged gr3 is not hashed again. The least recently used copies are removed above
+        grid_cache_size MB.
+        """
+        
+        folder = pcache.cache_dir(kwargs.get('cache_dir', None), 'grid')
+        cfile = os.path.join(folder, 'grid_{}.nc'.format(pcache.file_key(str(hgrid), folder)))
+        
+        g = pcache.load(cfile)
+        if g is not None:
+            logger.info('read grid from {}'.format(cfile))
+            return g
+        
+        g = tri2d.read_file(hgrid)
+        
+        pcache.save(g, cfile, max_size=kwargs.get('grid_cache_size', GRID_CACHE_SIZE))
+        
+        return g
+    
+    
     @staticmethod
     def read_file(hgrid,**kwargs):
                 
         logger.info('read grid file {}'.format(hgrid))
-                
-        #read file
-        df = pd.read_csv(hgrid, header=0, names=['data'], index_col=None, low_memory=False)
-        
-        #extract number of elements, number of nodes
-        ni,nj = df.iloc[0].str.split()[0]
-        ni=int(ni)
-        nj=int(nj) 
-               
-        #read lon,lat,depth for all nodes
-        q = pd.DataFrame(df.loc[1:nj,'data'].str.split().values.tolist())
-        q = q.drop(q.columns[0], axis=1)
-        q = q.apply(pd.to_numeric)
-      #  q.reset_index(inplace=True, drop=True)
-        q.columns = ['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y','depth']
-        q.index.name = 'nSCHISM_hgrid_node'
-    
-        #create xarray of grid
-        grid = q.loc[:,['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y']].to_xarray()
-        grid = grid.drop('nSCHISM_hgrid_node')
         
-        #create xarray of depth
-        depth = q.loc[:,'depth'].to_xarray()
-        depth = depth.drop('nSCHISM_hgrid_node')
+        t0 = time.time()
+        
+        with open(hgrid, 'r') as f:
+            
+            f.readline() # title
             
-        #read connectivity
-        e = pd.DataFrame(df.loc[nj+1:nj+ni,'data'].str.split().values.tolist())
-        e = e.drop(e.columns[0], axis=1)
-        e = e.apply(pd.to_numeric)
-     #   e.reset_index(inplace=True, drop=True)
-        e.columns = ['nv','a','b','c']
-        e.loc[:,['a','b','c']] = e.loc[:,['a','b','c']] - 1 # convert to python (index starts from 0)
+            #extract number of elements, number of nodes
+            ni,nj = [int(x) for x in f.readline().split()[:2]]
+            
+            #read lon,lat,depth for all nodes
+            q = parse.block(list(itertools.islice(f, nj)), float)
+            
+            #read connectivity
+            e = parse.block(list(itertools.islice(f, ni)), np.int64)
+            
+            #boundaries
+            rest = [l for l in f.read().splitlines() if l.strip()]
+        
+        grid = xr.Dataset({'SCHISM_hgrid_node_x' : (['nSCHISM_hgrid_node'], q[:,1]),
+                           'SCHISM_hgrid_node_y' : (['nSCHISM_hgrid_node'], q[:,2])})
         
-#        if e.nv.max() < 4:
-#            e['d']=0
+        depth = xr.DataArray(q[:,3], dims=['nSCHISM_hgrid_node'], name='depth')
         
         #create xarray of tessellation
         els = xr.DataArray(
-              e.loc[:,['a','b','c']].values,
+              e[:,2:] - 1, # convert to python (index starts from 0)
               dims=['nSCHISM_hgrid_face', 'nMaxSCHISM_hgrid_face_nodes'], name='SCHISM_hgrid_face_nodes'
               )
-                  
-        #Open boundaries
-        n0 = df[df.data.str.contains('open boundaries')].index
-        n0 = n0.values[0]
-        nob = df.loc[n0,'data'].split('=')[0].strip()
-        nob = int(nob)
-        nobn = df.loc[n0 + 1,'data'].split('=')[0].strip()
-        nobn = int(nobn)
-        
-        onodes=[]
-        ottr = []
-        idx=n0 + 2
-        for nl in range(nob):
-            nn = df.loc[idx,'data'].split('=')[0].strip()
-            nn = int(nn)
-            label = df.loc[idx,'data'].split('=')[1]
-            label = label[label.index('open'):]
-            ottr.append([nn, label])
-            nodes = df.loc[idx+1:idx+nn,'data']
-            onodes.append(nodes.astype(int).values)
-            idx = idx + nn + 1
+        
+        # open and land boundaries in one pass
+        blocks = {'open':[], 'land':[]}
+        idx = 0
+        for kind in ['open', 'land']:
+            if idx >= len(rest) or '{} boundaries'.format(kind) not in rest[idx] : continue
+            nb = int(rest[idx].split('=')[0])
+            idx += 2 # skip total number of nodes
+            for nl in range(nb):
+                head, label = rest[idx].split('=', 1)
+                nn = int(head.split()[0])
+                nodes = np.array([l.split()[0] for l in rest[idx+1:idx+1+nn]], dtype=int)
+                blocks[kind].append([head.split(), label[label.index(kind):], nodes])
+                idx += nn + 1
+        
+        onodes = [b[2] for b in blocks['open']]
+        ottr = [[int(b[0][0]), b[1]] for b in blocks['open']]
         
         oinfo = pd.DataFrame(ottr)
         try:
@@ -222,30 +264,8 @@ class tri2d():
             
         ops = ops - 1 # start_index = 0
         
-        #Land boundaries
-        n1 = df[df.data.str.contains('land boundaries')].index
-        n1 = n1.values[0]
-        
-        nlb = df.loc[n1,'data'].split('=')[0].strip()
-        nlb = int(nlb)
-        
-        nlbn = df.loc[n1 + 1,'data'].split('=')[0].strip()
-        nlbn = int(nlbn)
-        
-
-        lnodes=[]
-        attr = []
-        idx=n1 + 2
-        for nl in range(nlb):
-            nn, etype = df.loc[idx,'data'].split('=')[0].strip().split(' ')
-            nn = int(nn)
-            etype = int(etype)
-            label = df.loc[idx,'data'].split('=')[1]
-            label = label[label.index('land'):]
-            attr.append([nn, etype, label])
-            nodes = df.loc[idx+1:idx+nn,'data']
-            lnodes.append(nodes.astype(int).values)
-            idx = idx + nn + 1
+        lnodes = [b[2] for b in blocks['land']]
+        attr = [[int(b[0][0]), int(b[0][1]), b[1]] for b in blocks['land']]
             
         linfo = pd.DataFrame(attr)
         try:
@@ -267,88 +287,38 @@ class tri2d():
                     
         g.attrs = {}
         
+        elapsed = max(time.time() - t0, 1e-9)
+        logger.info('read {} nodes, {} elements in {:.2f} s ({:.1f} MB/s)'.format(nj, ni, elapsed, os.path.getsize(hgrid) / elapsed / 2**20))
+        
         return g
     
     def to_file(self, filename, **kwargs):
         
         logger.info('writing grid to file {}'.format(filename))
         
-        
-        nn = self.Dataset.SCHISM_hgrid_node_x.size
-        n3e = self.Dataset.nSCHISM_hgrid_face.size        
-                
-        with open(filename,'w') as f:
-            f.write('\t uniform.gr3\n')
-            f.write('\t {} {}\n'.format(n3e,nn))
-        
-        q = self.Dataset[['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y','depth']].to_dataframe()
-        
-        q.index = np.arange(1, len(q) + 1)
-        
-        q.to_csv(filename,index=True, sep='\t', header=None,mode='a', float_format='%.10f', columns=['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y','depth'])   
-        
-        e = pd.DataFrame(self.Dataset.SCHISM_hgrid_face_nodes.dropna(dim='nMaxSCHISM_hgrid_face_nodes').values,columns=['a','b','c'])
-        
-        e['nv'] = e.apply(lambda row: row.dropna().size, axis=1)
-        
-        e.index = np.arange(1, len(e) + 1)
-        
-        e = e.dropna(axis=1).astype(int)
-        
-        e.loc[:,['a','b','c']] = e.loc[:,['a','b','c']] + 1 # convert to fortran (index starts from 1)
-        
-        e.to_csv(filename,index=True, sep='\t', header=None, mode='a', columns=['nv','a','b','c'])           
+        t0 = time.time()
         
         # open boundaries
-        keys = [k for k in self.Dataset.keys() if 'open' in k]
-
-        if keys :
+        nob = len([k for k in self.Dataset.keys() if 'open' in k])
+        opens = [self.Dataset['open_boundary_{}'.format(i + 1)].dropna('index').values for i in range(nob)]
         
-            obound = self.Dataset[keys].to_dataframe() # get the dataframe
-
-            nob = obound.shape[1] # number of boundaries
-
-            ops = (~obound.isna()).sum() # number of nodes for each boundary
+        # land boundaries
+        nlb = len([k for k in self.Dataset.keys() if 'land' in k])
+        names = ['land_boundary_{}'.format(i + 1) for i in range(nlb)]
+        lands = [self.Dataset[name].dropna('index').values for name in names]
+        types = [int(self.Dataset.type.sel(label=name).values) for name in names]
         
-        else:
-            
-            nob = 0
-            ops = np.array(0)
-        
-        with open(filename, 'a') as f:
-            f.write('{} = Number of open boundaries\n'.format(nob))
-            f.write('{} = Total number of open boundary nodes\n'.format(ops.sum()))
-            for i in range(nob):
-                dat = obound['open_boundary_{}'.format(i + 1)].dropna().astype(int) + 1 # convert to fortran (index starts from 1)
-                f.write('{} = Number of nodes for open boundary {}\n'.format(dat.size,i+1))
-                dat.to_csv(f,index=None,header=False)
-                                
-
-        # land boundaries                      
-
-        keys = [k for k in self.Dataset.keys() if 'land' in k]
-
-        if keys :
-
-            lbound = self.Dataset[keys].to_dataframe() # get the dataframe
-
-            nlb = lbound.shape[1] # number of boundaries
-
-            lps = (~lbound.isna()).sum() # number of nodes for each boundary
+        faces = self.Dataset.SCHISM_hgrid_face_nodes.dropna(dim='nMaxSCHISM_hgrid_face_nodes').values
         
-        else:
-            
-            nlb = 0
-            lps = np.array(0)
-        
-        with open(filename, 'a') as f:
-            f.write('{} = Number of land boundaries\n'.format(nlb))
-            f.write('{} = Total number of land boundary nodes\n'.format(lps.sum()))
-            for i in range(nlb):
-                name = 'land_boundary_{}'.format(i + 1)
-                dat = lbound[name].dropna().astype(int) + 1 # convert to fortran (index starts from 1)
-                f.write('{} {} = Number of nodes for land boundary {}\n'.format(dat.size,self.Dataset.type.sel(label=name).values.astype(int),i + 1))
-                dat.to_csv(f,index=None, header=False)
-
+        gr3.write(filename, self.Dataset.SCHISM_hgrid_node_x.values, self.Dataset.SCHISM_hgrid_node_y.values, self.Dataset.depth.values,
+                  faces=faces, opens=opens, lands=lands, land_types=types)
         
-
+        logger.info('grid written in {:.2f} s'.format(time.time() - t0))
+    
+    
+    def to_property(self, filename, values, title='0 '):
+        """Write a node based property file (manning.gr3, windrot_geo2proj.gr3, drag.gr3, ...) on the grid nodes
+        """
+        
+        gr3.write(filename, self.Dataset.SCHISM_hgrid_node_x.values, self.Dataset.SCHISM_hgrid_node_y.values, values,
+                  nelems=self.Dataset.nSCHISM_hgrid_face.size, title=title)
@@ -15,75 +15,119 @@ import xarray as xr
 import os
 import shapely
 import subprocess
+import glob
+import shutil
 import sys
 
 import pyPoseidon.dem as pdem
+import pyPoseidon.utils.msh as msh
+import pyPoseidon.utils.topology as tp
+import pyPoseidon.utils.cache as pcache
 import logging        
         
 logger = logging.getLogger('pyPoseidon')
 
 
+# options of the .jig file
+JIG = {'HFUN_SCAL' : 'ABSOLUTE', 'HFUN_HMAX' : 'Inf', 'HFUN_HMIN' : '0.0', 'MESH_DIMS' : 2, 'MESH_TOP1' : 'TRUE',
+       'MESH_EPS1' : '1.0', 'MESH_RAD2' : 1, 'GEOM_FEAT' : 'TRUE', 'VERBOSITY' : 2}
+
+# size (MB) of the mesh cache
+MESH_CACHE_SIZE = 1024
+
+
 def geo(df, path='.', tag='jigsaw'):
     
     fgeo = path + tag+'-geo.msh'
-    # write header
+    
+    # lines in the order of the index levels, the points of each line in their order
+    order = np.argsort(df.index.codes[0], kind='stable')
+    d = df.iloc[order]
+    
+    # closed ring of edges for every line
+    e1, e2, que = msh.rings(d.index.codes[0], d.tag.values)
+    
     with open(fgeo,'w') as f:
         f.write('#{}; created by pyPoseidon\n'.format(tag +'-geo.msh'))
         f.write('MSHID=2;EUCLIDEAN-MESH\n')
         f.write('NDIMS=2\n')
-        f.write('POINT={}\n'.format(df.shape[0]))
-    
-    #write lines
-    with open(fgeo, 'a') as f:
-        for line in df.index.levels[0]:
-            df.loc[line].to_csv(f, index=False, header=0, columns=['lon','lat','z'],sep=';')
-
+        f.write('POINT={}\n'.format(d.shape[0]))
+        msh.write_block(f, [d.lon.values, d.lat.values, d.z.values])
+        f.write('EDGE2={}\n'.format(e1.size))
+        msh.write_block(f, [e1, e2, que])
+        
 
-    edges = pd.DataFrame([]) # initiate
 
-    # create edges
-    for line in df.index.levels[0]:
-        i0 = edges.shape[0]
-        ie = df.loc[line].shape[0] + edges.shape[0]
-        dline = df.loc[line].copy()
-        dline.index = range(i0,ie)
-        dline.loc[:,'ie'] = dline.index.values + 1
-        dline.loc[dline.index[-1],'ie']=i0
-        dout = dline.reset_index().loc[:,['index','ie','tag']]
-
-        dout['tag1'] = dline.loc[dline.ie.values,'tag'].values.astype(int)
-        dout['que'] = np.where(((dout['tag'] != dout['tag1']) & (dout['tag'] > 0)) , dout['tag1'], dout['tag'])    
-        dout = dout.reset_index().loc[:,['index','ie','que']]
-        edges = edges.append(dout)        
-        
-    # write header
-    with open(fgeo,'a') as f:
-        f.write('EDGE2={}\n'.format(edges.shape[0]))
+def read_msh(fmsh):
     
-    with open(fgeo, 'a') as f:
-        edges.to_csv(f, index=False, header=0, sep=';')
-        
+    header, blocks = msh.read(fmsh)
+    
+    nodes = pd.DataFrame(blocks['POINT'], columns=['lon','lat','z'])
+    edges = pd.DataFrame(blocks['EDGE2'], columns=['e1','e2','e3'])
+    tria = pd.DataFrame(blocks['TRIA3'], columns=['a','b','c','d'])
 
+    return [nodes,edges,tria]
+    
+    
+            
 
-def read_msh(fmsh):
+def boundaries(edges):
+    """Ordered nodes of the boundary of every tag {tag : nodes} from the (e1, e2, tag) edges
+    """
+    edges = np.asarray(edges, dtype=int)
+    order = np.argsort(edges[:,2], kind='stable')
+    e = edges[order]
+    
+    tags, offsets = np.unique(e[:,2], return_index=True)
+    offsets = np.append(offsets, e.shape[0])
+    
+    bounds = {}
+    for k, t in enumerate(tags):
+        if t == 0 : continue
+        bounds[t] = np.concatenate(tp.chains(e[offsets[k]:offsets[k+1],:2]))
     
-    grid = pd.read_csv(fmsh, header=0, names=['data'], index_col=None, low_memory=False)
-    npoints = int(grid.loc[2].str.split('=')[0][1])
+    return bounds
 
-    nodes = pd.DataFrame(grid.loc[3: 3 + npoints - 1,'data'].str.split(';').values.tolist(),columns=['lon','lat','z'])
 
-    ie = grid[grid.data.str.contains('EDGE')].index.values[0]
-    nedges = int(grid.loc[ie].str.split('=')[0][1])
-    edges = pd.DataFrame(grid.loc[ie + 1 :ie  + nedges ,'data'].str.split(';').values.tolist(),columns=['e1','e2','e3'])
+def padded(seqs, labels):
+    """Dataset of the node sequences along 'index', padded with NaN to the longest one
+    """
+    n = max([s.size for s in seqs], default=0)
+    if all(s.size == n for s in seqs):
+        a = np.zeros((n, len(seqs)), dtype=int)
+    else:
+        a = np.full((n, len(seqs)), np.nan)
+    for i, s in enumerate(seqs):
+        a[:s.size, i] = s
+    
+    return xr.Dataset({l : ('index', a[:,i]) for i, l in enumerate(labels)}, coords={'index' : np.arange(n)})
 
-    i3 = grid[grid.data.str.contains('TRIA')].index.values[0]
-    ntria = int(grid.loc[i3].str.split('=')[0][1])
-    tria = pd.DataFrame(grid.loc[i3 + 1 : i3 + ntria + 1 ,'data'].str.split(';').values.tolist(),columns=['a','b','c','d'])
 
-    return [nodes,edges,tria]
+def mesh_key(**kwargs):
+    """sha1 of the inputs of jigsaw(): geometry, coastlines, hfun and the jig options
+    """
+    geometry = kwargs.get('geometry', None)
+    coastlines = kwargs.get('coastlines', None)
+    hfun = kwargs.get('hfun', None)
     
+    items = [sorted(JIG.items())]
     
-            
+    if isinstance(geometry, dict):
+        items.append(sorted(geometry.items()))
+    elif isinstance(geometry, str):
+        # a shapefile comes with its sidecar files
+        stem = os.path.splitext(geometry)[0]
+        for f in sorted(glob.glob(stem + '.*')):
+            items += [os.path.splitext(f)[1], pcache.file_digest(f)]
+    
+    if coastlines is not None:
+        items.append(b''.join(g.wkb for g in coastlines.geometry if g is not None))
+    
+    if hfun:
+        items.append(pcache.file_digest(hfun))
+    
+    return pcache.digest(*items)
+
 
 def jigsaw(**kwargs):
      
@@ -92,6 +136,15 @@ def jigsaw(**kwargs):
        
     geometry = kwargs.get('geometry', None)
     
+    # meshes of identical inputs are taken from the cache, see mesh_key
+    if kwargs.get('cache', pcache.CACHE):
+        folder = pcache.cache_dir(kwargs.get('cache_dir', None), 'mesh')
+        cfile = os.path.join(folder, 'mesh_{}.nc'.format(mesh_key(**kwargs)))
+        gr = pcache.load(cfile)
+        if gr is not None:
+            logger.info('read mesh from cache {}\n'.format(cfile))
+            return gr
+    
     if isinstance(geometry,dict): 
              
         df , bmindx = jdefault(**kwargs)
@@ -105,7 +158,9 @@ def jigsaw(**kwargs):
         bmindx = df.tag.min()
         
         gr = jigsaw_(df, bmindx, **kwargs)
-          
+    
+    if kwargs.get('cache', pcache.CACHE):
+        pcache.save(gr, cfile, max_size=kwargs.get('mesh_cache_size', MESH_CACHE_SIZE))
     
     return gr
 
@@ -320,6 +375,26 @@ def jdefault(**kwargs):
     
     return df, bmindx      
     
+def write_hfun(hfun, fhfun):
+    """Write the hfun (a .msh, netCDF or Zarr file of utils.hfun) as the JIGSAW file fhfun
+    """
+    if hfun.endswith('.msh'): # already in the JIGSAW format (utils.hfun with to_msh=True)
+        if os.path.abspath(hfun) != os.path.abspath(fhfun) : shutil.copyfile(hfun, fhfun)
+        return
+
+    # Zarr stores of utils.hfun.tiled are read by strips of whole chunks
+    if os.path.isdir(hfun):
+        dh = xr.open_zarr(hfun)
+        z = dh.z.transpose('latitude', 'longitude').data
+        align = dh.z.encoding['chunks'][dh.z.dims.index('longitude')]
+    else:
+        dh = xr.open_dataset(hfun)
+        z = dh.z.transpose('latitude', 'longitude').values
+        align = 1
+    msh.write_grid(fhfun, dh.longitude.values, dh.latitude.values, z, align=align)
+    dh.close()
+
+
 def jigsaw_(df, bmindx, **kwargs):    
     
     logger.info('Creating JIGSAW files\n')
@@ -342,32 +417,8 @@ def jigsaw_(df, bmindx, **kwargs):
     hfun = kwargs.get('hfun', None)
     
     if hfun:
-        dh = xr.open_dataset(hfun)
-                
-        # write hfun file
-    
         fhfun = path + tag+'-hfun.msh'
-        # write header
-        with open(fhfun,'w') as f:
-            f.write('#{}; created by pyPoseidon\n'.format(tag+'-hfun.msh'))
-            f.write('MSHID=3;EUCLIDEAN-GRID\n')
-            f.write('NDIMS=2\n')
-            f.write('COORD=1;{}\n'.format(dh.longitude.size))
-        
-        with open(fhfun, 'a') as f:
-            np.savetxt(f, dh.longitude.values)
-        
-        with open(fhfun, 'a') as f:
-            f.write('COORD=2;{}\n'.format(dh.latitude.size))
-        
-        with open(fhfun, 'a') as f:
-            np.savetxt(f, dh.latitude.values)
-    
-        with open(fhfun, 'a') as f:
-            f.write('VALUE={};1\n'.format(dh.z.size))
-    
-        with open(fhfun, 'a') as f:
-            np.savetxt(f, dh.z.values.flatten())
+        write_hfun(hfun, fhfun)
       
     
     # write jig file
@@ -377,15 +428,7 @@ def jigsaw_(df, bmindx, **kwargs):
         f.write('GEOM_FILE ={}\n'.format(tag+'-geo.msh'))
         f.write('MESH_FILE ={}\n'.format(tag+'.msh'))
         if hfun : f.write('HFUN_FILE ={}\n'.format(tag+'-hfun.msh'))
-        f.write('HFUN_SCAL = ABSOLUTE\n')
-        f.write('HFUN_HMAX = Inf\n')
-        f.write('HFUN_HMIN = 0.0\n')
-        f.write('MESH_DIMS = 2\n')
-        f.write('MESH_TOP1 = TRUE\n')
-        f.write('MESH_EPS1 = 1.0\n')
-        f.write('MESH_RAD2 = 1\n')
-        f.write('GEOM_FEAT = TRUE\n')
-        f.write('VERBOSITY = 2')
+        f.write('\n'.join('{} = {}'.format(k, v) for k, v in JIG.items()))
     
     
     
@@ -418,48 +461,22 @@ def jigsaw_(df, bmindx, **kwargs):
     
     [nodes,edges,tria] = read_msh(rpath+'/jigsaw/'+ tag + '.msh')
     
-    nodes = nodes.apply(pd.to_numeric)
-    tria = tria.apply(pd.to_numeric)
-    edges = edges.apply(pd.to_numeric)
-    
-# Interpolate on grid points 
-   
-    # Boundaries
-    
-    # LAND Boundaries (negative tag)    
-    ib = 1
-    isl = []
-    for ik in range(edges.e3.min(),0):
-        bb = np.unique(edges.loc[edges.e3 == ik,['e1','e2']].values.flatten())
-        bf = pd.concat([nodes.loc[bb]],keys=['land_boundary_{}'.format(ib)])
-        bf['idx'] = bb
-        if ik >= bmindx: 
-            bf['flag'] = 0
-        else:
-            bf['flag'] = 1
-
-        isl.append(bf)
-        ib += 1
-        
-    landb = pd.concat(isl)
+    gr = to_dataset(nodes, edges, tria, bmindx)
     
-    land_i = sorted(landb.index.levels[0], key=lambda x: int(x.split('_')[2]))
+    logger.info('..done creating mesh\n')
     
-    # WATER Boundaries (positive tag)
     
-    wb = 1
-    wbs = []
-    for ik in range(1,edges.e3.max()+1):
-        bb = np.unique(edges.loc[edges.e3 == ik,['e1','e2']].values.flatten())
-        bf = pd.concat([nodes.loc[bb]],keys=['open_boundary_{}'.format(wb)])
-        bf['idx'] = bb
+    return gr
 
-        wbs.append(bf)
-        wb += 1
-        
-    openb = pd.concat(wbs)
+
+def to_dataset(nodes, edges, tria, bmindx):
+    """Grid Dataset of the mesh read by read_msh, land tags below bmindx are islands
+    """
+    # Boundaries in one pass over the edges grouped by tag, LAND (negative tag) and WATER (positive tag)
+    bounds = boundaries(edges.loc[:,['e1','e2','e3']].values)
     
-    open_i = sorted(openb.index.levels[0], key=lambda x: int(x.split('_')[2]))
+    land_tags = [t for t in bounds if t < 0]
+    open_tags = [t for t in bounds if t > 0]
     
     #MAKE Dataset
     
@@ -474,46 +491,23 @@ def jigsaw_(df, bmindx, **kwargs):
     dep = xr.Dataset({'depth': (['nSCHISM_hgrid_node'], np.zeros(nod.nSCHISM_hgrid_node.shape[0]))})
 
     #open boundaries
-    op=[]
-    nop=[]
-    o_label=[]
-    for line in open_i:
-        op.append(openb.loc[line,'idx'].values)
-        nop.append(openb.loc[line,'idx'].size)
-        o_label.append(line)
-
-    xob = pd.DataFrame(op).T
-    xob.columns = o_label
-
-    oattr = pd.DataFrame({'label':o_label,'nps':nop})
+    o_label = ['open_boundary_{}'.format(i + 1) for i in range(len(open_tags))]
+    xob = padded([bounds[t] for t in open_tags], o_label)
+
+    oattr = pd.DataFrame({'label':o_label,'nps':[bounds[t].size for t in open_tags]})
     oattr['type'] = np.nan
     oattr.set_index('label', inplace=True, drop=True)
 
     #land boundaries
+    l_label = ['land_boundary_{}'.format(i + 1) for i in range(len(land_tags))]
+    xlb = padded([bounds[t] for t in land_tags], l_label)
 
-    lp=[]
-    nlp=[]
-    l_label=[]
-    itype = []
-    for line in land_i:
-        lp.append(landb.loc[line,'idx'].values)
-        nlp.append(landb.loc[line,'idx'].size)
-        itype.append(landb.loc[line,'flag'].values[0])
-        l_label.append(line)
-    
-    xlb = pd.DataFrame(lp).T
-    xlb.columns = l_label
-
-    lattr = pd.DataFrame({'label':l_label,'nps':nlp})
-    lattr['type'] = itype
+    lattr = pd.DataFrame({'label':l_label,'nps':[bounds[t].size for t in land_tags]})
+    lattr['type'] = [0 if t >= bmindx else 1 for t in land_tags] # islands
     lattr.set_index('label', inplace=True, drop=True)
 
 
-    gr = xr.merge([nod,dep,els,xob.to_xarray(), xlb.to_xarray(), lattr.to_xarray(), oattr.to_xarray()]) # total
-    
-    
-    logger.info('..done creating mesh\n')
-    
+    gr = xr.merge([nod,dep,els,xob,xlb,lattr.to_xarray(), oattr.to_xarray()]) # total
     
     return gr
     
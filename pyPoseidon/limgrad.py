@@ -1,97 +1,121 @@
 #LIMGRAD impose gradient limits on a discrete mesh-size function defined over a 2-simplex triangulation (from JIGSAW tools)
-# TODO revisit and check
 import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+import logging
 
-    
-def limgrad2(edge,elen,ffun,dfdx,imax):
-    
-    rfun = ffun.T.flatten()
-    
-    rfun = np.array([[hf] for hf in list(rfun)])
-    
-    eps = np.finfo(float).eps
-    
-    nnod = rfun.size
-        
-    #-- IVEC(NPTR(II,1):NPTR(II,2)) are edges adj. to II-TH node
-    nvec = np.hstack([edge[:,0], edge[:,1]])
-
-    ivec = np.hstack([np.arange(edge.shape[0]),np.arange(edge.shape[0])])
-
-
-    nvec_ = np.sort(nvec, kind='mergesort')
-    pidx = np.argsort(nvec, kind='mergesort') # to match with matlab/octave -> https://stackoverflow.com/questions/39484073/matlab-sort-vs-numpy-argsort-how-to-match-results
-    ivec = ivec[pidx]
-    nvec = nvec_
-    
-    
-    mark = np.full(rfun.size, False, dtype=bool)
-    mark[edge[:,0]]=True
-    mark[edge[:,1]]=True
-
-    dif = [nvec[i+1]-nvec[i] for i in range(nvec.shape[0]-1)]
-    idxx = np.argwhere(np.array(dif) > 0).flatten()
-    
-    nptr=np.zeros((mark.size,2))
-    nptr[mark,0] = np.append(np.array([0]),idxx+1)
-    nptr[mark,1] = np.append(idxx, nnod-1)
-    
-    nptr = nptr.astype(int)
-
-#----------------------------- ASET=ITER if node is "active"
-    aset = np.zeros(nnod)
-    
-    ftol = min(rfun.flatten()) * np.sqrt(eps)
-    
-
-#----------------------------- exhaustive 'til all satisfied 
-    
-    for i in range(1,imax):
-    
-    #------------------------- find "active" nodes this pass
-        aidx = np.argwhere(aset == i - 1 ) 
-        aidx = aidx.flatten()
-        
-        if not aidx.any(): break
-      
-    #------------------------- reorder => better convergence
-
-        aval = np.sort(rfun.reshape(ffun.shape).flatten()[aidx],kind='mergesort')
-        idxx = np.argsort(rfun.reshape(ffun.shape).flatten()[aidx], kind='mergesort')
-        
-        aidx = aidx[idxx]
-       
-    #%------------------------- visit adj. edges and set DFDX
-        for ipos in range(len(aidx)):
-            npos = aidx[ipos]
-        
-            for jpos in range(nptr[npos,0], nptr[npos,1]+1):
-                
-                epos = ivec[jpos]
-                
-                nod1 = edge[epos,0]
-                nod2 = edge[epos,1]
-                
-               # print ipos, jpos, epos, nod1, nod2
-
-            #----------------- calc. limits about min.-value
-                if rfun[nod1] > rfun[nod2]:
-                
-                    
-                    fun1 = rfun[nod2] + elen[epos] * dfdx 
-                
-                    if rfun[nod1] > fun1+ftol :
-                        rfun[nod1] = fun1
-                        aset[nod1] = i
-                else:
-                
-                    fun2 = rfun[nod1] + elen[epos] * dfdx 
-                    
-                    if   rfun[nod2] > fun2+ftol :
-                        rfun[nod2] = fun2
-                        aset[nod2] = i
-     
-    flag = i < imax
-    
-    return rfun,flag
-    
+logger = logging.getLogger('pyPoseidon')
+
+
+def limgrad(edge, elen, ffun, dfdx, imax=100):
+    """Limit the gradient of the mesh size function ffun (one value per node) to dfdx along the edges.
+
+    The limited function is min_j(ffun_j + dfdx * distance to j along the edges), the fixed point
+    of the former node by node loop. It is computed in one sweep of the nodes in increasing order
+    of the limited value (Dijkstra) from a root linked to every node j by ffun_j, so a constraint
+    crosses the whole mesh whatever its width. imax is kept for the signature, the sweep always converges.
+
+    Returns the limited function (1-D), a flag True if converged and the diagnostics of the
+    sweep {'active' : [nodes changed], 'edges' : [edges visited]}.
+    """
+    rfun = np.array(ffun, dtype=float).ravel()
+    edge = np.asarray(edge)
+    elen = np.asarray(elen, dtype=float).ravel()
+
+    n = rfun.size
+    fmin = rfun.min()
+
+    # single (shortest) edge per pair of nodes, coo would add the duplicates
+    a, b = edge.min(axis=1), edge.max(axis=1)
+    order = np.lexsort((elen, b, a))
+    a, b, w = a[order], b[order], elen[order] * dfdx
+    first = np.ones(a.size, dtype=bool)
+    first[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+
+    # root n linked to every node by its value (shifted to non negative weights)
+    rows = np.append(a[first], np.full(n, n))
+    cols = np.append(b[first], np.arange(n))
+    weights = np.append(w[first], rfun - fmin)
+    graph = scipy.sparse.csr_matrix((weights, (rows, cols)), shape=(n + 1, n + 1))
+
+    dist = scipy.sparse.csgraph.dijkstra(graph, directed=False, indices=n)[:n] + fmin
+
+    ftol = fmin * np.sqrt(np.finfo(float).eps)
+    changed = rfun - dist > ftol
+    rfun = np.minimum(rfun, dist) # no round off increase
+
+    stats = {'active' : [int(changed.sum())], 'edges' : [edge.shape[0]]}
+
+    logger.debug('limgrad: {} nodes limited'.format(stats['active'][0]))
+
+    return rfun, True, stats
+
+
+def limgrad2(edge, elen, ffun, dfdx, imax):
+    """limgrad with the output of the former loop version, a (n, 1) array and the convergence flag
+    """
+    rfun, flag, stats = limgrad(edge, elen, ffun, dfdx, imax)
+
+    return rfun.reshape(-1, 1), flag
+
+
+def spacing(x):
+    # distances between consecutive points of an axis
+    x = np.asarray(x, dtype=float)
+    return np.abs(np.diff(x)) if x.size > 1 else np.zeros(0)
+
+
+def sweep_row(row, s):
+    # exact 1-D limit along a row with cumulative distances s (dfdx included), both directions
+    out = np.minimum.accumulate(row - s) + s
+    out = (np.minimum.accumulate((out + s)[::-1]) - s[::-1])[::-1]
+    return np.minimum(out, row) # no round off increase
+
+
+def limgrad_grid(ffun, x, y, dfdx, imax=100):
+    """Limit the gradient of the mesh size function ffun (nj, ni) defined on the regular lattice x (ni), y (nj).
+
+    The limit dfdx is imposed over the 8-neighbourhood of every cell with the spacings of the axes,
+    without a triangulation. Every pass sweeps the rows down and then up: each row takes the limits
+    from the 3 neighbours of the previous row and is then relaxed along itself in both directions
+    at once (cumulative minimum). Passes are repeated until no value changes (more than a tolerance).
+
+    Returns the limited function, a flag True if converged and the diagnostics {'active' : cells changed per pass}.
+    """
+    rfun = np.array(ffun, dtype=float)
+    nj, ni = rfun.shape
+
+    ftol = rfun.min() * np.sqrt(np.finfo(float).eps)
+
+    dx = spacing(x) * dfdx
+    dy = spacing(y) * dfdx
+    sx = np.append(0., np.cumsum(dx))
+    dxy = np.hypot(dx[None, :], dy[:, None]) # (nj - 1, ni - 1) diagonals
+
+    stats = {'active' : []}
+
+    flag = False
+    for i in range(1, imax):
+
+        old = rfun.copy()
+
+        rfun[0] = sweep_row(rfun[0], sx)
+        for order in (range(1, nj), range(nj - 2, -1, -1)):
+            for j in order:
+                k = j - 1 if order.step == 1 else j + 1 # previous row
+                jd = min(j, k) # index of the spacings between the rows
+                row = np.minimum(rfun[j], rfun[k] + dy[jd])
+                row[1:] = np.minimum(row[1:], rfun[k, :-1] + dxy[jd])
+                row[:-1] = np.minimum(row[:-1], rfun[k, 1:] + dxy[jd])
+                rfun[j] = sweep_row(row, sx)
+
+        nactive = int((old - rfun > ftol).sum())
+        stats['active'].append(nactive)
+
+        if nactive == 0:
+            flag = True
+            break
+
+    logger.debug('limgrad_grid: {} passes, active cells per pass {}'.format(len(stats['active']), stats['active']))
+
+    return rfun, flag, stats
@@ -15,6 +15,10 @@ import xml.dom.minidom as md
 from shutil import copy2
 import subprocess
 import sys
+import traceback
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pkg_resources
 import json
 from collections import OrderedDict
@@ -35,7 +39,13 @@ import pyPoseidon.dem as pdem
 from pyPoseidon.utils.get_value import get_value
 from pyPoseidon.utils.converter import myconverter
 from pyPoseidon.utils import obs
-from pyPoseidon.utils.cpoint import closest_node
+import pyPoseidon.utils.global2local as gl
+import pyPoseidon.utils.combine as cb
+import pyPoseidon.utils.topology as tp
+import pyPoseidon.utils.cache as pcache
+import pyPoseidon.utils.encoding as enc
+import pyPoseidon.utils.virtual as vr
+import pyPoseidon.utils.staout as staout
 
 import logging
 logger = logging.getLogger('pyPoseidon')
@@ -43,6 +53,9 @@ logger = logging.getLogger('pyPoseidon')
 #retrieve the module path
 #DATA_PATH = pkg_resources.resource_filename('pyPoseidon', 'misc')
 DATA_PATH = os.path.dirname(pyPoseidon.__file__)+'/misc/'    
+
+# size (MB) of the mesh topology cache, see schism.ugrid
+TOPOLOGY_CACHE_SIZE = 1024
         
 class schism():
      
@@ -441,26 +454,14 @@ class schism():
         
         
         if hasattr(self, 'manfile') :
-            copyfile(self.manfile, manfile) #copy original grid file
-            if self.manfile == manfile:
+            if os.path.abspath(self.manfile) == os.path.abspath(manfile):
                 logger.info('Keeping manning file ..\n')
+            else:
+                copyfile(self.manfile, manfile) #copy original grid file
         
         
         if hasattr(self, 'manning') :
-            nn = self.grid.Dataset.nSCHISM_hgrid_node.size
-            n3e = self.grid.Dataset.nSCHISM_hgrid_face.size
-        
-            with open(manfile,'w') as f:
-                f.write('\t 0 \n')
-                f.write('\t {} {}\n'.format(n3e,nn))
-                
-            df = self.grid.Dataset[['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y','depth']].to_dataframe()
-                
-            df['man'] = self.manning
-            
-            df.index = np.arange(1, len(df) + 1)
-                
-            df.to_csv(manfile,index=True, sep='\t', header=None,mode='a', float_format='%.10f',columns=['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y','man'] )
+            self.grid.to_property(manfile, self.manning)
             
             logger.info('Manning file created..\n')
                 
@@ -470,22 +471,13 @@ class schism():
         windfile=path+'windrot_geo2proj.gr3'
 
         if hasattr(self, 'windproj') :
-            copyfile(self.windproj, windfile) #copy original grid file
-            if self.windproj != windproj :
+            if os.path.abspath(self.windproj) == os.path.abspath(windfile) :
                 logger.info('Keeping windproj file ..\n')
+            else:
+                copyfile(self.windproj, windfile) #copy original grid file
 
         if hasattr(self, 'windrot') :
-            with open(windfile,'w') as f:
-                f.write('\t 0 \n')
-                f.write('\t {} {}\n'.format(n3e,nn))
-                    
-            df = self.grid.Dataset[['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y','depth']].to_dataframe()
-               
-            df['windrot'] = self.windrot
-            
-            df.index = np.arange(1, len(df) + 1)
-        
-            df.to_csv(windfile,index=True, sep='\t', header=None,mode='a', float_format='%.10f',columns=['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y','windrot'] )
+            self.grid.to_property(windfile, self.windrot)
                 
             logger.info('Windrot_geo2proj file created..\n')
             
@@ -544,12 +536,20 @@ class schism():
                                     
         ncores = get_value(self,kwargs,'ncores',1)
         
+        watch = get_value(self,kwargs,'watch',False) # combine the output stacks while the model runs
+        
         #--------------------------------------------------------------------- 
         logger.info('executing model\n')
         #--------------------------------------------------------------------- 
 
             # note that cwd is the folder where the executable is
         ex=subprocess.Popen(args=['./launchSchism.sh'], cwd=calc_dir, shell=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=1)
+        
+        if watch :
+            stop = threading.Event()
+            wkwargs = {k:v for k,v in kwargs.items() if k != 'ncores'} # ncores of the model is not the combine pool
+            watcher = threading.Thread(target=self.watch, kwargs={**wkwargs, 'stop':stop})
+            watcher.start()
             
         with open(calc_dir+'err.log', 'w') as f: 
           for line in iter(ex.stderr.readline,b''): 
@@ -563,6 +563,11 @@ class schism():
             logger.info(line.decode(sys.stdout.encoding))
         ex.stdout.close()         
         
+        if watch :
+            ex.wait()
+            stop.set() # last pass over the remaining stacks
+            watcher.join()
+        
         #--------------------------------------------------------------------- 
         logger.info('FINISHED\n')
         #--------------------------------------------------------------------- 
@@ -630,7 +635,7 @@ class schism():
                 pass
             
         self.params = params.set_index('attrs')
-        self.grid = pgrid.grid(type='tri2d',grid_file=hfile)
+        self.grid = pgrid.grid(type='tri2d',grid_file=hfile, **{k : kwargs[k] for k in ['cache','cache_dir','grid_cache_size'] if k in kwargs})
         
         #meteo 
         ma = []
@@ -651,181 +656,72 @@ class schism():
     def global2local(self,**kwargs):
         
         path = get_value(self,kwargs,'rpath','./') 
+        cache = get_value(self,kwargs,'g2l_cache',True)
                     
-        #Read the global node index distribution to the cores
-        gfiles = glob.glob(path+'outputs/local_to_global_*')
-        gfiles.sort()
+        #Read the global node index distribution to the cores (cached in outputs/global2local.npz)
+        g2l = gl.read(path, cache=cache)
         
-        #create a dict from filenames to identify parts in the dataframes below
-        keys=[]
-        for name in gfiles:
-            keys.append('core{}'.format(name.split('/')[-1].split('_')[-1]))
-
-        # Parsing the files
-        l2g=[]
-        for i in range(len(gfiles)):
-            l2g.append(pd.read_csv(gfiles[i],header=None,delim_whitespace=True,engine='python'))
+        self.misc.update({'g2l' : g2l})
+        self.misc.update({'sindex' : cb.index(g2l)}) # gather/scatter arrays used in combining
+        
+        keys = g2l['keys']
 
         # We read from the first file the header (it is the same for all)
-        header = l2g[0].iloc[0]
-        header.index = ['ns_global','ne_global','np_global','nvrt','nproc','ntracers','T','S','GEN','AGE','SED3D','EcoSim','ICM','CoSINE','Feco','TIMOR','FABM']
-
-        #get the number of elems from all files
-        nels = []
-        for i in range(len(l2g)):
-            nels.append(int(l2g[i].iloc[2].dropna()[0]))
-
-        frames = []
-        for i in range(len(l2g)):
-            df = l2g[i].iloc[3:nels[i]+3,l2g[i].columns[:2]].astype(int)
-            df = df.reset_index(drop=True)
-            frames.append(df)
-
-        elems = pd.concat(frames,keys=keys)
-
-        elems.columns = ['local','global_n']
+        h0 = pd.Series(g2l['h0'], index = ['start_year','start_month','start_day','start_hour','utc_start'])
 
-        #get the number of nodes from all files
-        nq= []
-        for i in range(len(l2g)):
-            nq.append(int(l2g[i].iloc[nels[i]+3].dropna()[0]))
-
-        nframes = []
-        for i in range(len(l2g)):
-            df = l2g[i].iloc[nels[i]+4:nels[i]+4+nq[i],l2g[i].columns[:2]].astype(int)
-            df = df.reset_index(drop=True)
-            nframes.append(df)
-
-        nodes = pd.concat(nframes,keys=keys)
-
-        nodes.columns = ['local','global_n']
-
-        #get the number of nodes from all files
-        nw= []
-        for i in range(len(l2g)):
-            j = nels[i]+4+nq[i]
-            nw.append(int(l2g[i].iloc[j].dropna()[0]))
-            
-        wframes = []
-        for i in range(len(l2g)):
-            j0 = nels[i]+5+nq[i]
-            j1 = j0+nw[i]
-            df = l2g[i].iloc[j0:j1,l2g[i].columns[:2]].astype(int)
-            df = df.reset_index(drop=True)
-            wframes.append(df)
-
-        re = pd.concat(wframes,keys=keys)
-
-        re.columns = ['local','global_n']
-
-        # Read secondary headers
-        h0 = l2g[0].iloc[nels[0] + nq[0] + nw[0] + 6].dropna()
-        h0.index = ['start_year','start_month','start_day','start_hour','utc_start']
-
-        h1 = l2g[0].iloc[nels[0] + nq[0] + nw[0] + 7].dropna()
-        h1.index = ['nrec','dtout','nspool','nvrt','kz','h0','h_s','h_c','theta_b','theta_f','ics']
-        h1 = h1.apply(pd.to_numeric)
+        h1 = pd.Series(g2l['h1'], index = ['nrec','dtout','nspool','nvrt','kz','h0','h_s','h_c','theta_b','theta_f','ics'])
 
         ztots = ['ztot_'+str(i) for i in range(1,h1.kz.astype(int)-1)]
 
         sigmas = ['sigma_'+str(i) for i in range(h1.nvrt.astype(int) - h1.kz.astype(int) + 1) ]
 
-        h2 = l2g[0].iloc[nels[0] + nq[0] + nw[0] + 8].dropna()
-        h2.index = ztots + sigmas
+        h2 = pd.Series(g2l['h2'], index = ztots + sigmas)
 
         #combine headers
         self.misc.update({'header' : pd.concat([h0, h1, h2])})
 
-        #Read grid
-        gframes = []
-        for i in range(len(l2g)):
-            j0 = nels[i] + nq[i] + nw[i] + 10
-            j1 = j0+nq[i]
-            df = l2g[i].iloc[j0:j1,l2g[i].columns[:4]].astype(float)
-            df = df.reset_index(drop=True)
-            gframes.append(df)
-
-        grid = pd.concat(gframes,keys=keys)
-
-        grid.columns = ['lon','lat','depth','kbp00']
-
-        #Droping duplicates
-        cnodes = nodes.global_n.drop_duplicates() # drop duplicate global nodes and store the values to an array
-        grid = grid.drop_duplicates() # keep only one of the duplicates (the first by default)
-        grid.index = grid.index.droplevel() # drop multi-index
-        grid = grid.reset_index(drop=True) # reset index
-        grid.index = cnodes.values - 1 # reindex based on the global index, -1 for the python convention
-        grd = grid.sort_index() #sort with the new index (that is the global_n)
-        self.misc.update({'grd' : grd.reset_index(drop=True)})#reindex for final version
-
-        #Read tessalation
-        eframes = []
-        for i in range(len(l2g)):
-            j0 = nels[i] + nq[i] + nw[i] + 10 + nq[i]
-            j1 = j0+nels[i]
-            df = l2g[i].iloc[j0:j1,l2g[i].columns[:4]].astype(int)
-            df = df.reset_index(drop=True)
-            eframes.append(df)
-
-        tri = pd.concat(eframes,keys=keys)
-
-        tri.columns = ['type','a','b','c']
-
-        # Replace local index with the global one 
-        for key in keys:
-            nod = nodes.loc[key].copy() # make a copy of the the core
-            nod = nod.set_index('local') # reset the index using the local values (in essense set the index to start from 1...)
-            tri.loc[key,'ga'] = nod.reindex(tri.loc[key,'a'].values).values
-            tri.loc[key,'gb'] = nod.reindex(tri.loc[key,'b'].values).values
-            tri.loc[key,'gc'] = nod.reindex(tri.loc[key,'c'].values).values 
-        
-        tri.loc[:,'ga'] = tri.loc[:,'ga'].apply(pd.to_numeric(int)) # make integer
-        tri.loc[:,'gb'] = tri.loc[:,'gb'].apply(pd.to_numeric(int)) # make integer
-        tri.loc[:,'gc'] = tri.loc[:,'gc'].apply(pd.to_numeric(int)) # make integer
-        
-        tri = tri.drop(['a','b','c'],axis=1) #drop local references
-
-        #sort
-        gt3 = tri.loc[:,['ga','gb','gc']].copy() # make a copy
-        gt3.index = gt3.index.droplevel() # drop multi-index
-        gt3 = gt3.reset_index(drop=True)
-        # Now we need to put them in order based on the global index in elems
-        gt3.index = elems.global_n.values # we set the index equal to the global_n column
-        gt3 = gt3.sort_index() #sort them
+        #grid, sorted by the global index
+        grd = pd.DataFrame(g2l['grd'], columns=['lon','lat','depth','kbp00'])
+        self.misc.update({'grd' : grd})
+
+        #tessalation with global index (start index 1)
+        faces = g2l['face_nodes'][:,:3] + 1
+        egl = np.unique(g2l['elem_global'])
+        
+        gt3 = pd.DataFrame(faces, columns=['ga','gb','gc'])
+        gt3.insert(0, 'index', egl)
         
         #add nan column in place of the fourth node. NOTE:  This needs to be tested for quadrilaterals
         gt3['gd']=np.nan
         
-        gt3 = gt3.reset_index() # reset to add more columns without problems
-        
         ## Add mean x, y of the elememts. To be used in the output
-        gt3['x1'] = grd.loc[gt3['ga'].values - 1, 'lon'].values #lon of the index, -1 for python convention
-        gt3['y1'] = grd.loc[gt3['ga'].values - 1, 'lat'].values #lat of the index
-        gt3['x2'] = grd.loc[gt3['gb'].values - 1, 'lon'].values
-        gt3['y2'] = grd.loc[gt3['gb'].values - 1, 'lat'].values
-        gt3['x3'] = grd.loc[gt3['gc'].values - 1, 'lon'].values
-        gt3['y3'] = grd.loc[gt3['gc'].values - 1, 'lat'].values
-
+        lon = g2l['grd'][:,0]
+        lat = g2l['grd'][:,1]
+        kbp = g2l['grd'][:,3]
+        
+        for i in range(3):
+            gt3['x{}'.format(i+1)] = lon[faces[:,i] - 1] #lon of the index, -1 for python convention
+            gt3['y{}'.format(i+1)] = lat[faces[:,i] - 1] #lat of the index
 
-        gt3['xc'] =  gt3[['x1', 'x2', 'x3']].mean(axis=1) #mean lon of the element
-        gt3['yc'] =  gt3[['y1', 'y2', 'y3']].mean(axis=1)
+        gt3['xc'] = lon[faces - 1].mean(axis=1) #mean lon of the element
+        gt3['yc'] = lat[faces - 1].mean(axis=1)
 
         ## min kbe
-        gt3['kbe1'] = grd.loc[gt3['ga'] - 1,'kbp00'].values
-        gt3['kbe2'] = grd.loc[gt3['gb'] - 1,'kbp00'].values
-        gt3['kbe3'] = grd.loc[gt3['gc'] - 1,'kbp00'].values
-        #gt3['kbe4'] = grd.loc[gt3['gd'],'kbp00'].values
+        for i in range(3):
+            gt3['kbe{}'.format(i+1)] = kbp[faces[:,i] - 1]
 
-        gt3['kbe'] = gt3[['kbe1', 'kbe2', 'kbe3']].min(axis=1)
+        gt3['kbe'] = kbp[faces - 1].min(axis=1)
         
         self.misc.update({'gt3' : gt3.set_index('index')}) # set index back 
         
-        
-        
-        #Droping duplicates
-        self.misc.update({'melems' : elems.loc[elems.global_n.drop_duplicates().index]}) # create the retaining mask
-        self.misc.update({'msides' : re.loc[re.global_n.drop_duplicates().index]}) # keep only one of the duplicates
-        self.misc.update({'mnodes' : nodes.loc[nodes.global_n.drop_duplicates().index]}) # keep only one of the duplicates
+        #Droping duplicates, keep the first occurrence of each global index
+        for loc, name in zip(gl.LOCATIONS, ['melems','mnodes','msides']):
+            offsets = g2l[loc + '_offsets']
+            idx = np.sort(gl.first_occurrence(g2l[loc + '_global'])) # retaining mask
+            core = np.searchsorted(offsets, idx, side='right') - 1
+            mindex = pd.MultiIndex.from_arrays([keys[core], idx - offsets[core]])
+            df = pd.DataFrame({'local' : g2l[loc + '_local'][idx], 'global_n' : g2l[loc + '_global'][idx]}, index = mindex)
+            self.misc.update({name : df})
                 
     
     def hotstart(self, it=None, **kwargs):
@@ -837,83 +733,27 @@ class schism():
         hfiles = glob.glob(path+'outputs/hotstart_*_{}.nc'.format(it))
         hfiles.sort()
 
-        #store them in a list
-        out=[]
-        for i in range(len(hfiles)):
-            out.append(xr.open_dataset(hfiles[i]))
-
-        # Create dataset      
-        side=[]
-        node=[]
-        el=[]
-        one=[]
-
-        for key in out[0].variables:
-            if 'nResident_side' in out[0][key].dims : 
-                r = self.combine_(key,out,self.misc['msides'],'nResident_side')       
-                side.append(r)
-            elif 'nResident_node' in out[0][key].dims : 
-                r = self.combine_(key,out,self.misc['mnodes'],'nResident_node')
-                node.append(r)
-            elif 'nResident_elem' in out[0][key].dims : 
-                r = self.combine_(key,out,self.misc['melems'],'nResident_elem')
-                el.append(r)
-            elif len(out[0][key].dims) == 1:
-                one.append(out[0][key])
-        
+        memory = get_value(self,kwargs,'hotstart_memory',1024) # MB
         
-        side = xr.merge(side).rename({'nResident_side':'side'})
-        el = xr.merge(el).rename({'nResident_elem':'elem'})
-        node = xr.merge(node).rename({'nResident_node':'node'})
-        one = xr.merge(one).rename({'one':'one_new','it':'iths'})
-        
-        #merge
-        xdat = xr.merge([side,el,node,one])
+        with xr.open_dataset(hfiles[0]) as ds:
+            iths = ds['iths' if 'iths' in ds.variables else 'it'].values[0]
                             
-        hfile = 'hotstart_it={}.nc'.format(xdat.iths.values[0])
+        hfile = 'hotstart_it={}.nc'.format(iths)
         logger.info('saving hotstart file\n')
 
-        xdat.to_netcdf(path + 'outputs/{}'.format(hfile))
+        # stream the variables from the cores to the file
+        cb.hotstart(hfiles, self.misc['sindex'], path + 'outputs/{}'.format(hfile), memory=memory)
 
 
 
     ## Any variable
-    def combine(self, out, g2l, name):
-        keys = g2l.index.get_level_values(0).unique()
-        r=[]
-        for i in range(len(out)):    
-            v = out[i].to_pandas()
-            v.index += 1   
-            mask = g2l.loc[keys[i],'local']
-            vm = v.loc[mask]
-            vm.index = g2l.loc[keys[i],'global_n'].values
-            r.append(vm)
-        r = pd.concat(r).sort_index()
-        r.index -= 1
-        r.index.name = name
-        return r
+    def combine(self, out, loc, axis=0):
+        return cb.combine(out, self.misc['sindex'][loc], axis=axis)
     
-    def combine_(self, var, out, g2l, name):
-        if len(out[0][var].shape) == 3:
-            dd = []
-            for i in range(out[0][var].shape[2]):
-                o = []
-                for j in range(len(out)):
-                    o.append(out[j][var].loc[{out[j][var].dims[2]:i}])
-                r = self.combine(o, g2l, name)
-                dd.append(xr.DataArray(r.values, dims = out[0][var].dims[:2], name=var))
-            
-            tr = xr.concat(dd,dim=out[0][var].dims[2])
-            a,b,c = out[0][var].dims
-            tr = tr.transpose(a,b,c)
-            return tr
-    
-        elif len(out[0][var].shape) < 3:
-            o = []
-            for j in range(len(out)):
-                o.append(out[j][var])
-            r = self.combine(o, g2l, name)
-            return(xr.DataArray(r.values, dims = list(out[0][var].dims), name=var))
+    def combine_(self, var, out, loc, name):
+        dims = out[0][var].dims
+        r = self.combine([o[var].values for o in out], loc, axis=dims.index(name))
+        return xr.DataArray(r, dims=list(dims), name=var)
 
 
 
@@ -927,12 +767,12 @@ class schism():
 
         for key in tfs[0].variables:
             if 'nSCHISM_hgrid_face' in tfs[0][key].dims : 
-                r = self.combine_(key,tfs,self.misc['melems'],'nSCHISM_hgrid_face')       
+                r = self.combine_(key,tfs,'elem','nSCHISM_hgrid_face')       
                 side.append(r)
             elif 'nSCHISM_hgrid_node' in tfs[0][key].dims : 
-                r = self.combine_(key,tfs,self.misc['mnodes'],'nSCHISM_hgrid_node')
+                r = self.combine_(key,tfs,'node','nSCHISM_hgrid_node')
                 node.append(r)
-            elif len(tfs[0][key].dims) == 1:
+            elif len([d for d in tfs[0][key].dims if d != 'time']) == 1:
                 single.append(tfs[0][key])
 
 
@@ -945,17 +785,35 @@ class schism():
         return xr.merge([side,el,node,single])
         
     
-    def tcombine(self, hfiles, sdate, times):
+    def tcombine(self, hfiles, sdate, times, mode='block'):
     
-        xall=[]
-        for k in range(times.shape[0]):
-            tfs=[]
-            for i in range(len(hfiles)):
-                tfs.append(xr.open_dataset(hfiles[i]).isel(time=k))
-
-            xall.append(self.xcombine(tfs))
+        if mode == 'step':
+            # one timestep at a time, reopening every core file
+            xall=[]
+            for k in range(times.shape[0]):
+                tfs=[]
+                for i in range(len(hfiles)):
+                    tfs.append(xr.open_dataset(hfiles[i]).isel(time=k))
+
+                xall.append(self.xcombine(tfs))
     
-        xdat = xr.concat(xall,dim='time')
+            xdat = xr.concat(xall,dim='time')
+            xdat = xdat.assign_coords(time=times)
+
+            return xdat
+        
+        # open every core file once and combine each variable over all timesteps in one block
+        tfs = [xr.open_dataset(x) for x in hfiles]
+        
+        xdat = self.xcombine(tfs).load()
+        
+        for f in tfs: f.close()
+
+        # static variables are repeated along time, as in the per timestep concatenation
+        for key in xdat.data_vars:
+            if 'time' not in xdat[key].dims:
+                xdat[key] = xdat[key].expand_dims(time=times.size)
+        
         xdat = xdat.assign_coords(time=times)
 
         return xdat
@@ -964,6 +822,7 @@ class schism():
         
     
     #https://stackoverflow.com/questions/41164630/pythonic-way-of-removing-reversed-duplicates-in-list
+    #kept for the API, ugrid uses the vectorized utils.topology.edges
     @staticmethod
     def remove_reversed_duplicates(iterable):
         # Create a set for already seen elements
@@ -1018,71 +877,98 @@ class schism():
         
         
         
-    def results(self,**kwargs):
+    def ugrid(self, **kwargs):
+        """UGRID node, element and edge variables of the combined mesh.
         
-        path = get_value(self,kwargs,'rpath','./') 
+        With cache=True (see utils.cache) the topology is kept in <cache_dir>/topology, keyed on a
+        hash of the mesh, so that it is reused by every run folder on the same mesh.
+        """
         
-        if not hasattr(self, 'melems'): 
-            logger.info('retrieving index references ... \n')
-            self.global2local(**kwargs)
-            logger.info('... done \n')
+        use_cache = get_value(self,kwargs,'cache',pcache.CACHE)
+        
+        grd = self.misc['g2l']['grd']
+        faces = self.misc['g2l']['face_nodes'][:,:3] # start index = 0 
+        
+        lon, lat, depth = grd[:,0], grd[:,1], grd[:,2]
+        kbp = grd[:,3].astype(int)
+        
+        if use_cache:
+            folder = pcache.cache_dir(get_value(self,kwargs,'cache_dir',None), 'topology')
+            tfile = os.path.join(folder, 'topology_{}.nc'.format(pcache.digest(grd, faces)))
             
-        # Create grid xarray Dataset
-        grd = self.misc['grd']
-        gt3 = self.misc['gt3']
+            topo = pcache.load(tfile)
+            if topo is not None:
+                logger.info('loading mesh topology from {}\n'.format(tfile))
+                xnodes = topo[['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y','depth','node_bottom_index']]
+                xelems = topo[['SCHISM_hgrid_face_nodes','SCHISM_hgrid_face_x','SCHISM_hgrid_face_y','ele_bottom_index']]
+                xsides = topo[['SCHISM_hgrid_edge_nodes','SCHISM_hgrid_edge_x','SCHISM_hgrid_edge_y','edge_bottom_index']]
+                return xnodes, xelems, xsides
         
         # node based variables
-        grd.kbp00 = grd.kbp00.astype(int)
-        xnodes = grd.to_xarray().rename({'lon':'SCHISM_hgrid_node_x','lat':'SCHISM_hgrid_node_y','kbp00':'node_bottom_index', 'index':'nSCHISM_hgrid_node'})
-
-        xnodes = xnodes.drop('nSCHISM_hgrid_node')
+        xnodes = xr.Dataset({
+                         u'SCHISM_hgrid_node_x' : ([u'nSCHISM_hgrid_node'], lon),
+                         u'SCHISM_hgrid_node_y' : ([u'nSCHISM_hgrid_node'], lat),
+                         u'depth' : ([u'nSCHISM_hgrid_node'], depth),
+                         u'node_bottom_index' : ([u'nSCHISM_hgrid_node'], kbp)})
 
         # element based variables
-        gt34 = gt3.loc[:,['ga','gb','gc']].values # SCHISM_hgrid_face_nodes
         xelems = xr.Dataset({
-                         u'SCHISM_hgrid_face_nodes' : ([u'nSCHISM_hgrid_face', u'nMaxSCHISM_hgrid_face_nodes'], gt34 - 1),  #-> start index = 0 
-                         u'SCHISM_hgrid_face_x' : ([u'nSCHISM_hgrid_face'], gt3.loc[:,'xc'].values),
-                         u'SCHISM_hgrid_face_y' : ([u'nSCHISM_hgrid_face'], gt3.loc[:,'yc'].values),                 
-                         u'ele_bottom_index': ([u'nSCHISM_hgrid_face'], gt3.kbe.values )})
+                         u'SCHISM_hgrid_face_nodes' : ([u'nSCHISM_hgrid_face', u'nMaxSCHISM_hgrid_face_nodes'], faces),
+                         u'SCHISM_hgrid_face_x' : ([u'nSCHISM_hgrid_face'], lon[faces].mean(axis=1)),
+                         u'SCHISM_hgrid_face_y' : ([u'nSCHISM_hgrid_face'], lat[faces].mean(axis=1)),                 
+                         u'ele_bottom_index': ([u'nSCHISM_hgrid_face'], grd[:,3][faces].min(axis=1))})
 
         logger.info('done with node based variables \n')
         
-        # edge based variables
-        sides=[]
-        for [ga,gb,gc] in gt3.loc[:,['ga','gb','gc']].values:
-            sides.append([gb,gc])
-            sides.append([gc,ga])
-            sides.append([ga,gb])
-
-        #removing duplicates
-        sides = list(self.remove_reversed_duplicates(sides))    
-            
-        ed = pd.DataFrame(sides, columns=['node1','node2'])
-
-        #mean x, y 
-        ed['x1'] = grd.loc[ed['node1'].values - 1, 'lon'].values #lon of the index, -1 for python convention
-        ed['y1'] = grd.loc[ed['node1'].values - 1, 'lat'].values #lat of the index
-        ed['x2'] = grd.loc[ed['node2'].values - 1, 'lon'].values
-        ed['y2'] = grd.loc[ed['node2'].values - 1, 'lat'].values
- 
-        ed['xc'] =  ed[['x1', 'x2']].mean(axis=1) #mean of the edge index
-        ed['yc'] =  ed[['y1', 'y2']].mean(axis=1)
-
-        ## min bottom index
-        ed['kbs1'] = grd.loc[ed['node1'] - 1,'kbp00'].values
-        ed['kbs2'] = grd.loc[ed['node2'] - 1,'kbp00'].values
-
-        ed['kbs'] = ed[['kbs1', 'kbs2']].min(axis=1)
-        
-        
+        # edge based variables, unique sorted pairs in order of appearance
+        sides = tp.edges(faces)
 
         xsides = xr.Dataset({
-                         u'SCHISM_hgrid_edge_nodes' : ([u'nSCHISM_hgrid_edge', u'two'], [[x-1,y-1] for [x,y] in sides]), # index from 0
-                         u'SCHISM_hgrid_edge_x' : ([u'nSCHISM_hgrid_edge'], ed['xc'].values),
-                         u'SCHISM_hgrid_edge_y' : ([u'nSCHISM_hgrid_edge'], ed['yc'].values ),
-                         u'edge_bottom_index' : ([u'nSCHISM_hgrid_edge'], ed.kbs.values)})                 
+                         u'SCHISM_hgrid_edge_nodes' : ([u'nSCHISM_hgrid_edge', u'two'], sides), # index from 0
+                         u'SCHISM_hgrid_edge_x' : ([u'nSCHISM_hgrid_edge'], lon[sides].mean(axis=1)),
+                         u'SCHISM_hgrid_edge_y' : ([u'nSCHISM_hgrid_edge'], lat[sides].mean(axis=1)),
+                         u'edge_bottom_index' : ([u'nSCHISM_hgrid_edge'], kbp[sides].min(axis=1))})                 
 
         logger.info('done with side based variables \n')
+        
+        if use_cache:
+            pcache.save(xr.merge([xnodes,xelems,xsides]), tfile, max_size=get_value(self,kwargs,'topology_cache_size',TOPOLOGY_CACHE_SIZE))
+        
+        return xnodes, xelems, xsides
+    
+    
+    def results(self,**kwargs):
+        """Combine the per core output stacks into outputs/schout_<stack>.nc (and the zarr store).
+        
+        The stacks are combined independently. Failed stacks are logged and then a RuntimeError is
+        raised, before anything is appended to the zarr store. With raise_errors=False (the default
+        in incremental mode, used by watch) the others are kept and the failures are returned as
+        {stack : traceback}, empty when all succeeded. The zarr store is appended in stack order up
+        to the first stack not combined, the later ones follow once it is retried.
+        """
+        
+        path = get_value(self,kwargs,'rpath','./') 
+        combine_mode = get_value(self,kwargs,'combine_mode','block') # 'block' or 'step' (per timestep)
+        ncores = kwargs.get('ncores', 1) # processes combining the output stacks, not the model cores
+        incremental = get_value(self,kwargs,'incremental',False) # skip stacks already combined
+        stacks = kwargs.get('stacks', None) # combine only these stacks
+        raise_errors = kwargs.get('raise_errors', not incremental) # fail on any stack, else report them
+        
+        # output encoding
+        output = {'zlib' : get_value(self,kwargs,'zlib',False),
+                  'complevel' : get_value(self,kwargs,'complevel',4),
+                  'shuffle' : get_value(self,kwargs,'shuffle',True),
+                  'access' : get_value(self,kwargs,'chunking',None), # 'map' or 'station'
+                  'digits' : get_value(self,kwargs,'digits',None)} # significant digits kept
+        store = get_value(self,kwargs,'zarr',None) # Zarr store appended with every stack
+        
+        if not 'melems' in self.misc: 
+            logger.info('retrieving index references ... \n')
+            self.global2local(**kwargs)
+            logger.info('... done \n')
+            
+        # Create grid xarray Dataset
+        xnodes, xelems, xsides = self.ugrid(**kwargs)
 
         # General properties
         
@@ -1125,8 +1011,9 @@ class schism():
         date = header2.loc[:,['start_year','start_month','start_day','start_hour','utc_start']]
         date = date.astype(int)
         date.columns=['year','month','day','hour','utc'] # rename the columns
-        #set the start timestamp
-        sdate = pd.Timestamp(year=date.year.values[0], month=date.month.values[0], day=date.day.values[0], hour=date.hour.values[0], tz=date.utc.values[0])
+        #set the start timestamp, python ints (pd.Timestamp rejects numpy ints as tz)
+        year, month, day, hour, utc = [int(x) for x in date.iloc[0]]
+        sdate = pd.Timestamp(year=year, month=month, day=day, hour=hour, tz=utc)
 
         logger.info('done with generic variables \n')
         
@@ -1135,120 +1022,264 @@ class schism():
         
         irange = [int(x.split('_')[-1].split('.')[0]) for x in hfiles]
         irange = np.unique(irange)
+        allstacks = list(irange)
+        
+        if stacks is not None:
+            irange = [val for val in irange if val in stacks]
+        
+        if incremental:
+            skip = [val for val in irange if self.is_combined(path, val)]
+            if skip : logger.info('skipping up to date output stacks {}\n'.format(skip))
+            irange = [val for val in irange if val not in skip]
+        
+        self.read_vgrid(**kwargs) # read grid attributes
+        
+        
+        static = {'gen':gen, 'xnodes':xnodes, 'xelems':xelems, 'xsides':xsides, 'header2':header2, 'date':date, 'sdate':sdate, 'output':output}
+        
+        # the stacks are independent, errors are gathered per stack
+        errors = {}
+        
+        if ncores > 1 and len(irange) > 1:
+            # only the index references and the vgrid attributes are needed by the workers
+            slim = self.__class__.__new__(self.__class__)
+            slim.misc = {k : self.misc[k] for k in ['sindex','hs','h_c','theta_b','theta_f']}
+            
+            # fork shares the index references read-only with the workers
+            ctx = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+            
+            with ProcessPoolExecutor(max_workers=ncores, mp_context=ctx, initializer=_init_stack_worker, initargs=(slim, path, static, combine_mode)) as pool:
+                futures = {pool.submit(_results_stack, val) : val for val in irange}
+                for future in as_completed(futures):
+                    try:
+                        val, err = future.result()
+                    except Exception as e:
+                        val, err = futures[future], repr(e)
+                    if err : errors[val] = err
+        
+        else:
+            for val in irange:
+                try:
+                    self.results_stack(val, path, static, combine_mode)
+                except Exception:
+                    errors[val] = traceback.format_exc()
+
+        for val in sorted(errors):
+            logger.error('combining output stack {} failed\n{}\n'.format(val, errors[val]))
+        
+        if errors and raise_errors:
+            raise RuntimeError('combining output stacks {} failed, see the log'.format(sorted(errors)))
+        
+        if store:
+            # appended strictly in order, up to the first stack not combined (yet). The stacks
+            # skipped as up to date are passed too, append_zarr keeps only the times after the store
+            opts = {k : output[k] for k in ['zlib','complevel','shuffle','access']}
+            for val in sorted(set(allstacks)):
+                if val in errors or not self.is_combined(path, val):
+                    logger.warning('output stack {} not combined, it and the next stacks are appended to {} later\n'.format(val, store))
+                    break
+                with xr.open_dataset(path+'outputs/schout_{}.nc'.format(val)) as ds:
+                    enc.append_zarr(ds, store, **opts)
+            logger.info('appended output stacks to {}\n'.format(store))
+        
+        logger.info('done with output netCDF files \n')
         
+        return errors
+    
+    
+    @staticmethod
+    def is_combined(path, val):
+        # the combined file is newer than all of its per core inputs
+        cfile = path+'outputs/schout_{}.nc'.format(val)
+        if not os.path.exists(cfile) : return False
+        hfiles = glob.glob(path+'outputs/schout_*_{}.nc'.format(val))
+        return os.path.getmtime(cfile) >= max([os.path.getmtime(x) for x in hfiles])
+    
+    
+    @staticmethod
+    def completed_stacks(path, final=False):
+        # stacks flushed by every core. A core closes a stack before it starts the next one,
+        # while the last stack is complete only when the run is over (final)
+        nproc = len(glob.glob(path+'outputs/local_to_global_*'))
+        if nproc == 0 : return []
+        
+        hfiles = glob.glob(path+'outputs/schout_*_*.nc')
+        counts = pd.Series([int(x.split('_')[-1].split('.')[0]) for x in hfiles], dtype=int).value_counts()
+        
+        return sorted([val for val, n in counts.items() if n == nproc and (final or counts.get(val + 1, 0) == nproc)])
+    
+    
+    def watch(self, stop=None, **kwargs):
+        """Combine the output stacks as soon as all the cores have flushed them.
+        
+        Polls the outputs folder every watch_interval seconds until stop is set, then makes a last pass
+        that includes the final stack. Without stop a single pass over the completed stacks is made.
+        """
         
-        self.read_vgrid() # read grid attributes
+        path = get_value(self,kwargs,'rpath','./') 
+        interval = get_value(self,kwargs,'watch_interval',60)
         
+        kwargs = {k:v for k,v in kwargs.items() if k not in ['stacks','incremental','raise_errors']}
         
-#        total_xdat = []
-        for val in irange:
-            hfiles=glob.glob(path+'outputs/schout_*_{}.nc'.format(val))
-            hfiles.sort()
+        done = set()
+        while True:
+            final = stop is not None and stop.is_set()
             
-            times = xr.open_dataset(hfiles[0]).time
-            times = pd.to_datetime(times.values, unit='s',
-                       origin=sdate.tz_convert(None))
+            stacks = [val for val in self.completed_stacks(path, final) if val not in done]
             
-            if times.size == 0 : continue
+            if stacks:
+                logger.info('combining output stacks {}\n'.format(stacks))
+                try:
+                    errors = self.results(stacks=stacks, incremental=True, raise_errors=False, **kwargs)
+                    done.update([val for val in stacks if val not in errors])
+                except Exception as e:
+                    logger.warning('combining output stacks {} failed, retrying: {}\n'.format(stacks, e))
             
-            idat = self.tcombine(hfiles,sdate, times)
-                    
-            #MERGE
+            if final or stop is None : break
+            
+            stop.wait(interval)
+    
+    
+    def virtual(self, **kwargs):
+        """Lazy global Dataset over the per core output files, without combining them.
+        
+        Selections in time and in global node/element/edge indices read only the files and
+        points they need. virtual_points sets the global points per chunk.
+        """
+        
+        path = get_value(self,kwargs,'rpath','./') 
+        points = get_value(self,kwargs,'virtual_points',vr.POINTS)
+        
+        if not 'melems' in self.misc: self.global2local(**kwargs)
+        
+        xnodes, xelems, xsides = self.ugrid(**kwargs)
+        
+        header = self.misc['header'].apply(pd.to_numeric)
+        date = [int(header[x]) for x in ['start_year','start_month','start_day','start_hour','utc_start']]
+        sdate = pd.Timestamp(year=date[0], month=date[1], day=date[2], hour=date[3], tz=date[4])
+        
+        # the mesh comes from the global grid
+        drop = [x for d in [xnodes, xelems, xsides] for x in d.data_vars]
+        
+        ds = vr.dataset(path, self.misc['sindex'], sdate=sdate, points=points, drop=drop)
+        
+        return xr.merge([ds, xnodes, xelems, xsides])
+    
+    
+    def results_stack(self, val, path, static, combine_mode='block'):
+        
+        gen, xnodes, xelems, xsides = static['gen'], static['xnodes'], static['xelems'], static['xsides']
+        header2, date, sdate = static['header2'], static['date'], static['sdate']
+        
+        hfiles=glob.glob(path+'outputs/schout_*_{}.nc'.format(val))
+        hfiles.sort()
+        
+        with xr.open_dataset(hfiles[0]) as ds:
+            times = ds.time
+        times = pd.to_datetime(times.values, unit='s',
+                   origin=sdate.tz_convert(None))
+        
+        if times.size == 0 : return
+        
+        idat = self.tcombine(hfiles,sdate, times, mode=combine_mode)
                 
-            xc = xr.merge([idat,gen,xnodes,xelems,xsides])
-
-            #Choose attrs
-            if header2.ics.values == 1:
-                lat_coord_standard_name = 'projection_y_coordinate'
-                lon_coord_standard_name = 'projection_x_coordinate'
-                x_units = 'm'
-                y_units = 'm'
-                lat_str_len = 23
-                lon_str_len = 23
-            else:
-                lat_coord_standard_name = 'latitude'
-                lon_coord_standard_name = 'longitude'
-                x_units = 'degrees_east'
-                y_units = 'degrees_north'
-                lat_str_len = 8
-                lon_str_len = 9
+        #MERGE
             
-            #set Attrs
-            xc.SCHISM_hgrid_node_x.attrs = {'long_name' : 'node x-coordinate', 'standard_name' : lon_coord_standard_name , 'units' : x_units, 'mesh' : 'SCHISM_hgrid'}
+        xc = xr.merge([idat,gen,xnodes,xelems,xsides])
+
+        #Choose attrs
+        if header2.ics.values == 1:
+            lat_coord_standard_name = 'projection_y_coordinate'
+            lon_coord_standard_name = 'projection_x_coordinate'
+            x_units = 'm'
+            y_units = 'm'
+            lat_str_len = 23
+            lon_str_len = 23
+        else:
+            lat_coord_standard_name = 'latitude'
+            lon_coord_standard_name = 'longitude'
+            x_units = 'degrees_east'
+            y_units = 'degrees_north'
+            lat_str_len = 8
+            lon_str_len = 9
+        
+        #set Attrs
+        xc.SCHISM_hgrid_node_x.attrs = {'long_name' : 'node x-coordinate', 'standard_name' : lon_coord_standard_name , 'units' : x_units, 'mesh' : 'SCHISM_hgrid'}
 
-            xc.SCHISM_hgrid_node_y.attrs = {'long_name' : 'node y-coordinate', 'standard_name' : lat_coord_standard_name , 'units' : y_units, 'mesh' : 'SCHISM_hgrid'}
+        xc.SCHISM_hgrid_node_y.attrs = {'long_name' : 'node y-coordinate', 'standard_name' : lat_coord_standard_name , 'units' : y_units, 'mesh' : 'SCHISM_hgrid'}
 
-            xc.depth.attrs = {'long_name' : 'Bathymetry', 'units' : 'meters', 'positive' : 'down', 'mesh' : 'SCHISM_hgrid', 'location' : 'node'}
+        xc.depth.attrs = {'long_name' : 'Bathymetry', 'units' : 'meters', 'positive' : 'down', 'mesh' : 'SCHISM_hgrid', 'location' : 'node'}
 
-            xc.sigma_h_c.attrs = {'long_name' : 'ocean_s_coordinate h_c constant', 'units' : 'meters', 'positive' : 'down'}
+        xc.sigma_h_c.attrs = {'long_name' : 'ocean_s_coordinate h_c constant', 'units' : 'meters', 'positive' : 'down'}
 
-            xc.sigma_theta_b.attrs = {'long_name' : 'ocean_s_coordinate theta_b constant'}
+        xc.sigma_theta_b.attrs = {'long_name' : 'ocean_s_coordinate theta_b constant'}
 
-            xc.sigma_theta_f.attrs = {'long_name' : 'ocean_s_coordinate theta_f constant'}
+        xc.sigma_theta_f.attrs = {'long_name' : 'ocean_s_coordinate theta_f constant'}
 
-            xc.sigma_maxdepth.attrs = {'long_name' : 'ocean_s_coordinate maximum depth cutoff (mixed s over z boundary)', 'units' : 'meters', 'positive' : 'down'}
+        xc.sigma_maxdepth.attrs = {'long_name' : 'ocean_s_coordinate maximum depth cutoff (mixed s over z boundary)', 'units' : 'meters', 'positive' : 'down'}
 
-            xc.Cs.attrs = {'long_name' : 'Function C(s) at whole levels', 'positive' : 'up' }
+        xc.Cs.attrs = {'long_name' : 'Function C(s) at whole levels', 'positive' : 'up' }
 
-            xc.dry_value_flag.attrs = {'values' : '0: use last-wet value; 1: use junk'}
+        xc.dry_value_flag.attrs = {'values' : '0: use last-wet value; 1: use junk'}
 
-            xc.SCHISM_hgrid_face_nodes.attrs = {'long_name' : 'Horizontal Element Table', 'cf_role' : 'face_node_connectivity' , 'start_index' : 0}
+        xc.SCHISM_hgrid_face_nodes.attrs = {'long_name' : 'Horizontal Element Table', 'cf_role' : 'face_node_connectivity' , 'start_index' : 0}
 
-            xc.SCHISM_hgrid_edge_nodes.attrs = {'long_name' : 'Map every edge to the two nodes that it connects', 'cf_role' : 'edge_node_connectivity' , 'start_index' : 0}
+        xc.SCHISM_hgrid_edge_nodes.attrs = {'long_name' : 'Map every edge to the two nodes that it connects', 'cf_role' : 'edge_node_connectivity' , 'start_index' : 0}
 
-            xc.SCHISM_hgrid_edge_x.attrs = {'long_name' : 'x_coordinate of 2D mesh edge' , 'standard_name' : lon_coord_standard_name, 'units' : 'm', 'mesh' : 'SCHISM_hgrid'}
+        xc.SCHISM_hgrid_edge_x.attrs = {'long_name' : 'x_coordinate of 2D mesh edge' , 'standard_name' : lon_coord_standard_name, 'units' : 'm', 'mesh' : 'SCHISM_hgrid'}
 
-            xc.SCHISM_hgrid_edge_y.attrs = {'long_name' : 'y_coordinate of 2D mesh edge' , 'standard_name' : lat_coord_standard_name, 'units' : 'm', 'mesh' : 'SCHISM_hgrid'}
+        xc.SCHISM_hgrid_edge_y.attrs = {'long_name' : 'y_coordinate of 2D mesh edge' , 'standard_name' : lat_coord_standard_name, 'units' : 'm', 'mesh' : 'SCHISM_hgrid'}
 
-            xc.SCHISM_hgrid_face_x.attrs = {'long_name' : 'x_coordinate of 2D mesh face' , 'standard_name' : lon_coord_standard_name, 'units' : 'm', 'mesh' : 'SCHISM_hgrid'}
+        xc.SCHISM_hgrid_face_x.attrs = {'long_name' : 'x_coordinate of 2D mesh face' , 'standard_name' : lon_coord_standard_name, 'units' : 'm', 'mesh' : 'SCHISM_hgrid'}
 
-            xc.SCHISM_hgrid_face_y.attrs = {'long_name' : 'y_coordinate of 2D mesh face' , 'standard_name' : lat_coord_standard_name, 'units' : 'm', 'mesh' : 'SCHISM_hgrid'}
+        xc.SCHISM_hgrid_face_y.attrs = {'long_name' : 'y_coordinate of 2D mesh face' , 'standard_name' : lat_coord_standard_name, 'units' : 'm', 'mesh' : 'SCHISM_hgrid'}
 
-            xc.SCHISM_hgrid.attrs = {'long_name' : 'Topology data of 2d unstructured mesh',
-                                       'topology_dimension' : 2,
-                                       'cf_role' : 'mesh_topology',
-                                       'node_coordinates' : 'SCHISM_hgrid_node_x SCHISM_hgrid_node_y',
-                                       'face_node_connectivity' : 'SCHISM_hgrid_face_nodes',
-                                       'edge_coordinates' : 'SCHISM_hgrid_edge_x SCHISM_hgrid_edge_y',
-                                       'face_coordinates' : 'SCHISM_hgrid_face_x SCHISM_hgrid_face_y',
-                                       'edge_node_connectivity' : 'SCHISM_hgrid_edge_nodes'
-                                      }
+        xc.SCHISM_hgrid.attrs = {'long_name' : 'Topology data of 2d unstructured mesh',
+                                   'topology_dimension' : 2,
+                                   'cf_role' : 'mesh_topology',
+                                   'node_coordinates' : 'SCHISM_hgrid_node_x SCHISM_hgrid_node_y',
+                                   'face_node_connectivity' : 'SCHISM_hgrid_face_nodes',
+                                   'edge_coordinates' : 'SCHISM_hgrid_edge_x SCHISM_hgrid_edge_y',
+                                   'face_coordinates' : 'SCHISM_hgrid_face_x SCHISM_hgrid_face_y',
+                                   'edge_node_connectivity' : 'SCHISM_hgrid_edge_nodes'
+                                  }
 
-            xc.node_bottom_index.attrs = {'long_name' : 'bottom level index at each node' , 'units' : 'non-dimensional', 'mesh' : 'SCHISM_hgrid', 'location' : 'node',
-                'start_index' : 0}
+        xc.node_bottom_index.attrs = {'long_name' : 'bottom level index at each node' , 'units' : 'non-dimensional', 'mesh' : 'SCHISM_hgrid', 'location' : 'node',
+            'start_index' : 0}
 
-            xc.ele_bottom_index.attrs = {'long_name' : 'bottom level index at each element' , 'units' : 'non-dimensional', 'mesh' : 'SCHISM_hgrid', 'location' : 'elem',
-                'start_index' : 0}
+        xc.ele_bottom_index.attrs = {'long_name' : 'bottom level index at each element' , 'units' : 'non-dimensional', 'mesh' : 'SCHISM_hgrid', 'location' : 'elem',
+            'start_index' : 0}
 
-            xc.edge_bottom_index.attrs = {'long_name' : 'bottom level index at each edge' , 'units' : 'non-dimensional', 'mesh' : 'SCHISM_hgrid', 'location' : 'edge',
-                'start_index' : 0}
-            
+        xc.edge_bottom_index.attrs = {'long_name' : 'bottom level index at each edge' , 'units' : 'non-dimensional', 'mesh' : 'SCHISM_hgrid', 'location' : 'edge',
+            'start_index' : 0}
         
-            base_date = ' '.join([str(x) for x in date.T.values.flatten()])
-            xc.time.attrs = {'long_name': 'Time', 'base_date' : base_date , 'standard_name' : 'time' }
-                
-            xc.sigma.attrs ={'long_name' : 'S coordinates at whole levels',
-                         'units' : '1',
-                         'standard_name' : 'ocean_s_coordinate',
-                         'positive' : 'up',
-                         'h_s' : self.misc['hs'],
-                         'h_c' : self.misc['h_c'],
-                         'theta_b' : self.misc['theta_b'],
-                         'theta_f' : self.misc['theta_f'],
-                         'formula_terms':
-                         's: sigma eta: elev depth: depth a: sigma_theta_f b: sigma_theta_b depth_c: sigma_h_c'}
+    
+        base_date = ' '.join([str(x) for x in date.T.values.flatten()])
+        xc.time.attrs = {'long_name': 'Time', 'base_date' : base_date , 'standard_name' : 'time' }
             
-            # Dataset Attrs
-
-            xc.attrs = {'Conventions': 'CF-1.0, UGRID-1.0', 'title': 'SCHISM Model output', 'source': 'SCHISM model output version v10', 'references': 'http://ccrm.vims.edu/schismweb/',
-                         'history': 'created by pyPoseidon', 'comment': 'SCHISM Model output', 'type': 'SCHISM Model output', 'VisIT_plugin': 'https://schism.water.ca.gov/library/-/document_library/view/3476283' }
-        
-        
-            xc.to_netcdf(path+'outputs/schout_{}.nc'.format(val))
-        
-        
+        xc.sigma.attrs ={'long_name' : 'S coordinates at whole levels',
+                     'units' : '1',
+                     'standard_name' : 'ocean_s_coordinate',
+                     'positive' : 'up',
+                     'h_s' : self.misc['hs'],
+                     'h_c' : self.misc['h_c'],
+                     'theta_b' : self.misc['theta_b'],
+                     'theta_f' : self.misc['theta_f'],
+                     'formula_terms':
+                     's: sigma eta: elev depth: depth a: sigma_theta_f b: sigma_theta_b depth_c: sigma_h_c'}
+        
+        # Dataset Attrs
+
+        xc.attrs = {'Conventions': 'CF-1.0, UGRID-1.0', 'title': 'SCHISM Model output', 'source': 'SCHISM model output version v10', 'references': 'http://ccrm.vims.edu/schismweb/',
+                     'history': 'created by pyPoseidon', 'comment': 'SCHISM Model output', 'type': 'SCHISM Model output', 'VisIT_plugin': 'https://schism.water.ca.gov/library/-/document_library/view/3476283' }
+    
+    
+        output = static.get('output', {})
         
-        logger.info('done with output netCDF files \n')
+        xc = enc.quantize_dataset(xc, output.get('digits', None))
+        encoding = enc.encoding(xc, **{k : output[k] for k in ['zlib','complevel','shuffle','access'] if k in output})
+    
+        xc.to_netcdf(path+'outputs/schout_{}.nc'.format(val), encoding=encoding)
                 
 
 
@@ -1259,6 +1290,7 @@ class schism():
         tg_database = get_value(self,kwargs,'tide_gauges',None) # TODO
         coastal_monitoring = get_value(self,kwargs,'coastal_monitoring',False)
         flags = get_value(self,kwargs,'station_flags',[1]+[0]*8) 
+        snap_depth = get_value(self,kwargs,'snap_depth',None) # place the gauges on nodes deeper than this
         
         station_flag = pd.DataFrame({'elev':flags[0], 'air_pressure':flags[1], 'windx':flags[2], 'windy':flags[3], 'T':flags[4], 'S':flags[5], 'u':flags[6], 'v':flags[7], 'w':flags[8]}, index =[0])
         
@@ -1268,15 +1300,10 @@ class schism():
         tg = obs.obs(**z)
         logger.info('get in-situ measurements locations \n')
         
-        gpoints = np.array(list(zip(self.grid.Dataset.SCHISM_hgrid_node_x.values,self.grid.Dataset.SCHISM_hgrid_node_y.values)))
+        # all the gauges at once
+        grid_index = self.grid.snap(tg.locations.lon.values, tg.locations.lat.values, depth=snap_depth)
         
-        stations = []
-        grid_index = []
-        for l in range(tg.locations.shape[0]):
-            plat,plon = tg.locations.loc[l,['lat','lon']]
-            cp = closest_node([plon,plat],gpoints)
-            grid_index.append(list(zip(self.grid.Dataset.SCHISM_hgrid_node_x.values,self.grid.Dataset.SCHISM_hgrid_node_y.values)).index(tuple(cp)))
-            stations.append(cp)
+        stations = np.column_stack([self.grid.Dataset.SCHISM_hgrid_node_x.values[grid_index], self.grid.Dataset.SCHISM_hgrid_node_y.values[grid_index]])
             
         #to df
         stations = pd.DataFrame(stations,columns=['SCHISM_hgrid_node_x','SCHISM_hgrid_node_y'])
@@ -1330,33 +1357,25 @@ class schism():
     
     def get_obs(self,**kwargs):
         
-        # locate the station files
-        sfiles = glob.glob(self.rpath + 'outputs/staout_*')
-        sfiles.sort()
-
-        try:
-            # get the station flags
-            flags = pd.read_csv(self.rpath + 'station.in', header=None,nrows=1,delim_whitespace=True).T
-            flags.columns = ['flag']
-            flags['variable'] = ['elev', 'air_pressure', 'windx', 'windy', 'T', 'S', 'u', 'v', 'w']
-        
-            vals = flags[flags.values==1]# get the active ones
-        except OSError as e:
-            if e.errno == errno.EEXIST: logger.error('No station.in file present')
+        cache = get_value(self,kwargs,'staout_cache',True) # memory mapped .npy copies of the staout files
+        
+        if not os.path.exists(self.rpath + 'station.in'):
+            logger.error('No station.in file present')
             return
-            
+        
+        self.time_series = staout.dataset(self.rpath, self.start_date, cache=cache)
 
-        dfs=[]
-        for idx in vals.index:
-            obs = np.loadtxt(sfiles[idx])
-            df = pd.DataFrame(obs)
-            df = df.set_index(0)
-            df.index.name = 'time'
-            df.columns.name = vals.loc[idx,'variable']
-            df.index = pd.to_datetime(self.start_date) + pd.to_timedelta(df.index,unit='S')
-            pindex = pd.MultiIndex.from_product([df.T.columns,df.T.index])
 
-            dfs.append(pd.DataFrame(df.values.flatten(),index = pindex, columns=[vals.loc[idx,'variable']]).to_xarray().rename({'level_0':'time','level_1':'point'}))        
-        
-        
-        self.time_series = xr.combine_by_coords(dfs)
+# state of the processes combining output stacks in parallel, see schism.results
+_stack_worker = {}
+
+def _init_stack_worker(model, path, static, combine_mode):
+    _stack_worker.update({'model':model, 'path':path, 'static':static, 'combine_mode':combine_mode})
+
+def _results_stack(val):
+    w = _stack_worker
+    try:
+        w['model'].results_stack(val, w['path'], w['static'], w['combine_mode'])
+        return val, None
+    except Exception:
+        return val, traceback.format_exc()
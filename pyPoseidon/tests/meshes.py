@@ -0,0 +1,355 @@
+"""
+Synthetic meshes, SCHISM domain decompositions and reference loops shared by the tests and benchmarks
+
+"""
+import numpy as np
+import pandas as pd
+import xarray as xr
+import os
+
+import pyPoseidon.utils.topology as tp
+
+
+def mesh(nx=6, ny=5):
+    # regular triangulated mesh, nodes and faces start index 0
+    x, y = np.meshgrid(np.linspace(-10., 10., nx), np.linspace(30., 45., ny))
+    x = x.flatten()
+    y = y.flatten()
+    j, i = np.meshgrid(np.arange(ny - 1), np.arange(nx - 1), indexing='ij')
+    n0 = (j * nx + i).flatten()
+    faces = np.empty((2 * n0.size, 3), dtype=int)
+    faces[0::2] = np.column_stack([n0, n0 + 1, n0 + nx + 1])
+    faces[1::2] = np.column_stack([n0, n0 + nx + 1, n0 + nx])
+    depth = 100. + 50 * np.sin(x) * np.cos(y)
+    return x, y, depth, faces
+
+
+def boundaries(nx, ny):
+    # west and east sides open, south, north and an island land (start index 0)
+    west = np.arange(ny) * nx
+    east = west + nx - 1
+    south = np.arange(1, nx - 1)
+    north = south + (ny - 1) * nx
+    island = (ny // 2) * nx + np.arange(nx // 3, nx // 3 + 3)
+    return [west, east], [(south, 0), (north, 0), (island, 1)]
+
+
+def write_gr3(filename, nx=6, ny=5):
+    """Write a hgrid.gr3 file with two open and three land boundaries and return its arrays
+    """
+    x, y, depth, faces = mesh(nx, ny)
+    opens, lands = boundaries(nx, ny)
+
+    with open(filename, 'w') as f:
+        f.write('\t uniform.gr3\n')
+        f.write('\t {} {}\n'.format(faces.shape[0], x.size))
+        np.savetxt(f, np.column_stack([np.arange(1, x.size + 1), x, y, depth]), fmt=['%d', '%.10f', '%.10f', '%.10f'], delimiter='\t')
+        np.savetxt(f, np.column_stack([np.arange(1, faces.shape[0] + 1), np.full(faces.shape[0], 3), faces + 1]), fmt='%d', delimiter='\t')
+
+        f.write('{} = Number of open boundaries\n'.format(len(opens)))
+        f.write('{} = Total number of open boundary nodes\n'.format(sum(o.size for o in opens)))
+        for i, o in enumerate(opens):
+            f.write('{} = Number of nodes for open boundary {}\n'.format(o.size, i + 1))
+            np.savetxt(f, o + 1, fmt='%d')
+
+        f.write('{} = Number of land boundaries\n'.format(len(lands)))
+        f.write('{} = Total number of land boundary nodes\n'.format(sum(l.size for l, _ in lands)))
+        for i, (l, t) in enumerate(lands):
+            f.write('{} {} = Number of nodes for land boundary {}\n'.format(l.size, t, i + 1))
+            np.savetxt(f, l + 1, fmt='%d')
+
+    return {'x': x, 'y': y, 'depth': depth, 'faces': faces, 'open': opens, 'land': lands}
+
+
+def curvilinear(ni=8, nj=6):
+    # (nj, ni) lons, lats of a slightly rotated curvilinear grid
+    i, j = np.meshgrid(np.arange(ni), np.arange(nj))
+    lons = -10. + 0.1 * i + 0.01 * np.sin(0.3 * j)
+    lats = 30. + 0.1 * j + 0.01 * np.cos(0.2 * i)
+    return lons, lats
+
+
+def write_grd(filename, lons, lats, wrap=5):
+    """Write a grd file the way RGFGRID does, each row wrapped every wrap values
+    """
+    nj, ni = lons.shape
+    with open(filename, 'w') as f:
+        f.write('*\n* Deltares, RGFGRID\n*\n')
+        f.write('Coordinate System = Spherical\n')
+        f.write('Missing Value     =   -9.99999000000000024E+02\n')
+        f.write('{:8d}{:8d}\n'.format(ni, nj))
+        f.write(' 0 0 0\n')
+        for a in [lons, lats]:
+            for r in range(nj):
+                for k in range(0, ni, wrap):
+                    head = ' ETA={:5d}'.format(r + 1) if k == 0 else ' ' * 10
+                    f.write(head + ''.join('{:26.17E}'.format(v) for v in a[r, k:k + wrap]) + '\n')
+
+
+def coastlines(nlines=12, npoints=8, seed=0):
+    """Boundary DataFrame as built by jigsaw.jdefault: an outer line0 with water (positive)
+    and land (negative) stretches and nlines - 1 islands (lines line1 ...)
+    """
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    frames = {}
+    for l in range(nlines):
+        t = np.sort(rng.uniform(0, 2 * np.pi, npoints))
+        r = 10. if l == 0 else 0.1
+        cx, cy = (0., 0.) if l == 0 else rng.uniform(-5, 5, 2)
+        if l == 0:
+            tag = np.where(np.arange(npoints) < npoints // 2, 1, -1)
+            tag[npoints // 4 : npoints // 2] = 2
+        else:
+            tag = np.full(npoints, -1 - l)
+        frames['line{}'.format(l)] = pd.DataFrame({'lon' : cx + r * np.cos(t), 'lat' : cy + r * np.sin(t), 'z' : 0, 'tag' : tag})
+
+    return pd.concat(frames, axis=0)
+
+
+def tagged_mesh(nx=7, ny=6):
+    # mesh with a hole, open south side (tag 1), the rest of the outer boundary land (-1), the hole an island (-2)
+    x, y, depth, faces = mesh(nx, ny)
+    inner = 2 * nx + 3
+    faces = faces[~(faces == inner).any(axis=1)]
+
+    be = tp.boundary_edges(faces)
+    south = (y[be[:, 0]] == y.min()) & (y[be[:, 1]] == y.min())
+    loops = tp.boundary_loops(faces)
+    hole = [l for l in loops if inner - 1 in l][0]
+    tag = np.where(np.isin(be, hole).all(axis=1), -2, np.where(south, 1, -1))
+
+    nodes = pd.DataFrame({'lon' : x, 'lat' : y, 'z' : 0.})
+    edges = pd.DataFrame(np.column_stack([be, tag]), columns=['e1', 'e2', 'e3'])
+    tria = pd.DataFrame(np.column_stack([faces, np.zeros(faces.shape[0], dtype=int)]), columns=['a', 'b', 'c', 'd'])
+    return x, y, nodes, edges, tria
+
+
+def lattice_edges(x, y):
+    # 8-neighbourhood of the cells of the (len(y), len(x)) lattice, node = j * len(x) + i
+    nj, ni = y.size, x.size
+    idx = np.arange(nj * ni).reshape(nj, ni)
+    edges = np.vstack([np.column_stack([idx[:nj - dj, max(0, -di):ni - max(0, di)].ravel(),
+                                        idx[dj:, max(0, di):ni + min(0, di)].ravel()])
+                       for dj, di in [(0, 1), (1, 0), (1, 1), (1, -1)]])
+    xx, yy = np.meshgrid(x, y)
+    elen = np.hypot(xx.ravel()[edges[:,1]] - xx.ravel()[edges[:,0]], yy.ravel()[edges[:,1]] - yy.ravel()[edges[:,0]])
+    return edges, elen
+
+
+def edges(faces):
+    # unique edges, sorted pairs, start index 0
+    e = np.vstack([faces[:, [1, 2]], faces[:, [2, 0]], faces[:, [0, 1]]])
+    return np.unique(np.sort(e, axis=1), axis=0)
+
+
+def partition(faces, x, nranks):
+    # split the faces in vertical strips, one per rank
+    xc = x[faces].mean(axis=1)
+    bins = np.linspace(xc.min(), xc.max() + 1e-9, nranks + 1)
+    return np.digitize(xc, bins) - 1
+
+
+def write_local_to_global(path, nranks=2, nvrt=2, nx=6, ny=5):
+    """Write outputs/local_to_global_* files for a synthetic run and return the global arrays
+    """
+
+    x, y, depth, faces = mesh(nx, ny)
+    sides = edges(faces)
+    rank = partition(faces, x, nranks)
+
+    os.makedirs(os.path.join(path, 'outputs'), exist_ok=True)
+
+    maps = []
+    for r in range(nranks):
+        gel = np.where(rank == r)[0]
+        gnodes = np.unique(faces[gel])
+        lsides = edges(faces[gel])
+        gsides = np.array([np.where((sides == s).all(axis=1))[0][0] for s in lsides])
+        lut = {g: l for l, g in enumerate(gnodes)}
+
+        with open(os.path.join(path, 'outputs', 'local_to_global_{:04d}'.format(r)), 'w') as f:
+            f.write(' {} {} {} {} {} 2 1 1 0 0 0 0 0 0 0 0 0\n'.format(sides.shape[0], faces.shape[0], x.size, nvrt, nranks))
+            f.write(' Header:\n')
+            f.write(' {}\n'.format(gel.size))
+            for l, g in enumerate(gel):
+                f.write(' {} {}\n'.format(l + 1, g + 1))
+            f.write(' {}\n'.format(gnodes.size))
+            for l, g in enumerate(gnodes):
+                f.write(' {} {}\n'.format(l + 1, g + 1))
+            f.write(' {}\n'.format(gsides.size))
+            for l, g in enumerate(gsides):
+                f.write(' {} {}\n'.format(l + 1, g + 1))
+            f.write(' Header:\n')
+            f.write(' 2017 10 1 0.0 0.0\n')
+            f.write(' 4 3600.0 9 {} 1 0.01 1000000.0 40.0 1.0 0.0001 2\n'.format(nvrt))
+            f.write(' ' + ' '.join(['{:.6f}'.format(s) for s in np.linspace(-1, 0, nvrt)]) + '\n')
+            f.write(' {} {}\n'.format(gnodes.size, gel.size))
+            for g in gnodes:
+                f.write(' {!r} {!r} {!r} 1\n'.format(float(x[g]), float(y[g]), float(depth[g])))
+            for g in gel:
+                f.write(' 3 {} {} {}\n'.format(*[lut[n] + 1 for n in faces[g]]))
+
+        maps.append({'elem': gel, 'node': gnodes, 'side': gsides})
+
+    return {'x': x, 'y': y, 'depth': depth, 'faces': faces, 'sides': sides, 'maps': maps}
+
+
+def write_schout(path, ref, stack=1, ntimes=3, nvrt=2):
+    """Write per core outputs/schout_*_{stack}.nc files from known global fields
+    """
+    nfaces = ref['faces'].shape[0]
+    t = (np.arange(1, ntimes + 1) + (stack - 1) * ntimes) * 3600.
+    elev = np.sin(t[:, None] / 3600. + ref['x'][None, :])
+    zcor = elev[:, :, None] - ref['depth'][None, :, None] * np.linspace(1, 0, nvrt)[None, None, :]
+    wetdry = (np.arange(nfaces)[None, :] + np.arange(ntimes)[:, None]) % 2
+
+    for r, m in enumerate(ref['maps']):
+        n, e = m['node'], m['elem']
+        ds = xr.Dataset({'SCHISM_hgrid_node_x': (['nSCHISM_hgrid_node'], ref['x'][n]),
+                         'SCHISM_hgrid_node_y': (['nSCHISM_hgrid_node'], ref['y'][n]),
+                         'depth': (['nSCHISM_hgrid_node'], ref['depth'][n]),
+                         'elev': (['time', 'nSCHISM_hgrid_node'], elev[:, n]),
+                         'zcor': (['time', 'nSCHISM_hgrid_node', 'nSCHISM_vgrid_layers'], zcor[:, n, :]),
+                         'wetdry_elem': (['time', 'nSCHISM_hgrid_face'], wetdry[:, e]),
+                         },
+                        coords={'time': ('time', t)})
+        ds.to_netcdf(os.path.join(path, 'outputs', 'schout_{:04d}_{}.nc'.format(r, stack)))
+
+    return {'time': t, 'elev': elev, 'zcor': zcor, 'wetdry_elem': wetdry}
+
+
+def write_vgrid(path, nvrt=2):
+    # S levels only vertical grid
+    with open(os.path.join(path, 'vgrid.in'), 'w') as f:
+        f.write('2\n')
+        f.write('{} 1 1000000.0\n'.format(nvrt))
+        f.write('Z levels\n')
+        f.write('1 -1000000.0\n')
+        f.write('S levels\n')
+        f.write('40.0 1.0 0.0001\n')
+        for i, s in enumerate(np.linspace(-1, 0, nvrt)):
+            f.write('{} {}\n'.format(i + 1, s))
+
+
+def write_hotstart(path, ref, it=10, nvrt=2, ntracers=2):
+    """Write per core outputs/hotstart_*_{it}.nc files from known global fields
+    """
+    npoints = ref['x'].size
+    nfaces = ref['faces'].shape[0]
+    nsides = ref['sides'].shape[0]
+
+    fields = {'eta2': np.cos(ref['x']) + ref['y'],
+              'tr_nd': np.random.rand(npoints, nvrt, ntracers),
+              'tr_el': np.random.rand(nfaces, nvrt, ntracers),
+              'su2': np.random.rand(nsides, nvrt),
+              'idry_e': np.arange(nfaces, dtype=np.int32) % 2}
+
+    for r, m in enumerate(ref['maps']):
+        n, e, s = m['node'], m['elem'], m['side']
+        ds = xr.Dataset({'time': (['one'], [it * 100.]),
+                         'it': (['one'], np.array([it], dtype=np.int32)),
+                         'ifile': (['one'], np.array([1], dtype=np.int32)),
+                         'idry_e': (['nResident_elem'], fields['idry_e'][e]),
+                         'eta2': (['nResident_node'], fields['eta2'][n]),
+                         'tr_nd': (['nResident_node', 'nVert', 'ntracers'], fields['tr_nd'][n]),
+                         'tr_el': (['nResident_elem', 'nVert', 'ntracers'], fields['tr_el'][e]),
+                         'su2': (['nResident_side', 'nVert'], fields['su2'][s]),
+                         })
+        ds.to_netcdf(os.path.join(path, 'outputs', 'hotstart_{:06d}_{}.nc'.format(r, it)))
+
+    return fields
+
+
+# previous node by node loop of limgrad.limgrad2, kept as reference
+def legacy_limgrad2(edge,elen,ffun,dfdx,imax):
+    
+    rfun = ffun.T.flatten()
+    
+    rfun = np.array([[hf] for hf in list(rfun)])
+    
+    eps = np.finfo(float).eps
+    
+    nnod = rfun.size
+        
+    #-- IVEC(NPTR(II,1):NPTR(II,2)) are edges adj. to II-TH node
+    nvec = np.hstack([edge[:,0], edge[:,1]])
+
+    ivec = np.hstack([np.arange(edge.shape[0]),np.arange(edge.shape[0])])
+
+
+    nvec_ = np.sort(nvec, kind='mergesort')
+    pidx = np.argsort(nvec, kind='mergesort') # to match with matlab/octave -> https://stackoverflow.com/questions/39484073/matlab-sort-vs-numpy-argsort-how-to-match-results
+    ivec = ivec[pidx]
+    nvec = nvec_
+    
+    
+    mark = np.full(rfun.size, False, dtype=bool)
+    mark[edge[:,0]]=True
+    mark[edge[:,1]]=True
+
+    dif = [nvec[i+1]-nvec[i] for i in range(nvec.shape[0]-1)]
+    idxx = np.argwhere(np.array(dif) > 0).flatten()
+    
+    nptr=np.zeros((mark.size,2))
+    nptr[mark,0] = np.append(np.array([0]),idxx+1)
+    nptr[mark,1] = np.append(idxx, nnod-1)
+    
+    nptr = nptr.astype(int)
+
+#----------------------------- ASET=ITER if node is "active"
+    aset = np.zeros(nnod)
+    
+    ftol = min(rfun.flatten()) * np.sqrt(eps)
+    
+
+#----------------------------- exhaustive 'til all satisfied 
+    
+    for i in range(1,imax):
+    
+    #------------------------- find "active" nodes this pass
+        aidx = np.argwhere(aset == i - 1 ) 
+        aidx = aidx.flatten()
+        
+        if not aidx.any(): break
+      
+    #------------------------- reorder => better convergence
+
+        idxx = np.argsort(rfun.reshape(ffun.shape).flatten()[aidx], kind='mergesort')
+        
+        aidx = aidx[idxx]
+       
+    #%------------------------- visit adj. edges and set DFDX
+        for ipos in range(len(aidx)):
+            npos = aidx[ipos]
+        
+            for jpos in range(nptr[npos,0], nptr[npos,1]+1):
+                
+                epos = ivec[jpos]
+                
+                nod1 = edge[epos,0]
+                nod2 = edge[epos,1]
+                
+               # print ipos, jpos, epos, nod1, nod2
+
+            #----------------- calc. limits about min.-value
+                if rfun[nod1] > rfun[nod2]:
+                
+                    
+                    fun1 = rfun[nod2] + elen[epos] * dfdx 
+                
+                    if rfun[nod1] > fun1+ftol :
+                        rfun[nod1] = fun1
+                        aset[nod1] = i
+                else:
+                
+                    fun2 = rfun[nod1] + elen[epos] * dfdx 
+                    
+                    if   rfun[nod2] > fun2+ftol :
+                        rfun[nod2] = fun2
+                        aset[nod2] = i
+     
+    flag = i < imax
+    
+    return rfun,flag
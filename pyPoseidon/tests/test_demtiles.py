@@ -0,0 +1,77 @@
+import pyPoseidon.dem as pdem
+import pyPoseidon.utils.demtiles as demtiles
+import numpy as np
+import xarray as xr
+import os
+import pytest
+
+from . import DATA_DIR
+
+DEM_SOURCE = DATA_DIR / "dem.nc"
+
+window = {'lon_min' : -30, 'lon_max' : -10., 'lat_min' : 60., 'lat_max' : 70.}
+
+
+@pytest.fixture
+def source(tmpdir):
+    # local stand-in of the remote source, with its variable names
+    with xr.open_dataset(DEM_SOURCE) as ds:
+        ds = ds.rename({'elevation' : 'z', 'latitude' : 'lat', 'longitude' : 'lon'}).load()
+    filename = str(tmpdir.join('srtm.nc'))
+    ds.to_netcdf(filename)
+    return filename
+
+
+def test_dem_cache(tmpdir, source, monkeypatch):
+    cache_dir = str(tmpdir.join('cache'))
+    opts = {'dem_source' : source, 'cache' : True, 'cache_dir' : cache_dir}
+
+    ref = pdem.dem(dem_source=source, **window).Dataset
+
+    d1 = pdem.dem(**opts, **window).Dataset
+    assert d1.identical(ref) # with the attrs of the source
+    ntiles = len(os.listdir(os.path.join(cache_dir, 'dem')))
+    assert ntiles > 1 # the axes and the tiles
+
+    # later windows over the same tiles are assembled offline
+    def offline(self):
+        raise OSError('offline')
+    monkeypatch.setattr(demtiles.tiles, 'data', offline)
+    d2 = pdem.dem(**opts, **window).Dataset
+    assert d2.identical(ref)
+
+    sub = {'lon_min' : -25, 'lon_max' : -15., 'lat_min' : 62., 'lat_max' : 68.}
+    d3 = pdem.dem(**opts, **sub).Dataset
+    assert d3.elevation.equals(ref.elevation.sel(longitude=d3.longitude, latitude=d3.latitude))
+    assert len(os.listdir(os.path.join(cache_dir, 'dem'))) == ntiles
+
+
+@pytest.mark.parametrize('tile', [7, 64, 1000])
+def test_tiles(tmpdir, source, tile):
+    t = demtiles.tiles(source, str(tmpdir), tile=tile)
+    lat, lon = slice(13, 101), slice(1150, 1200)
+    da = t.isel(latitude=lat, longitude=lon)
+
+    with xr.open_dataset(source) as ds:
+        ref = ds.z.isel(lat=lat, lon=lon).values
+        assert np.array_equal(da.longitude.values, ds.lon.values[lon])
+    assert np.array_equal(da.values, ref)
+    t.close()
+
+
+def test_tiles_evict(tmpdir, source):
+    # tiles of ~ 36 kB in a cache of 0.2 MB
+    t = demtiles.tiles(source, str(tmpdir), max_size=.2, tile=100)
+    for i in range(12):
+        t.read(0, i)
+    size = sum(os.path.getsize(os.path.join(t.folder, f)) for f in os.listdir(t.folder))
+    assert size <= .2 * 2**20
+    assert os.path.exists(t.cfile(0, 11)) and not os.path.exists(t.cfile(0, 0))
+    t.close()
+
+
+def test_source_key(tmpdir, source):
+    assert demtiles.source_key('https://example.org/dem') == 'https://example.org/dem'
+    key = demtiles.source_key(source)
+    os.utime(source, (1, 1))
+    assert demtiles.source_key(source) != key # a changed file is a new source
@@ -0,0 +1,64 @@
+import pyPoseidon.grid as pgrid
+import pyPoseidon.utils.grd as grd
+import numpy as np
+import filecmp
+import pytest
+
+from .meshes import curvilinear, write_grd
+
+
+def legacy_to_file(g, filename):
+    # previous row by row writer
+    with open(filename,'w') as f:
+        f.write('Coordinate System= {}\n'.format(g.attrs['Coordinate System']))
+        f.write('{} {}\n'.format(g.lons.shape[1],g.lons.shape[0]))
+        f.write('{} {} {}\n'.format(g.attrs['xori'],g.attrs['yori'],g.attrs['alfori']))
+        for a in [g.lons, g.lats]:
+            for i in range(a.shape[0]):
+                f.write('ETA=  {} '.format(i+1))
+                f.write(' '.join(map(str, a[i,:].values)))
+                f.write('\n')
+
+
+def test_to_file(tmpdir):
+    g = pgrid.grid(type='r2d', lon_min=-10.1, lon_max=3.3, lat_min=30.7, lat_max=41.3, resolution=0.37)
+
+    new = str(tmpdir.join('new.grd'))
+    old = str(tmpdir.join('old.grd'))
+    g.to_file(new)
+    legacy_to_file(g.Dataset, old)
+
+    assert filecmp.cmp(new, old, shallow=False)
+
+    r = pgrid.r2d.read_file(new)
+    assert np.array_equal(r.lons.values, g.Dataset.lons.values)
+    assert np.array_equal(r.lats.values, g.Dataset.lats.values)
+    assert r.attrs['Coordinate System'] == 'Spherical'
+
+
+@pytest.mark.parametrize('wrap', [3, 5, 100])
+def test_read_wrapped(tmpdir, wrap):
+    lons, lats = curvilinear(8, 6)
+    filename = str(tmpdir.join('wrapped.grd'))
+    write_grd(filename, lons, lats, wrap=wrap)
+
+    g = pgrid.r2d.read_file(filename)
+
+    assert g.lons.shape == (6, 8)
+    assert np.allclose(g.lons.values, lons, rtol=0, atol=1e-14)
+    assert np.allclose(g.lats.values, lats, rtol=0, atol=1e-14)
+    assert g.attrs['Coordinate System'] == 'Spherical'
+    assert (g.attrs['alfori'], g.attrs['xori'], g.attrs['yori']) == ('0', '0', '0')
+
+
+def test_read_truncated(tmpdir):
+    lons, lats = curvilinear(8, 6)
+    filename = str(tmpdir.join('bad.grd'))
+    grd.write(filename, lons[:-1], lats[:-1], 'Spherical', 0, 0, 0)
+    with open(filename) as f:
+        text = f.read().replace('8 5', '8 6', 1)
+    with open(filename, 'w') as f:
+        f.write(text)
+
+    with pytest.raises(ValueError):
+        grd.read(filename)
@@ -0,0 +1,182 @@
+import pyPoseidon.dem as pdem
+import pyPoseidon.utils.hfun as phfun
+import pyPoseidon.utils.msh as msh
+import pyPoseidon.jigsaw as pjig
+import geopandas as gp
+import shapely.geometry
+import numpy as np
+import xarray as xr
+import types
+import pytest
+
+from . import DATA_DIR
+from .meshes import lattice_edges
+
+DEM_SOURCE = DATA_DIR / "dem.nc"
+
+
+@pytest.fixture(scope='module')
+def dem():
+    return pdem.dem(lon_min=-30, lon_max=-10., lat_min=60., lat_max=70., dem_source=DEM_SOURCE)
+
+
+def test_hfun_raster(tmpdir, dem):
+    elevation = dem.Dataset.elevation.values.copy()
+
+    dt = phfun.hfun(dem, dhdx=.15)
+    dr = phfun.hfun(dem, dhdx=.15, method='raster', to_msh=True, path=str(tmpdir), tag='test')
+
+    assert np.array_equal(dem.Dataset.elevation.values, elevation) # the dem is not changed
+    assert dr.z.dims == dt.z.dims and dr.z.shape == dt.z.shape
+
+    # the 8-neighbourhood limits also the diagonal missing from the triangulation
+    assert (dr.z.values <= dt.z.values + 1e-12).all()
+    assert (dr.z.values >= .05 - 1e-12).all() and (dr.z.values <= .5).all()
+
+    z = dr.z.transpose('latitude', 'longitude').values.ravel()
+    edges, elen = lattice_edges(dr.longitude.values, dr.latitude.values)
+    assert (np.abs(z[edges[:,0]] - z[edges[:,1]]) <= .15 * elen + 1e-9).all()
+
+    # JIGSAW hfun file, values with latitude varying fastest
+    header, blocks = msh.read(str(tmpdir.join('test-hfun.msh')))
+    assert header['MSHID'] == '3;EUCLIDEAN-GRID'
+    assert np.array_equal(blocks['COORD1'].ravel(), dr.longitude.values)
+    assert np.array_equal(blocks['COORD2'].ravel(), dr.latitude.values)
+    assert np.array_equal(blocks['VALUE'].ravel(), dr.z.values.flatten())
+
+
+def test_hfun_not_converged(caplog, dem):
+    phfun.hfun(dem, dhdx=.15, method='raster', imax=2)
+    assert 'not converged' in caplog.text
+
+
+def test_write_grid(tmpdir):
+    x = np.linspace(0., 1., 4)
+    y = np.linspace(5., 6., 3)
+    values = np.arange(12.).reshape(3, 4)
+    filename = str(tmpdir.join('grid.msh'))
+    msh.write_grid(filename, x, y, values)
+
+    header, blocks = msh.read(filename)
+    assert header['NDIMS'] == '2'
+    assert np.array_equal(blocks['VALUE'].ravel(), values.T.ravel())
+
+
+def test_write_grid_align(tmpdir):
+    # strips of whole column chunks of the store
+    values = np.arange(60.).reshape(3, 20)
+    strips = []
+
+    class stored:
+        shape = values.shape
+        def __getitem__(self, idx):
+            strips.append(idx[1])
+            return values[idx]
+
+    filename = str(tmpdir.join('grid.msh'))
+    msh.write_grid(filename, np.arange(20.), np.arange(3.), stored(), chunk=30, align=4)
+
+    header, blocks = msh.read(filename)
+    assert np.array_equal(blocks['VALUE'].ravel(), values.T.ravel())
+    assert [(s.start, s.stop) for s in strips] == [(0, 8), (8, 16), (16, 24)]
+
+
+def islands():
+    return gp.GeoDataFrame({'geometry' : [shapely.geometry.Polygon([(-25, 62), (-20, 61), (-22, 65)]),
+                                          shapely.geometry.LineString([(-12, 55), (-8, 58), (-9, 66)])]})
+
+
+@pytest.mark.parametrize('ncores,criteria', [(1, False), (2, False), (1, True)])
+def test_tiled(tmpdir, ncores, criteria):
+    pytest.importorskip('zarr')
+    window = {'lon_min' : -40., 'lon_max' : -5., 'lat_min' : 50., 'lat_max' : 72.}
+    opts = {'resolution_min' : .3, 'resolution_max' : 2., 'dhdx' : .15}
+    if criteria:
+        opts.update({'coastlines' : islands(), 'slope_ratio' : 4.})
+    store = str(tmpdir.join('hfun.zarr'))
+
+    dh = phfun.tiled(DEM_SOURCE, store, tile=16, ncores=ncores, **window, **opts)
+    assert dh.z.dims == ('longitude', 'latitude')
+    assert dh.z.data.chunksize == (16, 16)
+
+    # same as the whole window at once
+    with xr.open_dataset(DEM_SOURCE) as ds:
+        jw, iw = phfun.window(ds.longitude.values, ds.latitude.values, **window)
+        sub = ds.isel(latitude=jw, longitude=iw).load()
+
+    assert phfun.halo(sub.longitude.values, sub.latitude.values, opts['resolution_min'], opts['resolution_max'], opts['dhdx']) < sub.longitude.size # several blocks apart
+
+    ref = phfun.hfun(types.SimpleNamespace(Dataset=sub), method='raster', **opts)
+    assert np.array_equal(dh.longitude.values, ref.longitude.values)
+    assert np.allclose(dh.z.values, ref.z.values, rtol=0, atol=1e-12)
+
+    # the store is written for JIGSAW by strips
+    fhfun = str(tmpdir.join('test-hfun.msh'))
+    pjig.write_hfun(store, fhfun)
+    header, blocks = msh.read(fhfun)
+    assert np.array_equal(blocks['VALUE'].ravel(), dh.z.values.flatten())
+
+
+def test_tiled_source_names(tmpdir):
+    # variable and coordinates named as in srtm15plus
+    pytest.importorskip('zarr')
+    with xr.open_dataset(DEM_SOURCE) as ds:
+        ds.rename({'elevation' : 'z', 'latitude' : 'lat', 'longitude' : 'lon'}).to_netcdf(str(tmpdir.join('srtm.nc')))
+
+    window = {'lon_min' : -30., 'lon_max' : -10., 'lat_min' : 60., 'lat_max' : 70.}
+    dh = phfun.tiled(str(tmpdir.join('srtm.nc')), str(tmpdir.join('a.zarr')), tile=16, **window)
+    ref = phfun.tiled(DEM_SOURCE, str(tmpdir.join('b.zarr')), tile=16, **window)
+    assert dh.identical(ref)
+
+
+def test_window():
+    lon = np.arange(10.)
+    lat = np.arange(20., 10., -1.)
+    jw, iw = phfun.window(lon, lat, lon_min=2.5, lon_max=6., lat_min=12., lat_max=15.)
+    assert np.array_equal(lon[iw], [3., 4., 5., 6.])
+    assert np.array_equal(lat[jw], [15., 14., 13., 12.])
+    with pytest.raises(ValueError):
+        phfun.window(lon, lat, lon_min=20.)
+
+
+def test_densify():
+    coords = np.array([[0., 0.], [1., 0.], [1., .25]])
+    points = phfun.densify(coords, .3)
+    assert np.array_equal(points[[0, -1]], coords[[0, -1]])
+    assert np.hypot(*np.diff(points, axis=0).T).max() <= .3
+    assert points.shape[0] == 4 + 1 + 1
+
+
+def test_coast_distance():
+    coast = islands()
+    lon = np.linspace(-30., 0., 61)
+    lat = np.linspace(70., 50., 41)
+
+    dist = phfun.coast_distance(coast, lon, lat)
+
+    xx, yy = np.meshgrid(lon, lat)
+    ref = np.array([coast.boundary.iloc[0].union(coast.geometry.iloc[1]).distance(shapely.geometry.Point(p)) for p in zip(xx.ravel(), yy.ravel())]).reshape(xx.shape)
+    assert (dist >= ref - 1e-12).all() and (dist <= ref + .25 + 1e-12).all() # vertices .5 apart
+
+    far = phfun.coast_distance(coast, lon, lat, dmax=2.)
+    assert np.isinf(far[dist >= 2.]).all()
+    assert np.array_equal(far[dist < 2.], dist[dist < 2.])
+
+
+def test_criteria(dem):
+    opts = {'resolution_min' : .05, 'resolution_max' : .5, 'dhdx' : .15, 'method' : 'raster'}
+    base = phfun.hfun(dem, **opts)
+    coast = phfun.hfun(dem, coastlines=islands(), coast_resolution=.1, **opts)
+    slope = phfun.hfun(dem, slope_ratio=20., **opts)
+
+    for dh in [coast, slope]:
+        assert (dh.z.values <= base.z.values).all() and (dh.z.values < base.z.values).any()
+        assert (dh.z.values >= .05 - 1e-12).all()
+
+    # a linear slope
+    lon = np.linspace(0., 1., 11)
+    lat = np.linspace(0., 1., 6)
+    V = -100. - 50. * lon[None, :] + 0. * lat[:, None]
+    size = phfun.slope_size(V, lon, lat, 2.)
+    assert np.allclose(size, -V / 100.)
+    assert np.isinf(phfun.slope_size(np.zeros((6, 11)), lon, lat, 2.)).all()
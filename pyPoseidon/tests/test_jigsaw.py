@@ -0,0 +1,91 @@
+import pyPoseidon.jigsaw as pjig
+import pyPoseidon.utils.cache as pcache
+import geopandas as gp
+import shapely.geometry
+import xarray as xr
+import os
+import pytest
+
+from .meshes import tagged_mesh
+
+
+@pytest.fixture
+def fake_jigsaw(monkeypatch):
+    # count the meshings, the jigsaw binary is not needed
+    calls = []
+
+    def jdefault(**kwargs):
+        return None, -1
+
+    def jigsaw_(df, bmindx, **kwargs):
+        calls.append(kwargs['geometry'])
+        x, y, nodes, edges, tria = tagged_mesh()
+        return pjig.to_dataset(nodes, edges, tria, bmindx)
+
+    monkeypatch.setattr(pjig, 'jdefault', jdefault)
+    monkeypatch.setattr(pjig, 'jigsaw_', jigsaw_)
+    return calls
+
+
+def coast(shift=0.):
+    return gp.GeoDataFrame({'geometry' : [shapely.geometry.Polygon([(0, 0), (1 + shift, 0), (1, 1)])]})
+
+
+def test_mesh_cache(tmpdir, fake_jigsaw):
+    geometry = {'lon_min' : -1., 'lon_max' : 2., 'lat_min' : -1., 'lat_max' : 2.}
+    kwargs = {'geometry' : geometry, 'coastlines' : coast(), 'cache' : True, 'cache_dir' : str(tmpdir)}
+
+    g1 = pjig.jigsaw(**kwargs)
+    g2 = pjig.jigsaw(**kwargs)
+    assert len(fake_jigsaw) == 1 # second one from the cache
+    assert g1.equals(g2)
+
+    # any input change is a new mesh
+    pjig.jigsaw(**{**kwargs, 'coastlines' : coast(.5)})
+    pjig.jigsaw(**{**kwargs, 'geometry' : {**geometry, 'lat_max' : 3.}})
+    assert len(fake_jigsaw) == 3
+
+    pjig.jigsaw(**{**kwargs, 'cache' : False})
+    assert len(fake_jigsaw) == 4
+
+    assert len(os.listdir(os.path.join(str(tmpdir), 'mesh'))) == 3
+
+
+def test_cache_default(tmpdir, fake_jigsaw, monkeypatch):
+    kwargs = {'geometry' : {'lon_min' : -1., 'lon_max' : 2., 'lat_min' : -1., 'lat_max' : 2.}, 'cache_dir' : str(tmpdir)}
+
+    pjig.jigsaw(**kwargs) # off by default
+    assert os.listdir(str(tmpdir)) == []
+
+    monkeypatch.setattr(pcache, 'CACHE', True)
+    pjig.jigsaw(**kwargs)
+    pjig.jigsaw(**kwargs)
+    assert len(fake_jigsaw) == 2
+    assert len(os.listdir(os.path.join(str(tmpdir), 'mesh'))) == 1
+
+
+def test_evict(tmpdir):
+    folder = str(tmpdir)
+    for i, t in enumerate([30, 10, 20]): # modification times, oldest second
+        name = os.path.join(folder, 'f{}'.format(i))
+        with open(name, 'wb') as f:
+            f.write(b'0' * 2**19)
+        os.utime(name, (t, t))
+
+    pcache.evict(folder, 1.) # 1.5 MB in the folder
+    assert sorted(os.listdir(folder)) == ['f0', 'f2']
+
+
+def test_save_tmp(tmpdir, monkeypatch):
+    # the temporary file is per process, concurrent saves do not share it
+    cfile = str(tmpdir.join('c.nc'))
+    names = []
+    to_netcdf = xr.Dataset.to_netcdf
+    def record(self, path, *args, **kwargs):
+        names.append(path)
+        return to_netcdf(self, path, *args, **kwargs)
+    monkeypatch.setattr(xr.Dataset, 'to_netcdf', record)
+
+    pcache.save(xr.Dataset({'a' : ('x', [1, 2])}), cfile)
+    assert names == [cfile + '.{}.tmp'.format(os.getpid())]
+    assert os.listdir(str(tmpdir)) == ['c.nc']
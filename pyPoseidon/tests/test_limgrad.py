@@ -0,0 +1,69 @@
+import pyPoseidon.limgrad as plimgrad
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+import pytest
+from matplotlib import tri
+
+from .meshes import legacy_limgrad2, lattice_edges
+
+
+def reference(edges, elen, ffun, dfdx):
+    # the limited function is the min over the nodes j of ffun[j] + dfdx * (graph distance to j)
+    n = ffun.size
+    g = scipy.sparse.coo_matrix((elen, (edges[:,0], edges[:,1])), shape=(n, n))
+    dist = scipy.sparse.csgraph.shortest_path(g, directed=False)
+    return (ffun[None, :] + dfdx * dist).min(axis=1)
+
+
+@pytest.mark.parametrize('dfdx', [.05, .15, 1.])
+def test_limgrad(dfdx):
+    rng = np.random.default_rng(1)
+    x, y = np.meshgrid(np.linspace(0., 1., 12), np.linspace(0., 1., 9))
+    points = np.column_stack([x.ravel(), y.ravel()])
+    edges = tri.Triangulation(points[:,0], points[:,1]).edges
+    elen = np.hypot(*(points[edges[:,1]] - points[edges[:,0]]).T)
+    ffun = rng.uniform(.05, .5, points.shape[0])
+
+    rfun, flag, stats = plimgrad.limgrad(edges, elen, ffun, dfdx, imax=100)
+
+    assert flag
+    assert np.allclose(rfun, reference(edges, elen, ffun, dfdx), rtol=0, atol=1e-6)
+    assert stats['edges'] == [edges.shape[0]] and 0 < stats['active'][0] <= ffun.size
+
+    # gradient within the limit along every edge
+    assert (np.abs(rfun[edges[:,0]] - rfun[edges[:,1]]) <= dfdx * elen + 1e-6).all()
+
+    fun, flag2 = plimgrad.limgrad2(edges, elen, ffun.reshape(-1, 1), dfdx, 100)
+    assert fun.shape == (ffun.size, 1) and np.array_equal(fun.ravel(), rfun) and flag2
+
+
+def test_limgrad_wide():
+    # a single small value has to cross a mesh wider than imax edges
+    x = np.linspace(0., .29, 30)
+    edges, elen = lattice_edges(x, x)
+    ffun = np.full(x.size ** 2, .5)
+    ffun[0] = .05
+
+    rfun, flag, stats = plimgrad.limgrad(edges, elen, ffun, .15, imax=20)
+    old, oflag = legacy_limgrad2(edges, elen, ffun.reshape(-1, 1), .15, 20)
+
+    assert flag and oflag
+    assert np.allclose(rfun, old.ravel(), rtol=0, atol=1e-9)
+    assert np.allclose(rfun, reference(edges, elen, ffun, .15), rtol=0, atol=1e-9)
+    assert rfun[-1] < .5 # limited at the far corner
+
+
+@pytest.mark.parametrize('dfdx', [.05, .3, 2.])
+def test_limgrad_grid(dfdx):
+    rng = np.random.default_rng(2)
+    x = np.cumsum(rng.uniform(.5, 1.5, 13))
+    y = np.cumsum(rng.uniform(.5, 1.5, 9))[::-1] # descending, uneven spacings
+    ffun = rng.uniform(.5, 5., (y.size, x.size))
+
+    rfun, flag, stats = plimgrad.limgrad_grid(ffun, x, y, dfdx, imax=100)
+
+    edges, elen = lattice_edges(x, y)
+    assert flag and stats['active'][-1] == 0
+    assert rfun.shape == ffun.shape
+    assert np.allclose(rfun.ravel(), reference(edges, elen, ffun.ravel(), dfdx), rtol=0, atol=1e-9)
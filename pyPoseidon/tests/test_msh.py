@@ -0,0 +1,91 @@
+import pyPoseidon.jigsaw as pjig
+import pyPoseidon.utils.msh as msh
+import pyPoseidon.grid as pgrid
+import numpy as np
+import pytest
+
+from .meshes import mesh, coastlines, tagged_mesh
+
+
+def reference_edges(df):
+    # ring per line, in the order of the index levels
+    out = []
+    i0 = 0
+    for line in df.index.levels[0]:
+        tag = df.loc[line].tag.values
+        n = tag.size
+        for k in range(n):
+            nk = (k + 1) % n
+            que = tag[nk] if (tag[k] != tag[nk]) and (tag[k] > 0) else tag[k]
+            out.append([i0 + k, i0 + nk, que])
+        i0 += n
+    return np.array(out)
+
+
+@pytest.mark.parametrize('nlines', [1, 3, 12])
+def test_geo(tmpdir, nlines):
+    df = coastlines(nlines, 9)
+    path = str(tmpdir) + '/'
+    pjig.geo(df, path=path, tag='test')
+
+    header, blocks = msh.read(path + 'test-geo.msh')
+
+    assert header['MSHID'] == '2;EUCLIDEAN-MESH'
+    points = np.concatenate([df.loc[line, ['lon', 'lat', 'z']].values for line in df.index.levels[0]])
+    assert np.array_equal(blocks['POINT'], points)
+    assert np.array_equal(blocks['EDGE2'], reference_edges(df))
+
+
+def test_read_msh(tmpdir):
+    x, y, depth, faces = mesh(7, 5)
+    filename = str(tmpdir.join('test.msh'))
+    n = faces.shape[0]
+    msh.write(filename, {'POINT' : [x, y, np.zeros(x.size, dtype=int)],
+                         'EDGE2' : [faces[:, 0], faces[:, 1], -np.ones(n, dtype=int)],
+                         'TRIA3' : [faces[:, 0], faces[:, 1], faces[:, 2], np.zeros(n, dtype=int)]})
+
+    nodes, edges, tria = pjig.read_msh(filename)
+
+    assert np.array_equal(nodes.lon.values, x) and np.array_equal(nodes.lat.values, y)
+    assert np.array_equal(tria.loc[:, ['a', 'b', 'c']].values, faces)
+    assert (edges.e3 == -1).all() and edges.shape[0] == n
+
+    # truncated block
+    with open(filename) as f:
+        lines = f.readlines()
+    with open(filename, 'w') as f:
+        f.writelines(lines[:-3])
+    with pytest.raises(ValueError):
+        msh.read(filename)
+
+
+def test_to_dataset(tmpdir):
+    x, y, nodes, edges, tria = tagged_mesh()
+
+    g = pjig.to_dataset(nodes, edges, tria, bmindx=-1)
+
+    # same nodes as the previous per tag extraction
+    for name, t in [('open_boundary_1', 1), ('land_boundary_1', -2), ('land_boundary_2', -1)]:
+        ref = np.unique(edges.loc[edges.e3 == t, ['e1', 'e2']].values)
+        b = g[name].dropna('index').values.astype(int)
+        assert np.array_equal(np.sort(b), ref)
+        assert g.nps.sel(label=name) == ref.size
+
+    # the open boundary is ordered along the south side
+    ob = g.open_boundary_1.dropna('index').values.astype(int)
+    assert np.all(np.diff(x[ob]) > 0)
+
+    # consecutive nodes of every boundary share an edge
+    pairs = set(map(tuple, np.sort(edges[['e1', 'e2']].values, axis=1)))
+    for name in ['open_boundary_1', 'land_boundary_1']:
+        b = g[name].dropna('index').values.astype(int)
+        assert all(tuple(sorted(p)) in pairs for p in zip(b[:-1], b[1:]))
+
+    assert g.type.sel(label='land_boundary_1') == 1 # island
+    assert g.type.sel(label='land_boundary_2') == 0
+
+    gr = pgrid.tri2d.__new__(pgrid.tri2d)
+    gr.Dataset = g
+    gr.to_file(str(tmpdir.join('hgrid.gr3')))
+    r = pgrid.tri2d.read_file(str(tmpdir.join('hgrid.gr3')))
+    assert np.array_equal(r.open_boundary_1.dropna('index').values, ob)
@@ -0,0 +1,65 @@
+import pyPoseidon.grid as pgrid
+import pyPoseidon.dem as pdem
+import pyPoseidon.utils.rectilinear as rectilinear
+import numpy as np
+import pyresample
+import pytest
+
+from . import DATA_DIR
+from .meshes import curvilinear
+
+DEM_SOURCE = DATA_DIR / "dem.nc"
+
+
+def test_r2d_axes():
+    g = pgrid.grid(type='r2d', lon_min=-30, lon_max=-10., lat_min=60., lat_max=70., resolution=.1)
+
+    lons, lats = g.Dataset.lons.values, g.Dataset.lats.values
+    assert lons.strides[0] == 0 and lats.strides[1] == 0 # no 2-D copies
+
+    xx, yy = np.meshgrid(g.Dataset.x.values, g.Dataset.y.values)
+    assert np.array_equal(lons, xx) and np.array_equal(lats, yy)
+
+    x, y = g.axes
+    assert np.array_equal(x, g.Dataset.x.values) and np.array_equal(y, g.Dataset.y.values)
+
+    # full 2-D arrays are recognized too
+    x, y = rectilinear.axes(xx, yy)
+    assert np.array_equal(x, g.Dataset.x.values)
+
+    assert rectilinear.axes(*curvilinear(8, 6)) is None
+
+
+@pytest.mark.parametrize('src', [np.linspace(0., 10., 11), np.linspace(10., 0., 11), np.array([3.])])
+def test_nearest_index(src):
+    x = np.linspace(-2., 12., 57)
+    ref = np.abs(src[None, :] - x[:, None]).argmin(axis=1)
+    assert np.array_equal(rectilinear.nearest_index(src, x), ref)
+
+
+def test_dem_nearest():
+    window = {'lon_min' : -30, 'lon_max' : -10., 'lat_min' : 60., 'lat_max' : 70., 'dem_source' : DEM_SOURCE}
+
+    g = pgrid.grid(type='r2d', resolution=.07, **{k : v for k, v in window.items() if k != 'dem_source'})
+
+    df = pdem.dem(grid_x=g.Dataset.lons.values, grid_y=g.Dataset.lats.values, **window)
+
+    # reference on 2-D swaths
+    d = df.Dataset.elevation
+    xx, yy = np.meshgrid(d.longitude, d.latitude)
+    orig = pyresample.geometry.SwathDefinition(lons=xx, lats=yy)
+    targ = pyresample.geometry.SwathDefinition(lons=np.array(g.Dataset.lons.values), lats=np.array(g.Dataset.lats.values))
+    ref = pyresample.image.ImageContainerNearest(d.values, orig, radius_of_influence=50000, fill_value=np.nan).resample(targ).image_data
+
+    # the great circle nearest may differ on rows halfway between two dem rows
+    assert (df.Dataset.ival.values == ref).mean() > .99
+
+
+def test_nearest_radius():
+    lon = np.linspace(0., 1., 11)
+    lat = np.linspace(40., 41., 11)
+    values = np.arange(121.).reshape(11, 11)
+
+    out = rectilinear.nearest(values, lon, lat, np.array([0.5, 3.]), np.array([40.5]))
+    assert out[0, 0] == values[5, 5]
+    assert np.isnan(out[0, 1]) # ~ 210 km away
@@ -0,0 +1,252 @@
+import pyPoseidon.utils.global2local as gl
+import pyPoseidon.utils.combine as cb
+import pyPoseidon.utils.encoding as enc
+from pyPoseidon.schism import schism
+import pytest
+import numpy as np
+import xarray as xr
+import threading
+import glob
+import time
+import os
+
+from .meshes import write_local_to_global, write_schout, write_vgrid, write_hotstart
+
+
+@pytest.mark.parametrize('loc', ['node', 'elem', 'side'])
+@pytest.mark.parametrize('axis', [0, 1])
+def test_combine(tmpdir, loc, axis):
+    path = str(tmpdir) + '/'
+    ref = write_local_to_global(path, nranks=3)
+    sindex = cb.index(gl.read(path))
+
+    size = sindex[loc]['size']
+    field = np.random.rand(4, size, 5) if axis else np.random.rand(size, 4, 5)
+    arrays = [np.take(field, m[loc], axis=axis) for m in ref['maps']]
+
+    assert np.array_equal(cb.combine(arrays, sindex[loc], axis=axis), field)
+
+
+def test_results(tmpdir):
+    path = str(tmpdir) + '/'
+    ref = write_local_to_global(path, nranks=3)
+    fields = write_schout(path, ref, stack=1)
+    write_vgrid(path)
+
+    m = schism.__new__(schism)
+    m.misc = {}
+
+    m.results(rpath=path, cache_dir=str(tmpdir), combine_mode='step')
+    with xr.open_dataset(path + 'outputs/schout_1.nc') as ds:
+        step = ds.load()
+
+    m.results(rpath=path, cache_dir=str(tmpdir))
+    with xr.open_dataset(path + 'outputs/schout_1.nc') as ds:
+        block = ds.load()
+
+    assert np.array_equal(block.elev.values, fields['elev'])
+    assert np.array_equal(block.zcor.values, fields['zcor'])
+    assert block.identical(step)
+
+
+def test_results_parallel(tmpdir):
+    path = str(tmpdir) + '/'
+    ref = write_local_to_global(path, nranks=3)
+    fields = [write_schout(path, ref, stack=i) for i in [1, 2, 3]]
+    write_vgrid(path)
+
+    # a broken stack does not abort the others
+    with open(path + 'outputs/schout_0001_2.nc', 'w') as f:
+        f.write('corrupted')
+
+    m = schism.__new__(schism)
+    m.misc = {}
+    for ncores in [1, 2]:
+        with pytest.raises(RuntimeError):
+            m.results(rpath=path, cache_dir=str(tmpdir), ncores=ncores)
+
+    errors = m.results(rpath=path, cache_dir=str(tmpdir), ncores=2, raise_errors=False)
+
+    assert list(errors.keys()) == [2]
+    for i in [1, 3]:
+        with xr.open_dataset(path + 'outputs/schout_{}.nc'.format(i)) as ds:
+            assert np.array_equal(ds.elev.values, fields[i - 1]['elev'])
+
+
+def test_results_incremental(tmpdir):
+    path = str(tmpdir) + '/'
+    ref = write_local_to_global(path, nranks=2)
+    for i in [1, 2]:
+        write_schout(path, ref, stack=i)
+    write_vgrid(path)
+
+    m = schism.__new__(schism)
+    m.misc = {}
+    m.results(rpath=path, cache_dir=str(tmpdir))
+    mtimes = [os.path.getmtime(path + 'outputs/schout_{}.nc'.format(i)) for i in [1, 2]]
+
+    # stack 2 gets newer input
+    time.sleep(0.05)
+    write_schout(path, ref, stack=2)
+    m.results(rpath=path, cache_dir=str(tmpdir), incremental=True)
+
+    assert os.path.getmtime(path + 'outputs/schout_1.nc') == mtimes[0]
+    assert os.path.getmtime(path + 'outputs/schout_2.nc') > mtimes[1]
+
+
+def test_watch(tmpdir):
+    path = str(tmpdir) + '/'
+    ref = write_local_to_global(path, nranks=2)
+    for i in [1, 2]:
+        write_schout(path, ref, stack=i)
+    write_vgrid(path)
+
+    # the last stack is still open until the run ends
+    assert schism.completed_stacks(path) == [1]
+    assert schism.completed_stacks(path, final=True) == [1, 2]
+
+    m = schism.__new__(schism)
+    m.misc = {}
+    m.watch(rpath=path, cache_dir=str(tmpdir))
+    assert os.path.exists(path + 'outputs/schout_1.nc')
+    assert not os.path.exists(path + 'outputs/schout_2.nc')
+
+    stop = threading.Event()
+    stop.set()
+    m.watch(rpath=path, cache_dir=str(tmpdir), stop=stop)
+    assert os.path.exists(path + 'outputs/schout_2.nc')
+
+
+def test_topology_cache(tmpdir):
+    path = str(tmpdir) + '/'
+    ref = write_local_to_global(path, nranks=2)
+
+    m = schism.__new__(schism)
+    m.misc = {}
+    m.global2local(rpath=path)
+
+    m.ugrid(cache_dir=str(tmpdir)) # off by default
+    assert not os.path.exists(str(tmpdir) + '/topology')
+
+    topo = m.ugrid(cache=True, cache_dir=str(tmpdir))
+    assert len(glob.glob(str(tmpdir) + '/topology/topology_*.nc')) == 1
+    cached = m.ugrid(cache=True, cache_dir=str(tmpdir))
+
+    for a, b in zip(topo, cached):
+        assert a.identical(b)
+    assert topo[2].SCHISM_hgrid_edge_nodes.shape == ref['sides'].shape
+
+
+@pytest.mark.parametrize('memory', [1024, 1e-3])
+def test_hotstart(tmpdir, memory):
+    path = str(tmpdir) + '/'
+    ref = write_local_to_global(path, nranks=3)
+    fields = write_hotstart(path, ref, it=10)
+
+    m = schism.__new__(schism)
+    m.misc = {}
+    m.hotstart(it=10, rpath=path, hotstart_memory=memory)
+
+    with xr.open_dataset(path + 'outputs/hotstart_it=10.nc') as ds:
+        for key, value in fields.items():
+            assert np.array_equal(ds[key].values, value)
+        assert ds.iths.values[0] == 10
+        assert ds.tr_nd.dims == ('node', 'nVert', 'ntracers')
+        assert ds.su2.dims == ('side', 'nVert')
+
+
+def test_results_encoding(tmpdir):
+    path = str(tmpdir) + '/'
+    ref = write_local_to_global(path, nranks=2)
+    fields = write_schout(path, ref, stack=1)
+    write_vgrid(path)
+
+    m = schism.__new__(schism)
+    m.misc = {}
+    m.results(rpath=path, cache_dir=str(tmpdir), zlib=True, complevel=5, digits=3, chunking='station')
+
+    with xr.open_dataset(path + 'outputs/schout_1.nc') as ds:
+        assert np.allclose(ds.zcor.values, fields['zcor'], rtol=1e-3, atol=0)
+        assert ds.zcor.encoding['zlib'] and ds.zcor.encoding['shuffle']
+        assert ds.zcor.encoding['chunksizes'] == ds.zcor.shape
+        # the mesh is not quantized
+        assert np.array_equal(ds.SCHISM_hgrid_node_x.values[0], ref['x'])
+
+
+def test_results_zarr(tmpdir):
+    pytest.importorskip('zarr')
+    path = str(tmpdir) + '/'
+    ref = write_local_to_global(path, nranks=2)
+    fields = [write_schout(path, ref, stack=i) for i in [1, 2]]
+    write_vgrid(path)
+
+    store = str(tmpdir) + '/schout.zarr'
+    m = schism.__new__(schism)
+    m.misc = {}
+    m.results(rpath=path, cache_dir=str(tmpdir), zarr=store, chunking='map')
+    # passing the stacks again does not duplicate times
+    m.results(rpath=path, cache_dir=str(tmpdir), zarr=store, stacks=[2])
+
+    with xr.open_zarr(store) as ds:
+        assert ds.time.size == 6
+        assert np.array_equal(ds.elev.values, np.concatenate([f['elev'] for f in fields]))
+        assert ds.elev.encoding['chunks'][0] == 1
+
+
+def test_results_zarr_retry(tmpdir):
+    pytest.importorskip('zarr')
+    path = str(tmpdir) + '/'
+    ref = write_local_to_global(path, nranks=2)
+    fields = [write_schout(path, ref, stack=i) for i in [1, 2, 3]]
+    write_vgrid(path)
+
+    # stack 2 fails while stack 3 is combined
+    with open(path + 'outputs/schout_0001_2.nc', 'w') as f:
+        f.write('corrupted')
+
+    store = str(tmpdir) + '/schout.zarr'
+    m = schism.__new__(schism)
+    m.misc = {}
+    errors = m.results(rpath=path, cache_dir=str(tmpdir), zarr=store, incremental=True)
+    assert list(errors.keys()) == [2]
+    with xr.open_zarr(store) as ds:
+        assert ds.time.size == 3
+
+    # retried, stack 2 and then the up to date stack 3 are appended
+    write_schout(path, ref, stack=2)
+    assert m.results(rpath=path, cache_dir=str(tmpdir), zarr=store, incremental=True) == {}
+
+    with xr.open_zarr(store) as ds:
+        assert np.array_equal(ds.elev.values, np.concatenate([f['elev'] for f in fields]))
+
+    # out of order times are not dropped silently
+    with xr.open_dataset(path + 'outputs/schout_2.nc') as ds:
+        with pytest.raises(ValueError):
+            enc.append_zarr(ds.assign_coords(time=ds.time + np.timedelta64(30, 'm')), store)
+
+
+def test_virtual(tmpdir, monkeypatch):
+    path = str(tmpdir) + '/'
+    ref = write_local_to_global(path, nranks=3)
+    fields = [write_schout(path, ref, stack=i) for i in [1, 2]]
+    write_vgrid(path)
+
+    m = schism.__new__(schism)
+    m.misc = {}
+    ds = m.virtual(rpath=path, cache_dir=str(tmpdir), virtual_points=4)
+
+    assert np.array_equal(ds.elev.values, np.concatenate([f['elev'] for f in fields]))
+    assert np.array_equal(ds.zcor.values, np.concatenate([f['zcor'] for f in fields]))
+    assert np.array_equal(ds.wetdry_elem.values, np.concatenate([f['wetdry_elem'] for f in fields]))
+    assert not glob.glob(path + 'outputs/schout_[!0]*.nc')
+
+    # one node of one stack reads only the cores of its chunk in that stack
+    opened = []
+    open_dataset = xr.open_dataset
+    monkeypatch.setattr(xr, 'open_dataset', lambda f, **kw: opened.append(f) or open_dataset(f, **kw))
+
+    node = 17
+    val = ds.elev.isel(time=4, nSCHISM_hgrid_node=node).compute(scheduler='synchronous')
+    assert val == fields[1]['elev'][1, node]
+    assert all(f.endswith('_2.nc') for f in opened)
+    assert 0 < len(opened) < 3
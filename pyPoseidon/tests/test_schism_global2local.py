@@ -0,0 +1,38 @@
+import pyPoseidon.utils.global2local as gl
+import pytest
+import numpy as np
+import os
+
+from .meshes import write_local_to_global
+
+
+@pytest.mark.parametrize('nranks', [1, 3])
+def test_read(tmpdir, nranks):
+    path = str(tmpdir) + '/'
+    ref = write_local_to_global(path, nranks=nranks)
+
+    g2l = gl.read(path)
+
+    assert g2l['keys'].size == nranks
+    assert np.allclose(g2l['grd'][:, 0], ref['x'], atol=1e-6)
+    assert np.allclose(g2l['grd'][:, 2], ref['depth'], atol=1e-6)
+    assert np.array_equal(g2l['face_nodes'], ref['faces'])
+    assert np.array_equal(np.unique(g2l['side_global']), np.arange(1, ref['sides'].shape[0] + 1))
+
+
+def test_sidecar(tmpdir):
+    path = str(tmpdir) + '/'
+    write_local_to_global(path, nranks=2)
+
+    g2l = gl.read(path)
+    assert os.path.exists(path + 'outputs/' + gl.SIDECAR)
+
+    # second call is served from the sidecar
+    cached = gl.read(path)
+    for key in ['node_global', 'elem_global', 'side_global', 'face_nodes', 'grd']:
+        assert np.array_equal(g2l[key], cached[key])
+
+    # a modified decomposition invalidates the sidecar
+    write_local_to_global(path, nranks=2, nx=7)
+    new = gl.read(path)
+    assert new['grd'].shape[0] == 7 * 5
@@ -1,8 +1,14 @@
 import pyPoseidon.grid as pgrid
+import pyPoseidon.utils.cache as pcache
+from pyPoseidon.schism import schism
 import pytest
 import os
+import shutil
+import numpy as np
+from scipy.spatial.distance import cdist
 
 from . import DATA_DIR
+from .meshes import write_gr3
 
 
 def func(tmpdir,name):
@@ -27,3 +33,120 @@ def func(tmpdir,name):
 
 def test_answer(tmpdir):
     assert func(tmpdir,'hgrid.gr3') == True
+
+
+def test_snap():
+    grid = pgrid.grid(type='tri2d',grid_file=DATA_DIR / 'hgrid.gr3')
+    x = grid.Dataset.SCHISM_hgrid_node_x.values
+    y = grid.Dataset.SCHISM_hgrid_node_y.values
+    depth = grid.Dataset.depth.values
+
+    px = np.random.uniform(x.min(), x.max(), 50)
+    py = np.random.uniform(y.min(), y.max(), 50)
+
+    idx = grid.snap(px, py)
+    assert np.array_equal(idx, cdist(np.column_stack([px, py]), np.column_stack([x, y])).argmin(axis=1))
+
+    # the tree is reused
+    assert grid.node_tree()[0] is grid.node_tree()[0]
+
+    # only wet nodes
+    threshold = np.median(depth)
+    wet = np.flatnonzero(depth > threshold)
+    idx = grid.snap(px, py, depth=threshold)
+    assert np.array_equal(idx, wet[cdist(np.column_stack([px, py]), np.column_stack([x[wet], y[wet]])).argmin(axis=1)])
+
+
+def test_read_file(tmpdir):
+    filename = str(tmpdir.join('hgrid.gr3'))
+    ref = write_gr3(filename, nx=12, ny=9)
+
+    g = pgrid.tri2d.read_file(filename)
+
+    assert np.allclose(g.SCHISM_hgrid_node_x.values, ref['x'])
+    assert np.allclose(g.depth.values, ref['depth'])
+    assert np.array_equal(g.SCHISM_hgrid_face_nodes.values, ref['faces'])
+    for i, o in enumerate(ref['open']):
+        assert np.array_equal(g['open_boundary_{}'.format(i + 1)].dropna('index').values, o)
+    for i, (l, t) in enumerate(ref['land']):
+        assert np.array_equal(g['land_boundary_{}'.format(i + 1)].dropna('index').values, l)
+    assert list(g.type.dropna('label').values) == [t for _, t in ref['land']]
+
+
+def test_to_file(tmpdir):
+    filename = str(tmpdir.join('hgrid.gr3'))
+    write_gr3(filename, nx=12, ny=9)
+    grid = pgrid.grid(type='tri2d',grid_file=filename)
+
+    filename_ = str(tmpdir.join('hgrid_.gr3'))
+    grid.to_file(filename_)
+    assert grid.Dataset.equals(pgrid.tri2d.read_file(filename_))
+
+    # node based property
+    manning = np.random.rand(grid.Dataset.nSCHISM_hgrid_node.size)
+    grid.to_property(str(tmpdir.join('manning.gr3')), manning)
+    man = np.loadtxt(str(tmpdir.join('manning.gr3')), skiprows=2)
+    assert man.shape[0] == manning.size
+    assert np.allclose(man[:,3], manning, atol=1e-10)
+    assert np.array_equal(man[:,1], grid.Dataset.SCHISM_hgrid_node_x.values)
+
+
+def test_mesh_cache(tmpdir, monkeypatch):
+    # the gr3 files hashed
+    hashed = []
+    file_digest = pcache.file_digest
+    def count(filename, *args):
+        hashed.append(filename)
+        return file_digest(filename, *args)
+    monkeypatch.setattr(pcache, 'file_digest', count)
+
+    filename = str(tmpdir.join('hgrid.gr3'))
+    write_gr3(filename, nx=12, ny=9)
+    cache_dir = str(tmpdir.join('cache'))
+    opts = {'type' : 'tri2d', 'cache' : True, 'cache_dir' : cache_dir}
+
+    def grids():
+        return [f for f in os.listdir(os.path.join(cache_dir, 'grid')) if f.startswith('grid_')]
+
+    # off by default
+    pgrid.grid(type='tri2d',grid_file=filename)
+    assert not os.path.exists(cache_dir)
+
+    grid = pgrid.grid(grid_file=filename, **opts)
+    assert sorted(os.listdir(str(tmpdir))) == ['cache', 'hgrid.gr3'] # nothing next to the gr3
+    cfiles = grids()
+    assert len(cfiles) == 1
+
+    # an unchanged gr3 is not hashed again
+    pgrid.grid(grid_file=filename, **opts)
+    assert hashed == [filename]
+
+    # served from the cache, also for a copy elsewhere
+    os.makedirs(str(tmpdir.join('run')))
+    copy = str(tmpdir.join('run', 'hgrid.gr3'))
+    shutil.copyfile(filename, copy)
+    cached = pgrid.grid(grid_file=copy, **opts)
+    assert cached.Dataset.identical(grid.Dataset)
+    assert grids() == cfiles
+
+    # a modified grid is a new entry
+    write_gr3(filename, nx=10, ny=9)
+    new = pgrid.grid(grid_file=filename, **opts)
+    assert new.Dataset.identical(pgrid.tri2d.read_file(filename))
+    assert new.Dataset.SCHISM_hgrid_node_x.size == 90
+    assert len(grids()) == 2
+    assert len(hashed) == 3
+
+
+def test_read_folder_cache(tmpdir):
+    rfolder = str(tmpdir.join('run'))
+    os.makedirs(rfolder)
+    write_gr3(os.path.join(rfolder, 'hgrid.gr3'))
+    with open(os.path.join(rfolder, 'param.nml'), 'w') as f:
+        f.write('dt = 400\n')
+    cache_dir = str(tmpdir.join('cache'))
+
+    m = schism.__new__(schism)
+    m.read_folder(rfolder, cache=True, cache_dir=cache_dir)
+    assert m.grid.Dataset.SCHISM_hgrid_node_x.size == 30
+    assert len([f for f in os.listdir(os.path.join(cache_dir, 'grid')) if f.startswith('grid_')]) == 1
@@ -0,0 +1,74 @@
+import pyPoseidon.utils.staout as staout
+import pandas as pd
+import numpy as np
+import os
+
+
+def write_stations(path, nstations=5, ntimes=4, flags=[1, 0, 0, 0, 0, 0, 1, 1, 0]):
+    os.makedirs(os.path.join(path, 'outputs'), exist_ok=True)
+    x, y = 10 + np.arange(nstations) * .5, 40 + np.arange(nstations) * .25
+    with open(os.path.join(path, 'station.in'), 'w') as f:
+        f.write(' '.join(str(i) for i in flags) + '\n')
+        f.write('{}\n'.format(nstations))
+        for i in range(nstations):
+            f.write('{} {} {} 0\n'.format(i + 1, x[i], y[i]))
+
+    values = {}
+    t = np.arange(1, ntimes + 1) * 600.
+    for i, flag in enumerate(flags):
+        if flag != 1 : continue
+        values[staout.VARIABLES[i]] = np.random.rand(ntimes, nstations)
+        np.savetxt(os.path.join(path, 'outputs', 'staout_{}'.format(i + 1)), np.column_stack([t, values[staout.VARIABLES[i]]]), fmt='%.8E')
+
+    return x, y, t, values
+
+
+def test_dataset(tmpdir):
+    path = str(tmpdir)
+    x, y, t, values = write_stations(path)
+
+    ds = staout.dataset(path, '2020-01-01')
+
+    assert list(ds.data_vars) == ['elev', 'u', 'v']
+    for var, v in values.items():
+        assert np.allclose(ds[var].values, v, rtol=1e-7)
+    assert np.array_equal(ds.time.values, (pd.Timestamp('2020-01-01') + pd.to_timedelta(t, unit='s')).values)
+    assert np.array_equal(ds.point.values, np.arange(1, 6))
+    assert np.array_equal(ds.SCHISM_hgrid_node_x.values, x)
+    assert np.array_equal(ds.SCHISM_hgrid_node_y.values, y)
+
+
+def test_cache(tmpdir):
+    path = str(tmpdir)
+    write_stations(path)
+    sfile = os.path.join(path, 'outputs', 'staout_1')
+
+    a = staout.read(sfile)
+    assert os.path.exists(sfile + '.npy')
+
+    b = staout.read(sfile)
+    assert isinstance(b, np.memmap)
+    assert np.array_equal(a, b)
+    assert np.array_equal(a, np.loadtxt(sfile))
+
+
+def test_cache_tmp(tmpdir, monkeypatch):
+    # a unique temporary file next to the cache, concurrent readers do not share it
+    path = str(tmpdir)
+    write_stations(path)
+    sfile = os.path.join(path, 'outputs', 'staout_1')
+
+    names = []
+    mkstemp = staout.tempfile.mkstemp
+    def record(*args, **kwargs):
+        fd, name = mkstemp(*args, **kwargs)
+        names.append(name)
+        return fd, name
+    monkeypatch.setattr(staout.tempfile, 'mkstemp', record)
+
+    staout.read(sfile)
+    os.utime(sfile + '.npy', (0, 0)) # stale cache, parsed again
+    staout.read(sfile)
+
+    assert len(set(names)) == 2 and all(os.path.dirname(n) == os.path.dirname(sfile) for n in names)
+    assert not [f for f in os.listdir(os.path.dirname(sfile)) if f.endswith('.tmp')] # renamed
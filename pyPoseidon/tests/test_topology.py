@@ -0,0 +1,76 @@
+import pyPoseidon.utils.topology as tp
+from pyPoseidon.schism import schism
+import pytest
+import numpy as np
+import xarray as xr
+
+from .meshes import mesh
+
+
+def reference_edges(faces):
+    # first appearance of each edge, in the orientation it is first seen (former loop of schism.results)
+    sides = [e for [a, b, c] in faces for e in [(b, c), (c, a), (a, b)]]
+    return np.array(list(schism.remove_reversed_duplicates(sides)))
+
+
+@pytest.mark.parametrize('shape', [(3, 3), (10, 7)])
+def test_edges(shape):
+    x, y, depth, faces = mesh(*shape)
+    assert np.array_equal(tp.edges(faces), reference_edges(faces))
+
+
+def grid_dataset(x, y, faces):
+    return xr.Dataset({'SCHISM_hgrid_node_x' : ('nSCHISM_hgrid_node', x),
+                       'SCHISM_hgrid_node_y' : ('nSCHISM_hgrid_node', y),
+                       'SCHISM_hgrid_face_nodes' : (['nSCHISM_hgrid_face', 'nMaxSCHISM_hgrid_face_nodes'], faces)})
+
+
+def test_mesh_accessor():
+    x, y, depth, faces = mesh(6, 5)
+    ds = grid_dataset(x, y, faces)
+    m = ds.mesh
+
+    assert ds.mesh is m # the accessor (and its cache) stays with the Dataset
+
+    indptr, indices = m.node_elements
+    for i in range(x.size):
+        assert set(indices[indptr[i]:indptr[i+1]]) == set(np.flatnonzero((faces == i).any(axis=1)))
+
+    indptr, indices = m.node_nodes
+    for i in range(x.size):
+        ref = set(faces[(faces == i).any(axis=1)].ravel()) - {i}
+        assert set(indices[indptr[i]:indptr[i+1]]) == ref
+
+    assert np.array_equal(m.edges, tp.edges(faces))
+    assert np.isclose(m.areas.sum(), (x.max() - x.min()) * (y.max() - y.min()))
+    assert np.allclose(m.centroids, np.column_stack([x[faces].mean(axis=1), y[faces].mean(axis=1)]))
+    assert m.areas is m.areas
+
+
+def test_boundary_loops():
+    nx, ny = 6, 5
+    x, y, depth, faces = mesh(nx, ny)
+
+    loops = grid_dataset(x, y, faces).mesh.boundary_loops
+    assert len(loops) == 1
+    assert loops[0][0] == loops[0][-1]
+    perimeter = set(np.flatnonzero((x == x.min()) | (x == x.max()) | (y == y.min()) | (y == y.max())))
+    assert set(loops[0]) == perimeter
+    assert loops[0].size == len(perimeter) + 1
+
+    # hole around an inner node
+    inner = 2 * nx + 2
+    keep = ~(faces == inner).any(axis=1)
+    loops = tp.boundary_loops(faces[keep])
+    assert len(loops) == 2
+    hole = [l for l in loops if inner - 1 in l and l.size < 10][0]
+    assert set(hole) == set(faces[~keep].ravel()) - {inner}
+
+
+def test_chains():
+    # an open line given out of order and reversed, and a closed loop
+    pairs = np.array([[7, 5], [3, 5], [3, 9], [20, 22], [21, 22], [20, 21]])
+    out = tp.chains(pairs)
+    assert len(out) == 2
+    assert np.array_equal(out[0], [7, 5, 3, 9])
+    assert np.array_equal(out[1], [20, 21, 22])
@@ -0,0 +1,145 @@
+"""
+Helpers for the on-disk caches of pyPoseidon
+
+The caches under cache_dir (tri2d grids, JIGSAW meshes, mesh topologies and DEM tiles) are opt-in:
+they are used when cache=True is passed, or by default once CACHE is set to True. Each one is a
+subfolder of cache_dir (default CACHE_DIR) whose least recently used files are evicted above its size.
+
+"""
+# Copyright 2018 European Union
+# This file is part of pyPoseidon.
+# Licensed under the EUPL, Version 1.2 or – as soon they will be approved by the European Commission - subsequent versions of the EUPL (the "Licence").
+# Unless required by applicable law or agreed to in writing, software distributed under the Licence is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the Licence for the specific language governing permissions and limitations under the Licence.
+
+import numpy as np
+import xarray as xr
+import hashlib
+import os
+import logging
+
+logger = logging.getLogger('pyPoseidon')
+
+
+# default location, can be changed with the PYPOSEIDON_CACHE environment variable
+CACHE_DIR = os.environ.get('PYPOSEIDON_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'pyPoseidon'))
+
+# default of the cache option, the caches are used only when asked
+CACHE = False
+
+
+def cache_dir(path=None, name=''):
+    """Return (and create) the cache folder name under path (default CACHE_DIR)
+    """
+    folder = os.path.join(path or CACHE_DIR, name)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def digest(*items):
+    """sha1 hex digest of arrays, strings and bytes
+    """
+    h = hashlib.sha1()
+    for item in items:
+        if isinstance(item, np.ndarray):
+            h.update(str(item.dtype).encode())
+            h.update(str(item.shape).encode())
+            h.update(np.ascontiguousarray(item).tobytes())
+        elif isinstance(item, bytes):
+            h.update(item)
+        else:
+            h.update(str(item).encode())
+    return h.hexdigest()
+
+
+def file_digest(filename, blocksize=2**24):
+    """sha1 hex digest of the content of a file, or of the names and contents of the files of a folder (e.g. a Zarr store)
+    """
+    h = hashlib.sha1()
+
+    files = [filename]
+    if os.path.isdir(filename):
+        files = sorted(os.path.join(root, name) for root, dirs, names in os.walk(filename) for name in names)
+
+    for name in files:
+        if name != filename : h.update(os.path.relpath(name, filename).encode())
+        with open(name, 'rb') as f:
+            for block in iter(lambda: f.read(blocksize), b''):
+                h.update(block)
+    return h.hexdigest()
+
+
+def file_key(filename, folder):
+    """file_digest of filename, remembered in folder under its real path (symlinks resolved), size
+    and modification time, so that an unchanged file is not read again
+    """
+    st = os.stat(filename)
+    kfile = os.path.join(folder, 'key_{}'.format(digest(os.path.realpath(filename), st.st_size, st.st_mtime_ns)))
+
+    if os.path.exists(kfile):
+        with open(kfile) as f:
+            key = f.read().strip()
+        os.utime(kfile) # LRU order, see evict
+        return key
+
+    key = file_digest(filename)
+    tmp = kfile + '.{}.tmp'.format(os.getpid())
+    try:
+        with open(tmp, 'w') as f:
+            f.write(key)
+        os.replace(tmp, kfile)
+    except OSError as e:
+        logger.warning('cache key not saved: {}'.format(e))
+    return key
+
+
+def load(cfile):
+    """Dataset stored in cfile, None if missing or unreadable. A hit marks the file as recently used.
+    """
+    if not os.path.exists(cfile) : return None
+    try:
+        with xr.open_dataset(cfile) as c:
+            ds = c.load()
+        os.utime(cfile) # LRU order, see evict
+        return ds
+    except Exception as e:
+        logger.warning('ignoring cache file {}: {}'.format(cfile, e))
+        return None
+
+
+def save(ds, cfile, max_size=None):
+    """Store ds in cfile (atomic) and evict the least recently used files of the folder above max_size (MB)
+    """
+    tmp = cfile + '.{}.tmp'.format(os.getpid()) # unique per process
+    try:
+        ds.to_netcdf(tmp)
+        os.replace(tmp, cfile)
+    except Exception as e:
+        logger.warning('cache not saved: {}'.format(e))
+        if os.path.exists(tmp) : os.remove(tmp)
+        return
+
+    if max_size is not None:
+        evict(os.path.dirname(cfile), max_size, keep=cfile)
+
+
+def evict(folder, max_size, keep=None):
+    """Remove the least recently used (oldest modification time) files of folder until it is within max_size (MB)
+    """
+    files = []
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if name.endswith('.tmp') or not os.path.isfile(path) : continue
+        st = os.stat(path)
+        files.append((st.st_mtime, st.st_size, path))
+
+    total = sum(f[1] for f in files)
+    for mtime, size, path in sorted(files):
+        if total <= max_size * 2**20 : break
+        if path == keep : continue
+        try:
+            os.remove(path)
+            total -= size
+            logger.info('removed {} from cache'.format(path))
+        except OSError:
+            pass
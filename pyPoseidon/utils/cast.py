@@ -243,8 +243,9 @@ class scast():
 
             m=pmodel(**info)           
             
-            # Grid         
-            m.grid=pgrid.grid(type='tri2d',**info)
+            # Grid, through the grid cache when asked
+            opts = {k : kwargs.get(k, getattr(self, k, None)) for k in ['cache','cache_dir','grid_cache_size']}
+            m.grid=pgrid.grid(type='tri2d',**{**info, **{k : v for k, v in opts.items() if v is not None}})
                  
             # get lat/lon from file
             if hasattr(self, 'grid_file'):
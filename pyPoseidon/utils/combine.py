@@ -0,0 +1,145 @@
+"""
+Combine per core SCHISM arrays to the global mesh using precomputed scatter indices
+
+"""
+# Copyright 2018 European Union
+# This file is part of pyPoseidon.
+# Licensed under the EUPL, Version 1.2 or – as soon they will be approved by the European Commission - subsequent versions of the EUPL (the "Licence").
+# Unless required by applicable law or agreed to in writing, software distributed under the Licence is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the Licence for the specific language governing permissions and limitations under the Licence.
+
+import numpy as np
+import netCDF4
+import pyPoseidon.utils.global2local as gl
+
+
+def index(g2l):
+    """Gather/scatter arrays per location type (elem, node, side).
+
+    For core i, src[offsets[i]:offsets[i+1]] are positions in the local arrays (start index 0)
+    and dst[offsets[i]:offsets[i+1]] the matching global positions. Every global entry is
+    taken from the first core that holds it.
+    """
+
+    sindex = {}
+    for loc in gl.LOCATIONS:
+        loffsets = g2l[loc + '_offsets']
+        idx = np.sort(gl.first_occurrence(g2l[loc + '_global'])) # retaining mask
+
+        sindex[loc] = {'src' : g2l[loc + '_local'][idx] - 1,
+                       'dst' : g2l[loc + '_global'][idx] - 1,
+                       'offsets' : np.searchsorted(idx, loffsets),
+                       'size' : idx.size}
+
+    return sindex
+
+
+def combine(arrays, sindex, axis=0, out=None):
+    """Assemble the per core arrays into one global array.
+
+    arrays : list with one array per core, the location dimension at position axis
+    sindex : the entry of index() for the location type of the arrays
+    """
+
+    shape = list(arrays[0].shape)
+    shape[axis] = sindex['size']
+
+    if out is None:
+        out = np.empty(shape, dtype=np.result_type(*arrays))
+
+    offsets = sindex['offsets']
+    lead = (slice(None),) * axis
+    for i, a in enumerate(arrays):
+        i0, i1 = offsets[i], offsets[i+1]
+        out[lead + (sindex['dst'][i0:i1],)] = np.asarray(a)[lead + (sindex['src'][i0:i1],)]
+
+    return out
+
+
+# location dimensions of the per core hotstart files and their name in the combined file
+HOTSTART_LOCS = {'nResident_side' : 'side', 'nResident_elem' : 'elem', 'nResident_node' : 'node'}
+
+# renaming of the single (one dimensional) hotstart variables
+HOTSTART_RENAME = {'one' : 'one_new', 'it' : 'iths'}
+
+
+def stream(ov, pieces, sindex, axis, budget):
+    """Combine the per core variables (pieces) into the output variable ov in chunks
+    along the first non location axis, each chunk within budget (bytes).
+    """
+    shape = ov.shape
+    other = [i for i in range(len(shape)) if i != axis]
+
+    if not other:
+        ov[:] = combine([p[:] for p in pieces], sindex, axis=axis)
+        return
+
+    c = other[0]
+    row = ov.dtype.itemsize * np.prod(shape) / shape[c] # bytes per index along c
+    step = int(max(1, budget // row))
+
+    for i in range(0, shape[c], step):
+        sel = [slice(None)] * len(shape)
+        sel[c] = slice(i, min(i + step, shape[c]))
+        sel = tuple(sel)
+        ov[sel] = combine([p[sel] for p in pieces], sindex, axis=axis)
+
+
+def hotstart(hfiles, sindex, filename, memory=1024):
+    """Combine the per core hotstart files into filename.
+
+    The output file is preallocated and filled one variable (and one chunk of levels) at a time,
+    so that the arrays in memory stay within memory (MB).
+    """
+
+    budget = memory * 2**20 / 2 # the chunk and the pieces read from the cores
+
+    src = [netCDF4.Dataset(f) for f in hfiles]
+    for nc in src: nc.set_auto_maskandscale(False)
+
+    ref = src[0]
+
+    # variables in the order side, elem, node, single
+    groups = {'side':[], 'elem':[], 'node':[], 'one':[]}
+    for key, var in ref.variables.items():
+        locs = [HOTSTART_LOCS[d] for d in var.dimensions if d in HOTSTART_LOCS]
+        if locs:
+            groups[locs[0]].append(key)
+        elif len(var.dimensions) == 1:
+            groups['one'].append(key)
+
+    with netCDF4.Dataset(filename, 'w', format='NETCDF4') as out:
+
+        for group, keys in groups.items():
+            for key in keys:
+                var = ref.variables[key]
+
+                if group == 'one':
+                    name = HOTSTART_RENAME.get(key, key)
+                    dims = [HOTSTART_RENAME.get(d, d) for d in var.dimensions]
+                else:
+                    name = key
+                    dims = [HOTSTART_LOCS.get(d, d) for d in var.dimensions]
+
+                for d, dout in zip(var.dimensions, dims):
+                    if dout not in out.dimensions:
+                        size = sindex[HOTSTART_LOCS[d]]['size'] if d in HOTSTART_LOCS else len(ref.dimensions[d])
+                        out.createDimension(dout, size)
+
+                # only the single variables keep their attributes
+                attrs = {k : var.getncattr(k) for k in var.ncattrs()} if group == 'one' else {}
+                fill = attrs.pop('_FillValue', np.nan if var.dtype.kind == 'f' else None)
+
+                ov = out.createVariable(name, var.dtype, dims, fill_value=fill)
+                ov.set_auto_maskandscale(False)
+                if attrs : ov.setncatts(attrs)
+
+                if group == 'one':
+                    ov[:] = var[:]
+                else:
+                    axis = [d in HOTSTART_LOCS for d in var.dimensions].index(True)
+                    stream(ov, [nc.variables[key] for nc in src], sindex[group], axis, budget)
+
+    for nc in src: nc.close()
+
+    return filename
@@ -157,6 +157,8 @@ class schism():
             self.folders = [rpath]
 
         
+        virtual = kwargs.get('virtual', False) # lazy view of the per core files, nothing is combined on disk
+        
         logger.info('Combining output\n')
                 
         datai=[]
@@ -173,6 +175,10 @@ class schism():
             
             p = pmodel(**info)
             
+            if virtual:
+                datai.append(p.virtual(rpath=folder + '/'))
+                continue
+            
             p.results()
                                     
             xdat = glob.glob(folder + '/outputs/schout_[!0]*.nc')
@@ -180,8 +186,11 @@ class schism():
             
             datai.append(xdat) #append to list 
                                        
-
-        self.Dataset = xr.open_mfdataset(datai,combine='by_coords',data_vars='minimal')
+        
+        if virtual:
+            self.Dataset = xr.combine_by_coords(datai, data_vars='minimal')
+        else:
+            self.Dataset = xr.open_mfdataset(datai,combine='by_coords',data_vars='minimal')
                                 
         
         dic={}
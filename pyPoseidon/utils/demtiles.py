@@ -0,0 +1,115 @@
+"""
+On-disk cache of DEM subsets, stored as tiles of the source grid
+
+"""
+# Copyright 2018 European Union
+# This file is part of pyPoseidon.
+# Licensed under the EUPL, Version 1.2 or – as soon they will be approved by the European Commission - subsequent versions of the EUPL (the "Licence").
+# Unless required by applicable law or agreed to in writing, software distributed under the Licence is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the Licence for the specific language governing permissions and limitations under the Licence.
+
+import numpy as np
+import xarray as xr
+import os
+import logging
+
+import pyPoseidon.utils.cache as pcache
+
+logger = logging.getLogger('pyPoseidon')
+
+
+# cells per side of the tiles
+TILE = 512
+
+# default size of the cache (MB)
+DEM_CACHE_SIZE = 4096
+
+
+def rename(data):
+    # first data variable as elevation, lat/lon coordinates as latitude/longitude
+    var = [keys for keys in data.data_vars]
+    coords = [keys for keys in data.coords]
+    lat = [x for x in coords if 'lat' in  x]
+    lon = [x for x in coords if 'lon' in  x]
+    names = {lat[0] : 'latitude', lon[0] : 'longitude'}
+    if var : names[var[0]] = 'elevation'
+    return data.rename(names)
+
+
+def source_key(source):
+    """Key of the source: the URL, or the path with the size and modification time of a local file
+    """
+    source = str(source)
+    if os.path.exists(source):
+        st = os.stat(source)
+        return '{}:{}:{}'.format(os.path.abspath(source), st.st_size, st.st_mtime)
+    return source
+
+
+class tiles:
+    """Tiles (TILE x TILE cells) of the elevation of source stored in folder.
+
+    The axes of the source and every tile read are kept, so a window already seen is assembled
+    without opening the source. The least recently used tiles are removed above max_size (MB).
+    """
+
+    def __init__(self, source, folder=None, max_size=DEM_CACHE_SIZE, tile=TILE):
+        self.source = source
+        self.folder = pcache.cache_dir(folder, 'dem')
+        self.max_size = max_size
+        self.tile = tile
+        self.key = source_key(source)
+        self._data = None
+
+    def data(self):
+        # the source, opened on the first miss
+        if self._data is None:
+            logger.info('opening dem source {}\n'.format(self.source))
+            self._data = rename(xr.open_dataset(self.source))
+        return self._data
+
+    def cfile(self, *items):
+        return os.path.join(self.folder, 'dem_{}.nc'.format(pcache.digest(self.key, 'elevation', self.tile, *items)))
+
+    def axes(self):
+        """Dataset with the longitude, latitude coordinates of the source, the attrs of the elevation as its attrs
+        """
+        cfile = self.cfile('axes')
+        ds = pcache.load(cfile)
+        if ds is None:
+            data = self.data()
+            ds = xr.Dataset(coords={'longitude' : data.longitude.load(), 'latitude' : data.latitude.load()}, attrs=data.elevation.attrs)
+            pcache.save(ds, cfile, max_size=self.max_size)
+        return ds
+
+    def read(self, j, i):
+        """Elevation of the tile (j, i)
+        """
+        cfile = self.cfile(j, i)
+        ds = pcache.load(cfile)
+        if ds is None:
+            t = self.tile
+            logger.info('fetching dem tile {} {}\n'.format(j, i))
+            ds = self.data().elevation.isel(latitude=slice(j * t, (j + 1) * t), longitude=slice(i * t, (i + 1) * t)).transpose('latitude', 'longitude').load().to_dataset()
+            pcache.save(ds, cfile, max_size=self.max_size)
+        return ds.elevation.values
+
+    def isel(self, latitude, longitude):
+        """Elevation of the window (slices of the source indices), assembled from the tiles
+        """
+        ax = self.axes()
+        lat = np.arange(ax.latitude.size)[latitude]
+        lon = np.arange(ax.longitude.size)[longitude]
+
+        t = self.tile
+        jt = range(lat[0] // t, lat[-1] // t + 1)
+        it = range(lon[0] // t, lon[-1] // t + 1)
+
+        values = np.block([[self.read(j, i) for i in it] for j in jt])
+        values = values[lat[0] - jt[0] * t:lat[-1] - jt[0] * t + 1, lon[0] - it[0] * t:lon[-1] - it[0] * t + 1]
+
+        return xr.DataArray(values, dims=['latitude', 'longitude'], name='elevation', attrs=ax.attrs,
+                            coords={'latitude' : ax.latitude[latitude], 'longitude' : ax.longitude[longitude]})
+
+    def close(self):
+        if self._data is not None : self._data.close()
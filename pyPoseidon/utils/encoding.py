@@ -0,0 +1,137 @@
+"""
+Encoding (compression, quantization, chunking) of combined model output
+
+"""
+# Copyright 2018 European Union
+# This file is part of pyPoseidon.
+# Licensed under the EUPL, Version 1.2 or – as soon they will be approved by the European Commission - subsequent versions of the EUPL (the "Licence").
+# Unless required by applicable law or agreed to in writing, software distributed under the Licence is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the Licence for the specific language governing permissions and limitations under the Licence.
+
+import numpy as np
+import xarray as xr
+import os
+import logging
+
+logger = logging.getLogger('pyPoseidon')
+
+
+# horizontal dimensions that are split in blocks of points for station (time series) access
+POINT_DIMS = ['nSCHISM_hgrid_node', 'nSCHISM_hgrid_face', 'nSCHISM_hgrid_edge']
+
+# points per chunk for station access
+STATION_POINTS = 10000
+
+ACCESS = ['map', 'station']
+
+# mesh variables, never quantized
+MESH_VARS = ['depth']
+MESH_PREFIX = 'SCHISM_hgrid'
+
+
+def quantize(a, digits):
+    """Round floats to about digits significant decimal digits by zeroing the trailing mantissa bits.
+
+    The result is exact to the retained bits and compresses well with zlib/shuffle.
+    """
+    a = np.asarray(a)
+    if a.dtype.kind != 'f' or digits is None : return a
+
+    nmant = np.finfo(a.dtype).nmant
+    keep = int(np.ceil(digits * np.log2(10)))
+    if keep >= nmant : return a
+
+    itype = np.dtype('u{}'.format(a.dtype.itemsize)).type
+    drop = itype(nmant - keep)
+    half = itype(1) << (drop - itype(1))
+    mask = ~((itype(1) << drop) - itype(1))
+
+    b = (a.view(itype) + half) & mask # round to nearest
+
+    return np.where(np.isfinite(a), b.view(a.dtype), a)
+
+
+def chunks(var, access, points=STATION_POINTS):
+    """Chunk shape of a time dependent variable for 'map' (one time step per chunk)
+    or 'station' (the whole time axis per chunk) access.
+    """
+    if access is None or 'time' not in var.dims : return None
+
+    if access not in ACCESS:
+        raise ValueError('unknown access pattern {}, use one of {}'.format(access, ACCESS))
+
+    shape = []
+    for dim, n in zip(var.dims, var.shape):
+        if dim == 'time':
+            shape.append(1 if access == 'map' else n)
+        elif access == 'station' and dim in POINT_DIMS:
+            shape.append(min(n, points))
+        else:
+            shape.append(n)
+
+    return tuple(max(1, c) for c in shape)
+
+
+def encoding(ds, zlib=False, complevel=4, shuffle=True, access=None, engine='netcdf4'):
+    """Per variable encoding for ds.to_netcdf (engine='netcdf4') or ds.to_zarr (engine='zarr')
+    """
+    enc = {}
+    for name, var in ds.data_vars.items():
+        e = {}
+
+        if zlib:
+            if engine == 'zarr':
+                import numcodecs
+                e['compressor'] = numcodecs.Zlib(level=complevel)
+                if shuffle : e['filters'] = [numcodecs.Shuffle(elementsize=var.dtype.itemsize)]
+            else:
+                e.update({'zlib' : True, 'complevel' : complevel, 'shuffle' : shuffle})
+
+        c = chunks(var, access)
+        if c : e['chunks' if engine == 'zarr' else 'chunksizes'] = c
+
+        if e : enc[name] = e
+
+    return enc
+
+
+def quantize_dataset(ds, digits):
+    """Quantize the time dependent float variables of ds, except the mesh
+    """
+    if digits is None : return ds
+
+    for name, var in ds.data_vars.items():
+        if name in MESH_VARS or name.startswith(MESH_PREFIX) : continue
+        if 'time' in var.dims and var.dtype.kind == 'f':
+            ds[name] = var.copy(data=quantize(var.values, digits))
+
+    return ds
+
+
+def append_zarr(ds, store, **kwargs):
+    """Append ds along time to the Zarr store, creating it if needed.
+
+    Only the time steps after the last one in the store are appended, so that a stack can be
+    passed again without duplicating times. Earlier times missing from the store raise a
+    ValueError, the stacks have to be appended in order. kwargs are the encoding options of the new store.
+    """
+    if not os.path.exists(store):
+        ds.to_zarr(store, mode='w', encoding=encoding(ds, engine='zarr', **kwargs))
+        return ds.time.size
+
+    with xr.open_zarr(store) as zs:
+        times = zs.time.values
+
+    new = ds.time.values > times[-1]
+    missing = ~np.isin(ds.time.values[~new], times)
+    if missing.any():
+        raise ValueError('{} times before the end of {} are not in it, append in time order'.format(int(missing.sum()), store))
+
+    if not new.any():
+        logger.info('times already in {}, skipping\n'.format(store))
+        return 0
+
+    tvars = [name for name, var in ds.data_vars.items() if 'time' in var.dims]
+    ds[tvars].isel(time=new).to_zarr(store, append_dim='time')
+
+    return int(new.sum())
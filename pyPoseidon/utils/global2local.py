@@ -0,0 +1,184 @@
+"""
+Reader of the SCHISM domain decomposition files (outputs/local_to_global_*)
+
+"""
+# Copyright 2018 European Union
+# This file is part of pyPoseidon.
+# Licensed under the EUPL, Version 1.2 or – as soon they will be approved by the European Commission - subsequent versions of the EUPL (the "Licence").
+# Unless required by applicable law or agreed to in writing, software distributed under the Licence is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the Licence for the specific language governing permissions and limitations under the Licence.
+
+import numpy as np
+import glob
+import os
+import logging
+
+logger = logging.getLogger('pyPoseidon')
+
+
+SIDECAR = 'global2local.npz'
+
+LOCATIONS = ['elem', 'node', 'side']
+
+
+def signature(files):
+    # size and modification time of every file, used to validate the sidecar
+    sig = []
+    for name in files:
+        st = os.stat(name)
+        sig.append([st.st_size, st.st_mtime_ns])
+    return np.array(sig, dtype=np.int64).reshape(-1,2)
+
+
+def _numbers(lines, dtype):
+    # bulk parse of a block of whitespace separated numbers
+    return np.fromstring(' '.join(lines), dtype=dtype, sep=' ')
+
+
+def _pairs(lines):
+    # local/global index block
+    return _numbers(lines, np.int64).reshape(-1,2)
+
+
+def _elements(lines):
+    # element block : element type followed by the (local) vertices, padded with 0
+    n = len(lines)
+    values = _numbers(lines, np.int64)
+    if n == 0 or values.size % n == 0 : # all elements of the same type
+        return values.reshape(n,-1)
+
+    out = np.zeros((n,5), dtype=np.int64)
+    for i, line in enumerate(lines):
+        row = np.fromstring(line, dtype=np.int64, sep=' ')
+        out[i,:row.size] = row
+    return out
+
+
+def read_file(filename):
+    """Parse one local_to_global file into numpy arrays
+    """
+    with open(filename, 'r') as f:
+        lines = [l for l in f.read().splitlines() if l.strip()] # skip blank lines
+
+    header = _numbers(lines[:1], float)
+
+    ne = int(lines[2].split()[0])
+    j = 3
+    elems = _pairs(lines[j:j+ne])
+    j += ne
+
+    nq = int(lines[j].split()[0])
+    j += 1
+    nodes = _pairs(lines[j:j+nq])
+    j += nq
+
+    nw = int(lines[j].split()[0])
+    j += 1
+    sides = _pairs(lines[j:j+nw])
+    j += nw
+
+    # secondary headers, skipping the 'Header:' line
+    h0 = _numbers(lines[j+1:j+2], float)
+    h1 = _numbers(lines[j+2:j+3], float)
+    h2 = _numbers(lines[j+3:j+4], float)
+
+    # grid, skipping the 'np ne' line
+    j += 5
+    grid = _numbers(lines[j:j+nq], float).reshape(nq,-1)[:,:4]
+    j += nq
+
+    tri = _elements(lines[j:j+ne])
+
+    return {'header':header, 'h0':h0, 'h1':h1, 'h2':h2, 'elem':elems, 'node':nodes, 'side':sides, 'grid':grid, 'tri':tri}
+
+
+def first_occurrence(gindex):
+    """Positions of the first occurrence of every global index, sorted by the global index
+    """
+    _, idx = np.unique(gindex, return_index=True)
+    return idx
+
+
+def assemble(parts, keys):
+    """Combine the per core arrays to flat global maps
+    """
+
+    out = {'keys' : np.array(keys)}
+
+    for name in ['header','h0','h1','h2']:
+        out[name] = parts[0][name]
+
+    for loc in LOCATIONS:
+        counts = np.array([p[loc].shape[0] for p in parts], dtype=np.int64)
+        out[loc + '_offsets'] = np.concatenate([[0], np.cumsum(counts)])
+        out[loc + '_local'] = np.concatenate([p[loc][:,0] for p in parts])
+        out[loc + '_global'] = np.concatenate([p[loc][:,1] for p in parts])
+
+    # grid : one row per global node, lon, lat, depth, kbp00
+    grid = np.concatenate([p['grid'] for p in parts])
+    idx = first_occurrence(out['node_global'])
+    out['grd'] = grid[idx]
+
+    # tessellation with global node numbering (start index 0, -1 for missing vertices)
+    nvmax = max([p['tri'].shape[1] for p in parts]) - 1
+    faces = []
+    for i, p in enumerate(parts):
+        lut = np.zeros(p['node'][:,0].max() + 1, dtype=np.int64) # local -> global
+        lut[p['node'][:,0]] = p['node'][:,1]
+        tri = np.full((p['tri'].shape[0], nvmax), -1, dtype=np.int64)
+        local = p['tri'][:,1:]
+        tri[:,:local.shape[1]] = np.where(local > 0, lut[local] - 1, -1)
+        faces.append(tri)
+    faces = np.concatenate(faces)
+
+    idx = first_occurrence(out['elem_global'])
+    out['face_nodes'] = faces[idx]
+
+    return out
+
+
+def read(path='./', cache=True):
+    """Load the decomposition maps of a run folder.
+
+    The parsed arrays are saved in outputs/global2local.npz and reused as long as the
+    local_to_global files keep the same sizes and modification times.
+    """
+
+    gfiles = glob.glob(path + 'outputs/local_to_global_*')
+    gfiles.sort()
+
+    if not gfiles:
+        raise FileNotFoundError('no local_to_global files in {}outputs'.format(path))
+
+    names = np.array([os.path.basename(x) for x in gfiles])
+    sig = signature(gfiles)
+
+    sidecar = path + 'outputs/' + SIDECAR
+
+    if cache and os.path.exists(sidecar):
+        try:
+            with np.load(sidecar) as data:
+                if np.array_equal(data['files'], names) and np.array_equal(data['signature'], sig):
+                    logger.info('loading index references from {}\n'.format(sidecar))
+                    return {k : data[k] for k in data.files}
+        except Exception as e:
+            logger.warning('failed to read {}, rebuilding: {}\n'.format(sidecar, e))
+
+    #create a dict from filenames to identify parts
+    keys = ['core{}'.format(name.split('_')[-1]) for name in names]
+
+    parts = [read_file(x) for x in gfiles]
+
+    out = assemble(parts, keys)
+    out['files'] = names
+    out['signature'] = sig
+
+    if cache:
+        try:
+            tmp = sidecar + '.{}.tmp.npz'.format(os.getpid())
+            np.savez(tmp, **out)
+            os.replace(tmp, sidecar)
+        except OSError as e:
+            logger.warning('could not save {}: {}\n'.format(sidecar, e))
+
+    return out
@@ -0,0 +1,92 @@
+"""
+Writer of SCHISM .gr3 files (hgrid.gr3 and node based property files)
+
+"""
+# Copyright 2018 European Union
+# This file is part of pyPoseidon.
+# Licensed under the EUPL, Version 1.2 or – as soon they will be approved by the European Commission - subsequent versions of the EUPL (the "Licence").
+# Unless required by applicable law or agreed to in writing, software distributed under the Licence is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the Licence for the specific language governing permissions and limitations under the Licence.
+
+import numpy as np
+
+
+# rows formatted per write
+CHUNK = 200000
+
+NODE_FMT = '%d\t%.10f\t%.10f\t%.10f'
+
+
+def write_rows(f, fmt, columns, start=1, chunk=CHUNK):
+    """Write numbered rows (from start) of the columns with fmt, chunk rows per write
+    """
+    n = len(columns[0])
+    for i0 in range(0, n, chunk):
+        i1 = min(i0 + chunk, n)
+        rows = zip(range(start + i0, start + i1), *[np.asarray(c[i0:i1]).tolist() for c in columns])
+        f.write('\n'.join(map(fmt.__mod__, rows)) + '\n')
+
+
+def write_elements(f, faces, chunk=CHUNK):
+    """Write the element table, faces with start index 0 padded with NaN or negative values
+    """
+    faces = np.asarray(faces)
+    valid = np.isfinite(faces) if faces.dtype.kind == 'f' else np.ones(faces.shape, dtype=bool)
+    valid[valid] = faces[valid] >= 0
+
+    if valid.all(): # one element type
+        nv = faces.shape[1]
+        fmt = '\t'.join(['%d'] * (nv + 2))
+        cols = [np.full(faces.shape[0], nv)] + [faces[:,k].astype(np.int64) + 1 for k in range(nv)]
+        write_rows(f, fmt, cols, chunk=chunk)
+        return
+
+    nv = valid.sum(axis=1)
+    for i0 in range(0, faces.shape[0], chunk):
+        lines = []
+        for i in range(i0, min(i0 + chunk, faces.shape[0])):
+            nodes = faces[i][valid[i]].astype(np.int64) + 1
+            lines.append('{}\t{}\t{}'.format(i + 1, nv[i], '\t'.join(map(str, nodes.tolist()))))
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_boundaries(f, kind, blocks, types=None):
+    """Write the open or land (kind) boundary blocks, lists of node indices with start index 0
+    """
+    blocks = [np.asarray(b, dtype=np.int64) for b in blocks]
+    f.write('{} = Number of {} boundaries\n'.format(len(blocks), kind))
+    f.write('{} = Total number of {} boundary nodes\n'.format(sum(b.size for b in blocks), kind))
+    for i, b in enumerate(blocks):
+        if types is None:
+            f.write('{} = Number of nodes for {} boundary {}\n'.format(b.size, kind, i + 1))
+        else:
+            f.write('{} {} = Number of nodes for {} boundary {}\n'.format(b.size, types[i], kind, i + 1))
+        if b.size:
+            f.write('\n'.join(map(str, (b + 1).tolist())) + '\n')
+
+
+def write(filename, x, y, values, faces=None, nelems=None, opens=None, lands=None, land_types=None, title='uniform.gr3'):
+    """Write a gr3 file.
+
+    Without faces only the node block is written (property files like manning.gr3), with nelems
+    elements declared in the header.
+    """
+    x = np.asarray(x, dtype=float)
+    values = np.broadcast_to(np.asarray(values, dtype=float), x.shape)
+
+    if faces is not None : nelems = len(faces)
+
+    with open(filename, 'w') as f:
+        f.write('\t {}\n'.format(title))
+        f.write('\t {} {}\n'.format(nelems, x.size))
+
+        write_rows(f, NODE_FMT, [x, np.asarray(y, dtype=float), values])
+
+        if faces is not None:
+            write_elements(f, faces)
+
+        if opens is not None:
+            write_boundaries(f, 'open', opens)
+
+        if lands is not None:
+            write_boundaries(f, 'land', lands, types=land_types)
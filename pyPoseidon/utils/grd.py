@@ -0,0 +1,86 @@
+"""
+Reader and writer of Delft3D curvilinear grid (.grd) files
+
+"""
+# Copyright 2018 European Union
+# This file is part of pyPoseidon.
+# Licensed under the EUPL, Version 1.2 or – as soon they will be approved by the European Commission - subsequent versions of the EUPL (the "Licence").
+# Unless required by applicable law or agreed to in writing, software distributed under the Licence is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the Licence for the specific language governing permissions and limitations under the Licence.
+
+import numpy as np
+
+
+# rows formatted per write
+CHUNK = 1000
+
+
+def read_header(f):
+    """Coordinate system, (ni, nj) and the origin line (as strings) from the open file f.
+
+    Comment lines (*) and keyword lines other than the coordinate system (e.g. Missing Value) are skipped.
+    """
+    cs = None
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError('incomplete grd header')
+        if line.startswith('*') or not line.strip() : continue
+        if '=' in line:
+            key, value = line.split('=', 1)
+            if key.strip() == 'Coordinate System' : cs = value.strip()
+            continue
+        break
+
+    ni, nj = [int(v) for v in line.split()[:2]]
+    origin = f.readline().split()
+
+    return cs, ni, nj, origin
+
+
+def read(filename):
+    """Header (coordinate system, alfori, xori, yori) and the (nj, ni) lons, lats arrays of a grd file.
+
+    Rows may wrap over several lines, each row starting with ETA= and its number.
+    """
+    with open(filename, 'r') as f:
+        cs, ni, nj, origin = read_header(f)
+        text = f.read()
+
+    values = np.fromstring(text.replace('ETA=', ' '), dtype=float, sep=' ')
+
+    if values.size != 2 * nj * (ni + 1):
+        raise ValueError('{} : expected {} values for a {}x{} grid, found {}'.format(filename, 2 * nj * (ni + 1), ni, nj, values.size))
+
+    data = values.reshape(2, nj, ni + 1)[:, :, 1:] # drop the row numbers
+
+    alfori, xori, yori = origin[:3]
+
+    return (cs, alfori, xori, yori), data[0], data[1]
+
+
+def to_text(row):
+    # same text as str() of the numpy scalars, the repr of a list of floats is formatted in C
+    if row.dtype == np.float64:
+        return repr(row.tolist())[1:-1].replace(',', '')
+    return ' '.join(map(str, row))
+
+
+def write_rows(f, a, chunk=CHUNK):
+    for i0 in range(0, a.shape[0], chunk):
+        lines = ['ETA=  {} {}\n'.format(i + 1, to_text(a[i])) for i in range(i0, min(i0 + chunk, a.shape[0]))]
+        f.write(''.join(lines))
+
+
+def write(filename, lons, lats, cs, xori, yori, alfori):
+    """Write a grd file, one line per row
+    """
+    lons = np.asarray(lons)
+    lats = np.asarray(lats)
+
+    with open(filename, 'w') as f:
+        f.write('Coordinate System= {}\n'.format(cs))
+        f.write('{} {}\n'.format(lons.shape[1], lons.shape[0]))
+        f.write('{} {} {}\n'.format(xori, yori, alfori))
+        write_rows(f, lons)
+        write_rows(f, lats)
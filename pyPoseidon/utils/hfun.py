@@ -1,30 +1,165 @@
-import pandas as pd
-import shapely
+from scipy.spatial import cKDTree
 import numpy as np
 import xarray as xr
-from .limgrad import *
+import dask.array as darr
+import multiprocessing
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import logging
+from pyPoseidon.limgrad import *
+import pyPoseidon.utils.msh as msh
+import pyPoseidon.utils.demtiles as demtiles
 from matplotlib import tri
 
+logger = logging.getLogger('pyPoseidon')
 
-def hfun(dem, path='.', tag='jigsaw', resolution_min=.05, resolution_max=.5, dhdx=.15, imax=100, **kwargs):
-    
-      
-    X, Y = np.meshgrid(dem.Dataset.longitude.values,dem.Dataset.latitude.values)
-    V = dem.Dataset.values
-    
-    #scale
-    hmin = resolution_min                       # min. H(X) [deg.]
-    hmax = resolution_max                       # max. H(X)
+# cells per side of the blocks of tiled()
+TILE = 2048
 
+# lattice points per KD-tree query of coast_distance()
+QUERY = 1000000
+
+# sizing criteria passed to scale()
+CRITERIA = ['coastlines', 'coast_resolution', 'coast_dhdx', 'slope_ratio']
+
+
+def scale(V, hmin, hmax, lon=None, lat=None, dhdx=.15, **kwargs):
+    """Size scaled with sqrt(depth) within [hmin, hmax], V (lat, lon) is changed.
+
+    Optional criteria, the smallest size is kept before the clamp:
+      coastlines : GeoDataFrame, size coast_resolution (hmin) at the coast growing with coast_dhdx (dhdx) times the distance
+      slope_ratio : size |H| / (slope_ratio * |grad H|), slope_ratio cells per bathymetric length scale
+    Sizes and distances are in degrees, as the lon, lat axes.
+    """
     V[V>0] = 0 #normalize to only negative values
 
     hfun =  np.sqrt(-V)/.5 # scale with sqrt(H)
+
+    coastlines = kwargs.get('coastlines', None)
+    if coastlines is not None:
+        h0 = kwargs.get('coast_resolution', hmin)
+        dh = kwargs.get('coast_dhdx', dhdx)
+        dist = coast_distance(coastlines, lon, lat, dmax=(hmax - h0) / dh) # farther points are >= hmax
+        hfun = np.minimum(hfun, h0 + dh * dist)
+
+    slope_ratio = kwargs.get('slope_ratio', None)
+    if slope_ratio:
+        hfun = np.minimum(hfun, slope_size(V, lon, lat, slope_ratio))
+
     hfun[hfun < hmin] = hmin
     hfun[hfun > hmax] = hmax
     
+    return hfun
+
+
+def lines(geometry):
+    # coordinates (n, 2) of the lines of the (multi) polygons and lines
+    if geometry is None or geometry.is_empty : return []
+    if hasattr(geometry, 'geoms'):
+        return [c for g in geometry.geoms for c in lines(g)]
+    if geometry.geom_type == 'Polygon':
+        return lines(geometry.exterior) + [c for r in geometry.interiors for c in lines(r)]
+    return [np.asarray(geometry.coords)[:, :2]]
+
+
+def densify(coords, ds):
+    """Points along the line coords (n, 2), at most ds apart
+    """
+    coords = np.asarray(coords, dtype=float)
+    if coords.shape[0] < 2 : return coords
+    d = np.diff(coords, axis=0)
+    n = np.maximum(np.ceil(np.hypot(d[:, 0], d[:, 1]) / ds), 1).astype(int) # points per segment
+    seg = np.repeat(np.arange(n.size), n)
+    t = (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)) / n[seg]
+    return np.vstack([coords[:-1][seg] + t[:, None] * d[seg], coords[-1:]])
+
+
+def coast_points(coastlines, ds, bbox=None):
+    """Vertices of the coastlines (GeoDataFrame), at most ds apart, within bbox (lon_min, lat_min, lon_max, lat_max) if given
+    """
+    coords = [c for g in coastlines.geometry for c in lines(g)]
+
+    if bbox is not None:
+        x0, y0, x1, y1 = bbox
+        coords = [c for c in coords if c[:, 0].max() >= x0 and c[:, 0].min() <= x1 and c[:, 1].max() >= y0 and c[:, 1].min() <= y1]
+
+    if not coords : return np.empty((0, 2))
+    points = np.vstack([densify(c, ds) for c in coords])
+
+    if bbox is not None:
+        points = points[(points[:, 0] >= x0) & (points[:, 0] <= x1) & (points[:, 1] >= y0) & (points[:, 1] <= y1)]
+
+    return points
+
+
+def coast_distance(coastlines, lon, lat, dmax=np.inf):
+    """Distance (lat, lon) of the lattice points to the coastlines, inf from dmax on.
+
+    The distance is the one to the nearest vertex of the coastlines, densified to the smallest
+    spacing of the axes and indexed with a KD-tree. Only the vertices within dmax of the lattice are used.
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    ds = min(spacing(lon).min(initial=np.inf), spacing(lat).min(initial=np.inf))
+    if not np.isfinite(ds) : ds = 1.
+
+    bbox = None
+    if np.isfinite(dmax):
+        bbox = (lon.min() - dmax, lat.min() - dmax, lon.max() + dmax, lat.max() + dmax)
+
+    points = coast_points(coastlines, ds, bbox)
+    if points.shape[0] == 0 : return np.full((lat.size, lon.size), np.inf)
+
+    tree = cKDTree(points)
+    dist = np.empty((lat.size, lon.size))
+    rows = max(1, QUERY // max(lon.size, 1))
+    for j0 in range(0, lat.size, rows): # bounded memory of the queries
+        x, y = np.meshgrid(lon, lat[j0:j0 + rows])
+        dist[j0:j0 + rows] = tree.query(np.column_stack([x.ravel(), y.ravel()]), distance_upper_bound=dmax)[0].reshape(x.shape)
+
+    return dist
+
+
+def slope_size(V, lon, lat, slope_ratio):
+    """Size |H| / (slope_ratio * |grad H|) of the depths V (lat, lon), inf on land and flat bottom
+    """
+    gy, gx = np.gradient(V, lat, lon) if len(lat) > 1 and len(lon) > 1 else (np.zeros(V.shape), np.zeros(V.shape))
+    grad = np.hypot(gx, gy)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        size = np.where((V < 0) & (grad > 0), -V / (slope_ratio * grad), np.inf)
+    return size
+
+
+def hfun(dem, path='.', tag='jigsaw', resolution_min=.05, resolution_max=.5, dhdx=.15, imax=100, **kwargs):
+    """Mesh size function of the dem, scaled with sqrt(depth) and gradient limited.
+
+    The sizing criteria of scale() (coastlines, slope_ratio) are taken from kwargs.
+
+    method='raster' limits the gradient on the lattice of the dem (8-neighbourhood) instead of
+    a triangulation of its points. With to_msh=True the result is also written as the JIGSAW
+    hfun file path/tag-hfun.msh.
+    """
+    method = kwargs.get('method', 'triangulation')
+    
+    lon = dem.Dataset.longitude.values
+    lat = dem.Dataset.latitude.values
+    V = dem.Dataset.elevation.values.copy() # keep the dem
+    
+    hmin = resolution_min                       # min. H(X) [deg.]
+    hmax = resolution_max                       # max. H(X)
+
+    hfun = scale(V, hmin, hmax, lon, lat, dhdx, **kwargs)
+    
+    if method == 'raster':
+        cfun, flag, stats = limgrad_grid(hfun, lon, lat, dhdx, imax)
+        if not flag : logger.warning('hfun : gradient limiting not converged in {} passes\n'.format(imax))
+        return output(cfun, lon, lat, path, tag, **kwargs)
+    
+    X, Y = np.meshgrid(lon, lat)
+    
     hfun = hfun.flatten() # make it 1-d
     
-    hfun = np.array([[hf] for hf in list(hfun)]) #convert it to the appropriate format for LIMHFN2 below
+    hfun = hfun.reshape(-1, 1) #convert it to the appropriate format for LIMHFN2 below
     
     #triangulate
     points = np.column_stack([X.flatten(),Y.flatten()])
@@ -33,18 +168,122 @@ def hfun(dem, path='.', tag='jigsaw', resolution_min=.05, resolution_max=.5, dhd
 #    tri3 = triang.triangles
     edges = triang.edges
     #edge lengths
-    elen = [shapely.geometry.LineString(points[edge]).length for edge in edges]
+    elen = np.hypot(*(points[edges[:,1]] - points[edges[:,0]]).T)
     
     [fun,flag] = limgrad2(edges,elen,hfun,dhdx,imax)
+    if not flag : logger.warning('hfun : gradient limiting not converged in {} passes\n'.format(imax))
 
-    cfun = fun.flatten().reshape(X.shape).T
+    cfun = fun.reshape(X.shape)
 
-    ##OUTPUT
-    
-    dh = xr.Dataset({'z': (['longitude', 'latitude'], cfun)},
-                coords={'longitude': ('longitude', dem.Dataset.longitude.values),
-                        'latitude': ('latitude', dem.Dataset.latitude.values)})
+    return output(cfun, lon, lat, path, tag, **kwargs)
+
+
+def output(cfun, lon, lat, path='.', tag='jigsaw', **kwargs):
+    # hfun Dataset (longitude, latitude) of the (lat, lon) values, optionally written for JIGSAW
+    if kwargs.get('to_msh', False):
+        msh.write_grid(path + '/' + tag + '-hfun.msh', lon, lat, cfun)
     
+    dh = xr.Dataset({'z': (['longitude', 'latitude'], cfun.T)},
+                coords={'longitude': ('longitude', lon),
+                        'latitude': ('latitude', lat)})
     
     return dh
-             
+
+
+def window(lon, lat, lon_min=None, lon_max=None, lat_min=None, lat_max=None):
+    """Slices (latitude, longitude) of the axes lon, lat within the bounds (all if None)
+    """
+    def bounds(a, vmin, vmax):
+        inside = np.ones(a.size, dtype=bool)
+        if vmin is not None : inside &= a >= vmin
+        if vmax is not None : inside &= a <= vmax
+        idx = np.flatnonzero(inside)
+        if idx.size == 0 : raise ValueError('empty window [{}, {}]'.format(vmin, vmax))
+        return slice(idx[0], idx[-1] + 1)
+
+    return bounds(np.asarray(lat), lat_min, lat_max), bounds(np.asarray(lon), lon_min, lon_max)
+
+
+def halo(lon, lat, resolution_min, resolution_max, dhdx):
+    """Cells around a block beyond which no value can change the limited function of the block.
+
+    The values are within [resolution_min, resolution_max] and grow at most by dhdx times the
+    distance, which is at least the smallest spacing per cell.
+    """
+    ds = min(spacing(lon).min(initial=np.inf), spacing(lat).min(initial=np.inf))
+    return int(np.ceil((resolution_max - resolution_min) / (dhdx * ds))) + 1
+
+
+def tiled(source, store, lon_min=None, lon_max=None, lat_min=None, lat_max=None, resolution_min=.05, resolution_max=.5, dhdx=.15, imax=100, **kwargs):
+    """Mesh size function of a large DEM, computed as hfun(method='raster') block by block.
+
+    source is a DEM (netCDF, OPeNDAP), its variable and lat/lon coordinates are renamed as in
+    dem.dem_ (e.g. z, lat, lon of srtm15plus). Every block of tile x tile
+    cells is read with a halo wide enough for the gradient limit, so that the result is the same
+    as for the whole window, and written to the Zarr store (chunks of one block), in parallel
+    over ncores processes. Only the blocks in process are in memory. The sizing criteria of
+    scale() (coastlines, slope_ratio) are taken from kwargs.
+
+    Returns the store opened lazily, to be passed as hfun to jigsaw.
+    """
+    if importlib.util.find_spec('zarr') is None:
+        raise ImportError('hfun.tiled writes a Zarr store, the zarr package is required')
+
+    tile = kwargs.get('tile', TILE)
+    ncores = kwargs.get('ncores', 1)
+
+    with xr.open_dataset(source) as ds:
+        ds = demtiles.rename(ds)
+        lon = ds.longitude.values
+        lat = ds.latitude.values
+
+    jw, iw = window(lon, lat, lon_min, lon_max, lat_min, lat_max)
+    lon, lat = lon[iw], lat[jw]
+
+    nh = halo(lon, lat, resolution_min, resolution_max, dhdx)
+
+    # empty store, the blocks are written in their region
+    z = darr.zeros((lon.size, lat.size), chunks=(tile, tile))
+    xr.Dataset({'z': (['longitude', 'latitude'], z)},
+               coords={'longitude': ('longitude', lon), 'latitude': ('latitude', lat)}).to_zarr(store, mode='w', compute=False)
+
+    blocks = [(j0, i0) for j0 in range(0, lat.size, tile) for i0 in range(0, lon.size, tile)]
+
+    logger.info('hfun : {} blocks of {} cells with a halo of {}\n'.format(len(blocks), tile, nh))
+
+    opts = {'source' : source, 'store' : store, 'offset' : (jw.start, iw.start), 'shape' : (lat.size, lon.size), 'tile' : tile, 'halo' : nh,
+            'resolution_min' : resolution_min, 'resolution_max' : resolution_max, 'dhdx' : dhdx, 'imax' : imax,
+            'criteria' : {k : kwargs[k] for k in CRITERIA if k in kwargs}}
+
+    if ncores > 1 and len(blocks) > 1:
+        ctx = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=ncores, mp_context=ctx) as pool:
+            futures = [pool.submit(block, b, **opts) for b in blocks]
+            for future in as_completed(futures):
+                future.result()
+    else:
+        for b in blocks:
+            block(b, **opts)
+
+    return xr.open_zarr(store)
+
+
+def block(b, source, store, offset, shape, tile, halo, resolution_min, resolution_max, dhdx, imax, criteria):
+    # limited function of the block b = (j0, i0) of the window, written to its region of the store
+    j0, i0 = b
+    j1, i1 = min(j0 + tile, shape[0]), min(i0 + tile, shape[1])
+    ja, ia = max(0, j0 - halo), max(0, i0 - halo)
+    jb, ib = min(shape[0], j1 + halo), min(shape[1], i1 + halo)
+
+    with xr.open_dataset(source) as ds:
+        dem = demtiles.rename(ds).elevation.isel(latitude=slice(offset[0] + ja, offset[0] + jb), longitude=slice(offset[1] + ia, offset[1] + ib))
+        lon, lat, V = dem.longitude.values, dem.latitude.values, dem.values.copy()
+
+    hfun = scale(V, resolution_min, resolution_max, lon, lat, dhdx, **criteria)
+    rfun, flag, stats = limgrad_grid(hfun, lon, lat, dhdx, imax)
+    if not flag : logger.warning('hfun : block {} not converged in {} passes\n'.format(b, imax))
+
+    cfun = rfun[j0 - ja:j1 - ja, i0 - ia:i1 - ia]
+    xr.Dataset({'z': (['longitude', 'latitude'], cfun.T)}).to_zarr(store, region={'longitude' : slice(i0, i1), 'latitude' : slice(j0, j1)})
+
+    return b
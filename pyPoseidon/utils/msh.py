@@ -0,0 +1,135 @@
+"""
+Reader and writer of JIGSAW .msh files (POINT, EDGE2, TRIA3 blocks)
+
+"""
+# Copyright 2018 European Union
+# This file is part of pyPoseidon.
+# Licensed under the EUPL, Version 1.2 or – as soon they will be approved by the European Commission - subsequent versions of the EUPL (the "Licence").
+# Unless required by applicable law or agreed to in writing, software distributed under the Licence is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the Licence for the specific language governing permissions and limitations under the Licence.
+
+import numpy as np
+import itertools
+
+import pyPoseidon.utils.parse as parse
+
+
+# mesh and grid blocks and their type
+BLOCKS = {'POINT' : float, 'EDGE2' : int, 'TRIA3' : int, 'QUAD4' : int, 'COORD' : float, 'VALUE' : float}
+
+# rows formatted per write
+CHUNK = 200000
+
+
+def read(filename):
+    """Header entries {keyword : value} and blocks {keyword : 2-D array} of a msh file.
+
+    The columns of the blocks are the ones in the file (coordinates or node indices, then the tag).
+    The axes of grid files are returned as COORD1, COORD2.
+    """
+    header = {}
+    blocks = {}
+
+    with open(filename, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line : continue
+
+            key, value = [s.strip() for s in line.split('=', 1)]
+            key = key.upper()
+
+            if key not in BLOCKS:
+                header[key] = value
+                continue
+
+            if key == 'COORD':
+                axis, value = value.split(';', 1)
+                key = key + axis.strip()
+
+            n = int(value.split(';')[0])
+            rows = [l.replace(';', ' ') for l in itertools.islice(f, n)]
+            if len(rows) != n:
+                raise ValueError('{} : {} block truncated, expected {} rows found {}'.format(filename, key, n, len(rows)))
+
+            blocks[key] = parse.block(rows, dtype=BLOCKS[key[:5]])
+
+    return header, blocks
+
+
+def to_text(column):
+    # same text as str() of the values, formatted in C through the repr of a list
+    column = np.asarray(column)
+    if column.size == 0 : return []
+    if column.dtype.kind in 'fiu':
+        return repr(column.tolist())[1:-1].split(', ')
+    return [str(v) for v in column]
+
+
+def write_block(f, columns, sep=';', chunk=CHUNK):
+    """Write the columns as rows of values separated by sep
+    """
+    n = len(columns[0])
+    for i0 in range(0, n, chunk):
+        cols = [to_text(c[i0:i0 + chunk]) for c in columns]
+        f.write('\n'.join(map(sep.join, zip(*cols))) + '\n')
+
+
+def rings(codes, tags):
+    """Closed edge rings of the lines of the points, the points grouped by line.
+
+    codes : line of every point, each line contiguous
+    tags : tag of every point
+
+    Returns the start and end points (start index 0) and the tag of every edge. An edge takes the
+    tag of its end point when it leaves a water (positive) point for a point with another tag.
+    """
+    codes = np.asarray(codes)
+    tags = np.asarray(tags)
+    n = codes.size
+
+    nxt = np.arange(1, n + 1)
+    last = np.flatnonzero(np.append(codes[1:] != codes[:-1], True)) # last point of every line
+    first = np.append(0, last[:-1] + 1)
+    nxt[last] = first
+
+    tag1 = tags[nxt]
+    que = np.where((tags != tag1) & (tags > 0), tag1, tags)
+
+    return np.arange(n), nxt, que
+
+
+def write(filename, blocks, mshid='2;EUCLIDEAN-MESH', ndims=2):
+    """Write the blocks {keyword : list of columns} (POINT, EDGE2, TRIA3) to a msh file
+    """
+    name = filename.split('/')[-1]
+    with open(filename, 'w') as f:
+        f.write('#{}; created by pyPoseidon\n'.format(name))
+        f.write('MSHID={}\n'.format(mshid))
+        f.write('NDIMS={}\n'.format(ndims))
+        for key in BLOCKS:
+            if key not in blocks : continue
+            columns = blocks[key]
+            f.write('{}={}\n'.format(key, len(columns[0])))
+            write_block(f, columns)
+
+
+def write_grid(filename, x, y, values, mshid='3;EUCLIDEAN-GRID', ndims=2, chunk=CHUNK, align=1):
+    """Write the values (len(y), len(x)) on the axes x, y to a msh grid file (e.g. a JIGSAW hfun).
+
+    The values are written with y varying fastest, a strip of columns at a time so that lazy
+    (dask) values are loaded by parts. The strips are about chunk values wide, in whole multiples
+    of align columns (the column chunks of a store, so that every stored chunk is read once).
+    """
+    nj, ni = values.shape
+    step = max(1, chunk // max(nj * align, 1)) * align
+    name = filename.split('/')[-1]
+    with open(filename, 'w') as f:
+        f.write('#{}; created by pyPoseidon\n'.format(name))
+        f.write('MSHID={}\n'.format(mshid))
+        f.write('NDIMS={}\n'.format(ndims))
+        for k, axis in enumerate([x, y]):
+            f.write('COORD={};{}\n'.format(k + 1, len(axis)))
+            write_block(f, [np.asarray(axis, dtype=float)])
+        f.write('VALUE={};1\n'.format(nj * ni))
+        for i0 in range(0, ni, step):
+            write_block(f, [np.asarray(values[:, i0:i0 + step]).T.ravel()])
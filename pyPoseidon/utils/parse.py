@@ -0,0 +1,32 @@
+"""
+Bulk parsing of numeric text blocks
+
+"""
+# Copyright 2018 European Union
+# This file is part of pyPoseidon.
+# Licensed under the EUPL, Version 1.2 or – as soon they will be approved by the European Commission - subsequent versions of the EUPL (the "Licence").
+# Unless required by applicable law or agreed to in writing, software distributed under the Licence is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the Licence for the specific language governing permissions and limitations under the Licence.
+
+import numpy as np
+
+
+# numpy >= 1.23 parses text in C, older versions are faster with a bulk fromstring
+FAST_LOADTXT = tuple(int(x) for x in np.__version__.split('.')[:2]) >= (1, 23)
+
+
+def block(lines, dtype=float):
+    """2-D array of a list of lines with the same number of whitespace separated numbers
+    """
+    if len(lines) == 0:
+        return np.empty((0, 0), dtype=dtype)
+
+    if FAST_LOADTXT:
+        return np.loadtxt(lines, dtype=dtype, ndmin=2)
+
+    ncols = len(lines[0].split())
+    values = np.fromstring(' '.join(lines), dtype=dtype, sep=' ')
+    if values.size != ncols * len(lines):
+        return np.loadtxt(lines, dtype=dtype, ndmin=2) # let numpy report the offending line
+
+    return values.reshape(-1, ncols)
@@ -0,0 +1,87 @@
+"""
+Separable (per axis) operations on rectilinear lon/lat grids
+
+"""
+# Copyright 2018 European Union
+# This file is part of pyPoseidon.
+# Licensed under the EUPL, Version 1.2 or – as soon they will be approved by the European Commission - subsequent versions of the EUPL (the "Licence").
+# Unless required by applicable law or agreed to in writing, software distributed under the Licence is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the Licence for the specific language governing permissions and limitations under the Licence.
+
+import numpy as np
+
+
+# mean earth radius (m)
+R = 6371000.
+
+
+def coordinates(x, y):
+    """2-D (nj, ni) lons, lats of the axes x, y as read only views, without copies
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    return np.broadcast_to(x, (y.size, x.size)), np.broadcast_to(y[:, None], (y.size, x.size))
+
+
+def axes(lons, lats):
+    """1-D axes (x, y) of 2-D lons, lats if the grid is rectilinear, else None
+    """
+    lons = np.asarray(lons)
+    lats = np.asarray(lats)
+
+    if lons.ndim != 2 or lats.shape != lons.shape : return None
+
+    # views made by coordinates()
+    if lons.strides[0] == 0 and lats.strides[1] == 0:
+        return lons[0, :], lats[:, 0]
+
+    if np.ptp(lons, axis=0).any() or np.ptp(lats, axis=1).any() : return None
+
+    return lons[0, :], lats[:, 0]
+
+
+def nearest_index(src, x):
+    """Index of the nearest value of the monotonic axis src for every x
+    """
+    src = np.asarray(src)
+    flip = src.size > 1 and src[0] > src[-1]
+    s = src[::-1] if flip else src
+
+    if s.size == 1 : return np.zeros(np.shape(x), dtype=int)
+
+    i = np.clip(np.searchsorted(s, x), 1, s.size - 1)
+    left = (x - s[i - 1]) < (s[i] - x) if flip else (x - s[i - 1]) <= (s[i] - x) # ties to the first in src
+    i = i - left
+
+    return s.size - 1 - i if flip else i
+
+
+def monotonic(a):
+    a = np.asarray(a)
+    if a.ndim != 1 : return False
+    d = np.diff(a)
+    return bool((d > 0).all() or (d < 0).all())
+
+
+def nearest(values, lon, lat, x, y, radius=50000., fill_value=np.nan):
+    """Nearest neighbour of the (lat, lon) field values on the rectilinear target axes x, y.
+
+    The nearest source row and column are found per axis, so only (len(y), len(x)) indices
+    are computed instead of a KD-tree of all the points. Target points farther than
+    radius (m) from their source point get fill_value.
+    """
+    ix = nearest_index(lon, x)
+    iy = nearest_index(lat, y)
+
+    out = np.asarray(values)[np.ix_(iy, ix)].astype(float)
+
+    # distance to the source point, only needed if the farthest one may exceed radius
+    dy = np.radians(np.abs(np.asarray(lat)[iy] - y)) * R
+    dx = np.radians(np.abs(np.asarray(lon)[ix] - x)) * R
+
+    if np.hypot(dy.max(), dx.max()) > radius:
+        coslat = np.cos(np.radians(y))
+        far = np.hypot(dy[:, None], dx[None, :] * coslat[:, None]) > radius
+        out[far] = fill_value
+
+    return out
@@ -0,0 +1,124 @@
+"""
+Reader of the SCHISM station output files (outputs/staout_*)
+
+"""
+# Copyright 2018 European Union
+# This file is part of pyPoseidon.
+# Licensed under the EUPL, Version 1.2 or – as soon they will be approved by the European Commission - subsequent versions of the EUPL (the "Licence").
+# Unless required by applicable law or agreed to in writing, software distributed under the Licence is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the Licence for the specific language governing permissions and limitations under the Licence.
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import warnings
+import tempfile
+import os
+import logging
+
+from pyPoseidon.utils.parse import FAST_LOADTXT
+
+logger = logging.getLogger('pyPoseidon')
+
+
+# order of the station.in flags and of the staout_1 ... staout_9 files
+VARIABLES = ['elev', 'air_pressure', 'windx', 'windy', 'T', 'S', 'u', 'v', 'w']
+
+
+def parse(filename):
+    """Bulk parse of a staout file into a (time, 1 + stations) array, the time first
+    """
+    if FAST_LOADTXT:
+        return np.loadtxt(filename, ndmin=2)
+
+    with open(filename, 'r') as f:
+        first = f.readline()
+        ncols = len(first.split())
+        text = first + f.read()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning) # raised on unparsable entries
+        try:
+            values = np.fromstring(text, dtype=float, sep=' ')
+        except DeprecationWarning:
+            values = None
+
+    if values is None or ncols == 0 or values.size % ncols:
+        return np.loadtxt(filename, ndmin=2) # let numpy report the offending line
+
+    return values.reshape(-1, ncols)
+
+
+def read(filename, cache=True):
+    """Array of a staout file.
+
+    With cache, the parsed array is kept in a .npy file next to it and memory mapped
+    on the next calls, as long as it is newer than the text file.
+    """
+    npy = filename + '.npy'
+
+    if cache and os.path.exists(npy) and os.path.getmtime(npy) >= os.path.getmtime(filename):
+        try:
+            return np.load(npy, mmap_mode='r')
+        except ValueError:
+            pass
+
+    values = parse(filename)
+
+    if cache:
+        tmp = None
+        try:
+            # unique temporary file, concurrent readers do not share it
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(npy) or '.', prefix=os.path.basename(npy) + '.', suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, values)
+            os.replace(tmp, npy)
+        except OSError as e:
+            logger.warning('staout cache not saved: {}\n'.format(e))
+            if tmp and os.path.exists(tmp) : os.remove(tmp)
+
+    return values
+
+
+def read_stations(filename):
+    """Flags and stations (x, y, z, index starting at 1) of a station.in file
+    """
+    with open(filename, 'r') as f:
+        lines = [l for l in f.read().splitlines() if l.strip()]
+
+    flags = np.fromstring(lines[0], dtype=int, sep=' ')[:len(VARIABLES)]
+    n = int(lines[1].split()[0])
+    st = np.fromstring(' '.join(lines[2:2+n]), dtype=float, sep=' ').reshape(n, -1)
+
+    stations = pd.DataFrame(st[:,1:4], index=st[:,0].astype(int), columns=['SCHISM_hgrid_node_x', 'SCHISM_hgrid_node_y', 'z'])
+
+    return flags, stations
+
+
+def dataset(path, start_date, cache=True):
+    """(time, point) Dataset of the active station outputs in path, with the station coordinates
+    """
+    flags, stations = read_stations(os.path.join(path, 'station.in'))
+
+    data = {}
+    time = None
+    for i, (flag, var) in enumerate(zip(flags, VARIABLES)):
+        if flag != 1 : continue
+
+        values = read(os.path.join(path, 'outputs', 'staout_{}'.format(i + 1)), cache=cache)
+
+        if time is None:
+            time = pd.to_datetime(start_date) + pd.to_timedelta(np.asarray(values[:,0]), unit='s')
+
+        data[var] = (['time', 'point'], np.asarray(values[:,1:]))
+
+    if time is None : return xr.Dataset()
+
+    npoints = next(iter(data.values()))[1].shape[1]
+    coords = {'time' : time, 'point' : np.arange(1, npoints + 1)}
+
+    if stations.shape[0] == npoints:
+        for c in stations.columns:
+            coords[c] = ('point', stations[c].values)
+
+    return xr.Dataset(data, coords=coords)
@@ -0,0 +1,203 @@
+"""
+Array based topology of triangular meshes
+
+"""
+# Copyright 2018 European Union
+# This file is part of pyPoseidon.
+# Licensed under the EUPL, Version 1.2 or – as soon they will be approved by the European Commission - subsequent versions of the EUPL (the "Licence").
+# Unless required by applicable law or agreed to in writing, software distributed under the Licence is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the Licence for the specific language governing permissions and limitations under the Licence.
+
+import numpy as np
+import xarray as xr
+
+
+def edges(faces):
+    """Unique edges of a triangulation.
+
+    The sides [b,c], [c,a], [a,b] of every face are visited in turn and each edge is kept
+    once, in the order and orientation of its first appearance.
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+
+    e = np.stack([faces[:,[1,2]], faces[:,[2,0]], faces[:,[0,1]]], axis=1).reshape(-1,2)
+
+    # sorted pair as a single integer key
+    n = e.max() + 1 if e.size else 1
+    key = np.minimum(e[:,0], e[:,1]) * n + np.maximum(e[:,0], e[:,1])
+
+    _, idx = np.unique(key, return_index=True)
+
+    return e[np.sort(idx)]
+
+
+def csr(rows, cols, n):
+    """Compressed sparse rows (indptr, indices) of the pairs (rows, cols) with n rows
+    """
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, np.asarray(cols)[order]
+
+
+def node_elements(faces, n):
+    """CSR node to element adjacency
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    return csr(faces.ravel(), np.repeat(np.arange(faces.shape[0]), faces.shape[1]), n)
+
+
+def node_nodes(edges, n):
+    """CSR node to node adjacency
+    """
+    edges = np.asarray(edges, dtype=np.int64)
+    return csr(np.concatenate([edges[:,0], edges[:,1]]), np.concatenate([edges[:,1], edges[:,0]]), n)
+
+
+def areas(x, y, faces):
+    """Areas of the triangles (in the units of x, y)
+    """
+    a, b, c = faces[:,0], faces[:,1], faces[:,2]
+    return 0.5 * np.abs((x[b] - x[a]) * (y[c] - y[a]) - (x[c] - x[a]) * (y[b] - y[a]))
+
+
+def boundary_edges(faces):
+    """Directed edges (in the orientation of their face) that belong to a single face
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    e = np.stack([faces, np.roll(faces, -1, axis=1)], axis=2).reshape(-1, 2)
+    n = e.max() + 1 if e.size else 1
+    key = np.minimum(e[:,0], e[:,1]) * n + np.maximum(e[:,0], e[:,1])
+    _, inverse, counts = np.unique(key, return_inverse=True, return_counts=True)
+    return e[counts[inverse] == 1]
+
+
+def boundary_loops(faces):
+    """Closed loops of boundary nodes, each an array that starts and ends at the same node
+    """
+    be = boundary_edges(faces)
+    if be.size == 0 : return []
+
+    order = np.argsort(be[:,0], kind='stable')
+    be = be[order]
+    starts = be[:,0]
+    used = np.zeros(be.shape[0], dtype=bool)
+
+    loops = []
+    for e0 in range(be.shape[0]):
+        if used[e0] : continue
+        loop = [be[e0,0]]
+        e = e0
+        while not used[e]:
+            used[e] = True
+            node = be[e,1]
+            loop.append(node)
+            # next unused edge out of node (more than one at pinch nodes)
+            i0, i1 = np.searchsorted(starts, [node, node + 1])
+            free = np.flatnonzero(~used[i0:i1])
+            if free.size == 0 : break
+            e = i0 + free[0]
+        loops.append(np.array(loop))
+
+    return loops
+
+
+def chains(pairs):
+    """Ordered node sequences of the lines made by the (undirected) edges pairs.
+
+    Every connected piece gives one sequence, from its end with the smaller node (or from the
+    smaller node of a closed loop, towards its smaller neighbour, without repeating it at the end).
+    The pieces are ordered by their first node.
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    if pairs.size == 0 : return []
+
+    nodes, local = np.unique(pairs, return_inverse=True)
+    local = local.reshape(-1, 2)
+    n = nodes.size
+
+    indptr, indices = csr(np.concatenate([local[:,0], local[:,1]]), np.concatenate([local[:,1], local[:,0]]), n)
+    degree = np.diff(indptr)
+
+    # plain lists, the walk is one step per node
+    ptr = indptr.tolist()
+    nbr = indices.tolist()
+    visited = [False] * n
+    out = []
+    # ends of the open lines first, then what is left is closed loops
+    for start in np.concatenate([np.flatnonzero(degree == 1), np.arange(n)]).tolist():
+        if visited[start] : continue
+        seq = [start]
+        visited[start] = True
+        node = start
+        while True:
+            free = [k for k in nbr[ptr[node]:ptr[node+1]] if not visited[k]]
+            if not free : break
+            node = min(free)
+            visited[node] = True
+            seq.append(node)
+        out.append(nodes[np.array(seq)])
+
+    return sorted(out, key=lambda s: s[0])
+
+
+@xr.register_dataset_accessor('mesh')
+class mesh_accessor():
+    """Topology of a tri2d grid Dataset (ds.mesh), computed on first use and kept with the Dataset.
+
+    All node and element indices start from 0.
+    """
+    def __init__(self, ds):
+        self._ds = ds
+        self._cache = {}
+
+    def _get(self, key, func):
+        if key not in self._cache:
+            self._cache[key] = func()
+        return self._cache[key]
+
+    @property
+    def x(self):
+        return self._ds.SCHISM_hgrid_node_x.values
+
+    @property
+    def y(self):
+        return self._ds.SCHISM_hgrid_node_y.values
+
+    @property
+    def nnodes(self):
+        return self.x.size
+
+    @property
+    def faces(self):
+        return self._get('faces', lambda: self._ds.SCHISM_hgrid_face_nodes.values.astype(np.int64))
+
+    @property
+    def edges(self):
+        return self._get('edges', lambda: edges(self.faces))
+
+    @property
+    def node_elements(self):
+        """(indptr, indices): the elements of node i are indices[indptr[i]:indptr[i+1]]"""
+        return self._get('node_elements', lambda: node_elements(self.faces, self.nnodes))
+
+    @property
+    def node_nodes(self):
+        """(indptr, indices): the neighbours of node i are indices[indptr[i]:indptr[i+1]]"""
+        return self._get('node_nodes', lambda: node_nodes(self.edges, self.nnodes))
+
+    @property
+    def areas(self):
+        return self._get('areas', lambda: areas(self.x, self.y, self.faces))
+
+    @property
+    def centroids(self):
+        return self._get('centroids', lambda: np.column_stack([self.x[self.faces].mean(axis=1), self.y[self.faces].mean(axis=1)]))
+
+    @property
+    def boundary_edges(self):
+        return self._get('boundary_edges', lambda: boundary_edges(self.faces))
+
+    @property
+    def boundary_loops(self):
+        return self._get('boundary_loops', lambda: boundary_loops(self.faces))
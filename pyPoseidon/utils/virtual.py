@@ -0,0 +1,145 @@
+"""
+Lazy global view of the per core SCHISM output files
+
+"""
+# Copyright 2018 European Union
+# This file is part of pyPoseidon.
+# Licensed under the EUPL, Version 1.2 or – as soon they will be approved by the European Commission - subsequent versions of the EUPL (the "Licence").
+# Unless required by applicable law or agreed to in writing, software distributed under the Licence is distributed on an "AS IS" basis, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the Licence for the specific language governing permissions and limitations under the Licence.
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+import dask
+import dask.array as darr
+import glob
+import logging
+
+logger = logging.getLogger('pyPoseidon')
+
+
+# location dimensions of the output files
+LOC_DIMS = {'nSCHISM_hgrid_node' : 'node', 'nSCHISM_hgrid_face' : 'elem', 'nSCHISM_hgrid_edge' : 'side'}
+
+# global points per chunk
+POINTS = 100000
+
+
+def owners(sindex):
+    """Core and local position (start index 0) of every global point of a location type
+    """
+    rank = np.empty(sindex['size'], dtype=int)
+    local = np.empty(sindex['size'], dtype=int)
+    offsets = sindex['offsets']
+    for i in range(offsets.size - 1):
+        i0, i1 = offsets[i], offsets[i+1]
+        rank[sindex['dst'][i0:i1]] = i
+        local[sindex['dst'][i0:i1]] = sindex['src'][i0:i1]
+    return rank, local
+
+
+def plan(rank, local, b0, b1):
+    """Cores and positions needed for the global points b0:b1.
+
+    Returns [(core, local positions, positions in the block)], the local positions sorted.
+    """
+    r = rank[b0:b1]
+    pieces = []
+    for i in np.unique(r):
+        dst = np.flatnonzero(r == i)
+        src = local[b0:b1][dst]
+        order = np.argsort(src)
+        pieces.append((i, src[order], dst[order]))
+    return pieces
+
+
+def read_block(files, var, axis, pieces, shape, dtype):
+    # only the cores holding the block are opened, and only the points needed are read
+    out = np.empty(shape, dtype=dtype)
+    lead = (slice(None),) * axis
+    for i, src, dst in pieces:
+        with xr.open_dataset(files[i], decode_times=False, cache=False) as ds:
+            v = ds[var]
+            out[lead + (dst,)] = v[{v.dims[axis] : src}].values
+    return out
+
+
+def read_var(filename, var):
+    with xr.open_dataset(filename, decode_times=False, cache=False) as ds:
+        return ds[var].values
+
+
+def stack_files(path):
+    """Per core output files of every stack {stack : sorted files}
+    """
+    hfiles = glob.glob(path + 'outputs/schout_*_*.nc')
+    stacks = {}
+    for f in hfiles:
+        stacks.setdefault(int(f.split('_')[-1].split('.')[0]), []).append(f)
+    return {val : sorted(stacks[val]) for val in sorted(stacks)}
+
+
+def dataset(path, sindex, sdate=None, points=POINTS, drop=()):
+    """Lazy (dask) Dataset on the global mesh over all output stacks in path/outputs.
+
+    Chunks span one stack in time and points global entries per location type, so that
+    a selection only reads the core files (and points) it covers. Variables without time
+    are taken from the first stack. Variables in drop are skipped.
+    """
+
+    stacks = stack_files(path)
+    if not stacks : return xr.Dataset()
+
+    nranks = sindex['node']['offsets'].size - 1
+    stacks = {val : files for val, files in stacks.items() if len(files) == nranks}
+
+    owner = {loc : owners(sindex[loc]) for loc in LOC_DIMS.values()}
+
+    # reads of the blocks of points per location type, the same for all variables and stacks
+    plans = {}
+    for loc, (rank, local) in owner.items():
+        plans[loc] = [(b0, min(b0 + points, rank.size), plan(rank, local, b0, min(b0 + points, rank.size))) for b0 in range(0, rank.size, points)]
+
+    times = []
+    for val, files in stacks.items():
+        with xr.open_dataset(files[0], decode_times=False) as ds:
+            times.append(ds.time.values)
+            ref = {k : (v.dims, v.shape, v.dtype, v.attrs) for k, v in ds.data_vars.items()}
+
+    data = {}
+    for var, (dims, shape, dtype, attrs) in ref.items():
+        if var in drop : continue
+
+        timed = 'time' in dims
+        use = stacks if timed else dict(list(stacks.items())[:1])
+
+        locs = [d for d in dims if d in LOC_DIMS]
+        parts = []
+        for k, (val, files) in enumerate(use.items()):
+            vshape = list(shape)
+            if timed : vshape[dims.index('time')] = times[k].size
+
+            if not locs:
+                a = darr.from_delayed(dask.delayed(read_var)(files[0], var), tuple(vshape), dtype=dtype)
+                parts.append(a)
+                continue
+
+            axis = dims.index(locs[0])
+            blocks = []
+            for b0, b1, pieces in plans[LOC_DIMS[locs[0]]]:
+                bshape = list(vshape)
+                bshape[axis] = b1 - b0
+                task = dask.delayed(read_block)(files, var, axis, pieces, tuple(bshape), dtype)
+                blocks.append(darr.from_delayed(task, tuple(bshape), dtype=dtype))
+            parts.append(darr.concatenate(blocks, axis=axis))
+
+        a = darr.concatenate(parts, axis=dims.index('time')) if timed and len(parts) > 1 else parts[0]
+
+        data[var] = xr.Variable(dims, a, attrs=attrs)
+
+    time = np.concatenate(times)
+    if sdate is not None:
+        time = pd.to_datetime(time, unit='s', origin=sdate.tz_convert(None))
+
+    return xr.Dataset(data, coords={'time' : ('time', time)})